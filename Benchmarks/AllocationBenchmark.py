@@ -0,0 +1,219 @@
+############################################################################
+# Module: AllocationBenchmark.py                                           #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Memory benchmark of a webhook request: how much memory each     #
+#          request allocates and then throws away (the garbage it makes),  #
+#          what each request leaves behind, and the resident size of the   #
+#          process (one worker) afterwards. Each scenario posts a          #
+#          testdata/ payload through app.app (Flask's test client) and,    #
+#          to separate the agent's own allocations from Flask's, through   #
+#          Controller.Webhook.handle directly. The stub game server runs   #
+#          in a separate process so that its allocations are not counted:  #
+#                                                                          #
+#          python -m Benchmarks.AllocationBenchmark --requests 500 \       #
+#              --output before.json                                        #
+#          python -m Benchmarks.AllocationBenchmark --compare \            #
+#              before.json after.json                                      #
+#                                                                          #
+#          Requires Python 3.9+ (tracemalloc.reset_peak).                  #
+############################################################################
+
+from __future__ import print_function
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from Benchmarks.WebhookBenchmark import TESTDATA, git_revision, seed_embedded_game
+
+
+SCENARIOS = [
+    ("newgame", "newgame.json"),
+    ("guess", "guess.json"),
+    ("context-guess", "context-guess.json"),
+    ("badmode-newgame", "badmode-newgame.json"),
+    ("slot", "slot.json"),
+]
+"""Benchmark scenarios: (name, payload file in testdata/)"""
+
+LAYERS = ("webhook", "handle")
+"""webhook: the whole request through Flask; handle: the agent's part (Webhook.handle and
+encoding the response)"""
+
+
+def start_stub(latency=0.0):
+    """Start the stub game server in a process of its own; return (process, url)."""
+    process = subprocess.Popen(
+        [sys.executable, "-u", "-m", "Benchmarks.StubGameServer", "--port", "0",
+         "--latency", str(latency)],
+        stdout=subprocess.PIPE,
+        cwd=os.path.dirname(TESTDATA)
+    )
+    line = process.stdout.readline().decode("utf-8")
+    return process, line.strip().rsplit("COWBULL_URL=", 1)[-1]
+
+
+def rss_bytes():
+    """Return the process's resident set size in bytes (0 if it cannot be read)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    try:
+        import resource
+        # The peak, rather than the current, size: in KiB on Linux, bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return 0
+
+
+def request_function(layer, body):
+    """Return a function making one request with body at the given layer."""
+    if layer == "webhook":
+        import app
+        client = app.app.test_client()
+        return lambda: client.post("/", data=body, content_type="application/json").get_data()
+
+    from Controller.Webhook import Webhook
+    return lambda: Webhook.handle(body=body)[0].dumpb()
+
+
+def measure(make_request, requests=500):
+    """
+    Make requests requests, returning per request the memory allocated and freed again (the
+    peak above the memory in use beforehand) and the memory left behind, in bytes.
+    """
+    tracemalloc.start()
+    transient = 0
+    gc.collect()
+    start, _ = tracemalloc.get_traced_memory()
+    for _ in range(requests):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        make_request()
+        _, peak = tracemalloc.get_traced_memory()
+        transient += peak - before
+    gc.collect()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "transient_bytes": transient / float(requests),
+        "retained_bytes": (end - start) / float(requests),
+    }
+
+
+def run(args):
+    stub, url = start_stub(latency=args.latency)
+    os.environ["COWBULL_URL"] = url
+    os.environ["COWBULL_ENGINE"] = args.engine
+    os.environ.setdefault("LOGGING_LEVEL", "40")
+    # Every request repeats the payload's request id; cached, they would all be retries.
+    os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+
+    import app  # noqa: F401 (configures the agent)
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"requests": args.requests, "warmup": args.warmup, "engine": args.engine,
+                     "latency_ms": args.latency},
+        "scenarios": {},
+    }
+
+    try:
+        selected = [s for s in SCENARIOS if not args.scenario or s[0] in args.scenario]
+        for name, filename in selected:
+            with open(os.path.join(TESTDATA, filename), "rb") as f:
+                body = f.read()
+            if args.engine == "embedded":
+                seed_embedded_game(body)
+            for layer in LAYERS:
+                make_request = request_function(layer, body)
+                for _ in range(args.warmup):
+                    make_request()
+                summary = measure(make_request, requests=args.requests)
+                results["scenarios"]["{}/{}".format(name, layer)] = summary
+                print("{:<24} allocated and freed {:>8.1f} KiB/req  left behind {:>8.1f} B/req".format(
+                    "{}/{}".format(name, layer), summary["transient_bytes"] / 1024.0,
+                    summary["retained_bytes"]))
+    finally:
+        stub.terminate()
+
+    gc.collect()
+    results["rss_bytes"] = rss_bytes()
+    print("Resident size after the run: {:.1f} MiB".format(results["rss_bytes"] / 1048576.0))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Results written to {}".format(args.output))
+    return results
+
+
+def compare(baseline_file, candidate_file, threshold=10.0):
+    """
+    Print the change in memory per request per scenario between two result files. Returns the
+    number of regressions, i.e. scenarios allocating more than threshold percent more per request.
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    with open(candidate_file) as f:
+        candidate = json.load(f)
+
+    def change(old, new):
+        return (new - old) / old * 100.0 if old else 0.0
+
+    print("Comparing {} ({}) with {} ({})".format(
+        baseline_file, baseline.get("revision"), candidate_file, candidate.get("revision")))
+
+    regressions = 0
+    for name in sorted(set(baseline["scenarios"]) & set(candidate["scenarios"])):
+        old, new = baseline["scenarios"][name], candidate["scenarios"][name]
+        transient = change(old["transient_bytes"], new["transient_bytes"])
+        regressed = transient > threshold
+        regressions += 1 if regressed else 0
+        print("{:<24} allocated and freed {:>8.1f} -> {:>8.1f} KiB/req ({:>+6.1f}%)  "
+              "left behind {:>8.1f} -> {:>8.1f} B/req{}".format(
+                  name, old["transient_bytes"] / 1024.0, new["transient_bytes"] / 1024.0, transient,
+                  old["retained_bytes"], new["retained_bytes"], "  REGRESSION" if regressed else ""))
+    print("Resident size {:.1f} -> {:.1f} MiB ({:+.1f}%)".format(
+        baseline.get("rss_bytes", 0) / 1048576.0, candidate.get("rss_bytes", 0) / 1048576.0,
+        change(baseline.get("rss_bytes", 0), candidate.get("rss_bytes", 0))))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Webhook memory allocation benchmark")
+    parser.add_argument("--requests", type=int, default=500, help="requests measured per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="requests before measuring")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub game server latency (ms)")
+    parser.add_argument("--scenario", action="append", help="run only the named scenario(s)")
+    parser.add_argument("--engine", choices=("remote", "embedded"), default="remote",
+                        help="play games on the stub game server (remote) or in-process (embedded)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="compare two result files instead of running the benchmark")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percentage increase in memory allocated per request treated as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.threshold) else 0)
+    if not hasattr(tracemalloc, "reset_peak"):
+        parser.error("Python 3.9 or later is required")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
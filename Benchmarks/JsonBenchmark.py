@@ -0,0 +1,85 @@
+############################################################################
+# Module: JsonBenchmark.py                                                 #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Micro-benchmark of each JSON backend supported by               #
+#          Utilities.JsonCodec on every payload in testdata/: decoding     #
+#          the webhook payload, and encoding a game server request and     #
+#          the webhook response envelope:                                  #
+#                                                                          #
+#          python -m Benchmarks.JsonBenchmark --number 20000               #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+import argparse
+import glob
+import os
+import timeit
+
+from Utilities.JsonCodec import JsonCodec
+from Utilities.WebhookResponse import WebhookResponse
+
+
+TESTDATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "testdata")
+
+GUESS_REQUEST = {"key": "9ad78a33-56c9-43cd-81c3-7fe965b11c9c", "digits": [3, 4, 0, 1]}
+"""A game server request (POST game)"""
+
+
+def available_backends():
+    backends = []
+    for name in JsonCodec.BACKENDS:
+        try:
+            JsonCodec.configure(name)
+            backends.append(name)
+        except ImportError:
+            continue
+    return backends
+
+
+def response_envelope(payload):
+    """The webhook response built for a payload (see Controller.Webhook._build_response)."""
+    speech = "You have 1 cows and 1 bulls. 1 is a bull. 2 is a cow. You have 9 goes remaining!"
+    return WebhookResponse(speech=speech, context_out=payload["result"]["contexts"])
+
+
+def run(number=20000):
+    backends = available_backends()
+    print("{:<22} {:>7}  {}".format("payload", "bytes", "  ".join(
+        "{:>22}".format(b) for b in backends)))
+    print("{:<22} {:>7}  {}".format("", "", "  ".join(
+        "{:>6} {:>7} {:>7}".format("loads", "request", "reply") for _ in backends)))
+
+    for filename in sorted(glob.glob(os.path.join(TESTDATA, "*.json"))):
+        with open(filename, "rb") as f:
+            body = f.read()
+
+        timings = []
+        for backend in backends:
+            JsonCodec.configure(backend)
+            payload = JsonCodec.loads(body)
+            envelope = response_envelope(payload) if "result" in payload else None
+            encode = envelope.dumpb if envelope is not None else lambda: JsonCodec.dumpb(payload)
+            timings.append((
+                min(timeit.repeat(lambda: JsonCodec.loads(body), number=number, repeat=3)),
+                min(timeit.repeat(lambda: JsonCodec.dumpb(GUESS_REQUEST), number=number, repeat=3)),
+                min(timeit.repeat(encode, number=number, repeat=3)),
+            ))
+
+        print("{:<22} {:>7}  {}".format(os.path.basename(filename), len(body), "  ".join(
+            "{:>5.1f}u {:>6.2f}u {:>6.1f}u".format(*[t / number * 1e6 for t in timing])
+            for timing in timings)))
+
+    JsonCodec.configure()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON codec micro-benchmark over testdata/")
+    parser.add_argument("--number", type=int, default=20000, help="operations per timing")
+    args = parser.parse_args(argv)
+    run(number=args.number)
+
+
+if __name__ == "__main__":
+    main()
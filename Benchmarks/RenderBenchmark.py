@@ -0,0 +1,86 @@
+############################################################################
+# Module: RenderBenchmark.py                                               #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Micro-benchmark of the rendering of a guess's outcome: the      #
+#          per-digit string building MakeGuess._analyze_result used        #
+#          (reproduced here as legacy_render) against                      #
+#          Utilities.ResponseRenderer, for each game mode:                 #
+#                                                                          #
+#          python -m Benchmarks.RenderBenchmark --number 100000            #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+import argparse
+import random
+import timeit
+
+from Utilities.GameEngine import GameEngine
+from Utilities.ResponseRenderer import ResponseRenderer
+
+
+def legacy_render(analysis, cows, bulls, remaining):
+    """The rendering done by MakeGuess._analyze_result before ResponseRenderer."""
+    message_text = ""
+    for a in analysis:
+        if a["match"]:
+            message_text += "{} is a bull".format(a["digit"])
+        elif a["in_word"]:
+            message_text += "{} is a cow".format(a["digit"])
+        else:
+            message_text += "{} is a miss".format(a["digit"])
+
+        if a["multiple"]:
+            message_text += " and occurs more than once. "
+        else:
+            message_text += ". "
+
+    message_text += "You have {} goes remaining!".format(remaining)
+    return "You have {} cows and {} bulls. {}".format(cows, bulls, message_text)
+
+
+def sample_outcome(digits, seed=0):
+    """Return the outcome of a random guess at a random answer of digits digits."""
+    rng = random.Random(seed)
+    answer = [rng.randint(0, 9) for _ in range(digits)]
+    guess = [rng.randint(0, 9) for _ in range(digits)]
+    analysis = [
+        {"digit": d, "match": answer[i] == d, "in_word": d in answer, "multiple": answer.count(d) > 1}
+        for i, d in enumerate(guess)
+    ]
+    bulls = len([a for a in analysis if a["match"]])
+    cows = len([a for a in analysis if a["in_word"] and not a["match"]])
+    return analysis, cows, bulls
+
+
+def run(number=100000):
+    renderer = ResponseRenderer.for_language("en")
+    for mode in GameEngine.MODES:
+        analysis, cows, bulls = sample_outcome(mode["digits"])
+        legacy = legacy_render(analysis, cows, bulls, 5)
+        rendered = renderer.guess(analysis=analysis, cows=cows, bulls=bulls, remaining=5)
+        if legacy != rendered:
+            raise ValueError("Renderers disagree:\n{}\n{}".format(legacy, rendered))
+
+        legacy_time = min(timeit.repeat(
+            lambda: legacy_render(analysis, cows, bulls, 5), number=number, repeat=3))
+        render_time = min(timeit.repeat(
+            lambda: renderer.guess(analysis=analysis, cows=cows, bulls=bulls, remaining=5),
+            number=number, repeat=3))
+
+        print("{:<8} {} digits  legacy {:>6.2f}us  renderer {:>6.2f}us  ({:+.1f}%)".format(
+            mode["mode"], mode["digits"],
+            legacy_time / number * 1e6, render_time / number * 1e6,
+            (render_time - legacy_time) / legacy_time * 100.0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Guess response rendering micro-benchmark")
+    parser.add_argument("--number", type=int, default=100000, help="renders per timing")
+    args = parser.parse_args(argv)
+    run(number=args.number)
+
+
+if __name__ == "__main__":
+    main()
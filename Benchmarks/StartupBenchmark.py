@@ -0,0 +1,178 @@
+############################################################################
+# Module: StartupBenchmark.py                                              #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Cold start benchmark. Each run starts a new Python process      #
+#          which imports app (timing the import), optionally runs the      #
+#          warmup (Utilities.Warmup), then sends the first and second      #
+#          webhooks (a new game from testdata/) through Flask's test       #
+#          client against the stub game server. The medians over the runs #
+#          are reported with and without the warmup, and written as JSON   #
+#          so that startup regressions can be tracked between versions:    #
+#                                                                          #
+#          python -m Benchmarks.StartupBenchmark --runs 10 --latency 5 \   #
+#              --output before.json                                        #
+#          python -m Benchmarks.StartupBenchmark --compare before.json \   #
+#              after.json                                                  #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from Benchmarks.StubGameServer import StubGameServer
+from Benchmarks.WebhookBenchmark import TESTDATA, git_revision, percentile
+
+
+SCENARIOS = ("cold", "warmup")
+"""Startup scenarios: the first webhook served without, and after, the warmup"""
+
+MEASURES = ("import_ms", "warmup_ms", "first_request_ms", "second_request_ms")
+"""What each run measures (in milliseconds)"""
+
+RESULT_PREFIX = "STARTUP-RESULT "
+"""Marks the line on which a run writes its measurements"""
+
+
+def measure(warmup=False, payload="newgame.json"):
+    """
+    Measure the startup of this process (run in a new process by run_once); COWBULL_URL and
+    the other settings are taken from the environment.
+    """
+    start = time.time()
+    import app
+    measures = {"import_ms": (time.time() - start) * 1000.0, "warmup_ms": 0.0}
+
+    if warmup:
+        from Utilities.Warmup import Warmup
+        start = time.time()
+        Warmup.run()
+        measures["warmup_ms"] = (time.time() - start) * 1000.0
+
+    with open(os.path.join(TESTDATA, payload), "rb") as f:
+        body = f.read()
+    client = app.app.test_client()
+    for name in ("first_request_ms", "second_request_ms"):
+        start = time.time()
+        response = client.post("/", data=body, content_type="application/json")
+        measures[name] = (time.time() - start) * 1000.0
+        if response.status_code != 200:
+            raise IOError("The webhook returned {}".format(response.status_code))
+
+    print(RESULT_PREFIX + json.dumps(measures))
+
+
+def run_once(env, warmup=False):
+    """Start a process which runs measure() and return its measurements."""
+    command = [sys.executable, "-m", "Benchmarks.StartupBenchmark", "--measure"]
+    if warmup:
+        command.append("--with-warmup")
+    output = subprocess.check_output(command, env=env, cwd=os.path.dirname(TESTDATA))
+    for line in output.decode("utf-8").splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise IOError("The benchmark process did not report its measurements")
+
+
+def run(args):
+    stub = StubGameServer(port=args.stub_port, latency=args.latency / 1000.0).start()
+
+    env = dict(os.environ)
+    env["COWBULL_URL"] = stub.url
+    env["COWBULL_ENGINE"] = args.engine
+    env.setdefault("LOGGING_LEVEL", "40")
+    env.pop("WARMUP", None)
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"runs": args.runs, "latency_ms": args.latency, "engine": args.engine},
+        "scenarios": {},
+    }
+
+    for name in SCENARIOS:
+        runs = [run_once(env, warmup=(name == "warmup")) for _ in range(args.runs)]
+        summary = {}
+        for measure_name in MEASURES:
+            samples = [r[measure_name] for r in runs]
+            summary[measure_name] = percentile(samples, 50)
+            summary[measure_name.replace("_ms", "_max_ms")] = max(samples)
+        results["scenarios"][name] = summary
+
+        print("{:<8} import {:>7.1f}ms  warmup {:>7.1f}ms  first request {:>7.1f}ms  "
+              "second request {:>7.1f}ms  (medians of {} runs)".format(
+                  name, summary["import_ms"], summary["warmup_ms"], summary["first_request_ms"],
+                  summary["second_request_ms"], args.runs))
+
+    stub.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Results written to {}".format(args.output))
+    return results
+
+
+def compare(baseline_file, candidate_file, threshold=10.0):
+    """
+    Print the change in each median between two result files. Returns the number of
+    regressions, i.e. scenarios whose import or first request time rose by more than threshold
+    percent.
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    with open(candidate_file) as f:
+        candidate = json.load(f)
+
+    def change(old, new):
+        return (new - old) / old * 100.0 if old else 0.0
+
+    print("Comparing {} ({}) with {} ({})".format(
+        baseline_file, baseline.get("revision"), candidate_file, candidate.get("revision")))
+
+    regressions = 0
+    for name in sorted(set(baseline["scenarios"]) & set(candidate["scenarios"])):
+        old, new = baseline["scenarios"][name], candidate["scenarios"][name]
+        changes = dict((m, change(old[m], new[m])) for m in MEASURES)
+        regressed = changes["import_ms"] > threshold or changes["first_request_ms"] > threshold
+        regressions += 1 if regressed else 0
+        print("{:<8} import {:>+7.1f}%  warmup {:>+7.1f}%  first request {:>+7.1f}%  "
+              "second request {:>+7.1f}%{}".format(
+                  name, changes["import_ms"], changes["warmup_ms"], changes["first_request_ms"],
+                  changes["second_request_ms"], "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agent import time and first request latency benchmark")
+    parser.add_argument("--runs", type=int, default=10, help="processes started per scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub game server latency (ms)")
+    parser.add_argument("--stub-port", type=int, default=0, help="stub game server port (0: any free port)")
+    parser.add_argument("--engine", choices=("remote", "embedded"), default="remote",
+                        help="play games on the stub game server (remote) or in-process (embedded)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percentage change reported as a regression by --compare")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--with-warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        measure(warmup=args.with_warmup)
+    elif args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.threshold) else 0)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+############################################################################
+# Module: StubGameServer.py                                                #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: A local stand-in for the cowbull game server, used by the       #
+#          benchmarks. It implements GET /modes, GET /game?mode= and       #
+#          POST /game with the same JSON structure the agent consumes,     #
+#          and can inject latency and errors. Calls are counted per        #
+#          endpoint so the benchmarks can report upstream calls per        #
+#          action. Run standalone with:                                    #
+#                                                                          #
+#          python -m Benchmarks.StubGameServer --port 8001 --latency 20    #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+
+if sys.version_info[0] == 2:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+
+
+MODES = [
+    {"mode": "Easy", "digits": 3, "guesses_allowed": 15},
+    {"mode": "Normal", "digits": 4, "guesses_allowed": 10},
+    {"mode": "Hard", "digits": 6, "guesses_allowed": 6},
+]
+"""The game modes served by the stub"""
+
+ENDPOINTS = ("modes", "game GET", "game POST")
+"""The names under which upstream calls are counted"""
+
+
+class StubGameServer(ThreadingMixIn, HTTPServer):
+    """
+    A threaded HTTP server implementing the game server contract used by the agent.
+
+    latency: mean delay (in seconds) added to every response.
+    jitter: the delay is drawn uniformly from latency +/- jitter.
+    error_rate: fraction (0.0 - 1.0) of requests answered with a 503.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+        HTTPServer.__init__(self, (host, port), _StubHandler)
+        self.latency = float(latency)
+        self.jitter = float(jitter)
+        self.error_rate = float(error_rate)
+
+        self.games = {}
+        self.calls = dict((endpoint, 0) for endpoint in ENDPOINTS)
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        """The COWBULL_URL template for this server, e.g. http://127.0.0.1:8001/{}"""
+        return "http://{}:{}/{{}}".format(self.server_address[0], self.server_address[1])
+
+    def start(self):
+        """Serve on a background (daemon) thread and return self."""
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-game-server")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def snapshot(self):
+        """Return a copy of the upstream call counters."""
+        with self.lock:
+            return dict(self.calls)
+
+    def count(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] += 1
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+
+    def new_game(self, mode_name="Normal"):
+        mode = [m for m in MODES if m["mode"] == mode_name.capitalize()]
+        if not mode:
+            return None
+        mode = mode[0]
+
+        key = str(uuid.uuid4())
+        game = {
+            "key": key,
+            "answer": [random.randint(0, 9) for _ in range(mode["digits"])],
+            "guesses_made": 0,
+            "status": "playing",
+            "mode": mode,
+        }
+        with self.lock:
+            self.games[key] = game
+        return game
+
+    def guess(self, key, digits):
+        with self.lock:
+            game = self.games.get(key)
+        if game is None:
+            # Payloads replayed from testdata carry keys this server never issued; adopt them
+            # as Normal games which never finish, so the same payload can be sent any number
+            # of times and every guess exercises the full analysis path.
+            game = self.new_game("Normal")
+            with self.lock:
+                game["key"] = key
+                game["endless"] = True
+                self.games[key] = game
+
+        mode = game["mode"]
+        if game["status"] != "playing":
+            raise ValueError("The game has already been {}".format(game["status"]))
+        if len(digits) != mode["digits"]:
+            raise ValueError("The guess must be {} digits; {} were given".format(mode["digits"], len(digits)))
+
+        with self.lock:
+            game["guesses_made"] += 1
+            if game.get("endless") and game["guesses_made"] >= mode["guesses_allowed"]:
+                game["guesses_made"] = 1
+            answer = game["answer"]
+            analysis = []
+            for index, digit in enumerate(digits):
+                analysis.append({
+                    "digit": digit,
+                    "match": answer[index] == digit,
+                    "in_word": digit in answer,
+                    "multiple": answer.count(digit) > 1,
+                })
+            bulls = len([a for a in analysis if a["match"]])
+            cows = len([a for a in analysis if a["in_word"] and not a["match"]])
+
+            if game.get("endless"):
+                message = "Your guess has been analyzed"
+            elif bulls == len(answer):
+                game["status"] = "won"
+                message = "Congratulations, you won!"
+            elif game["guesses_made"] >= mode["guesses_allowed"]:
+                game["status"] = "lost"
+                message = "Sorry, you lost!"
+            else:
+                message = "Your guess has been analyzed"
+
+            return {
+                "game": {
+                    "key": game["key"],
+                    "status": game["status"],
+                    "guesses_made": game["guesses_made"],
+                    "mode": {"mode": mode["mode"], "guesses_allowed": mode["guesses_allowed"],
+                             "digits": mode["digits"]},
+                },
+                "outcome": {
+                    "status": message,
+                    "bulls": bulls,
+                    "cows": cows,
+                    "analysis": analysis,
+                },
+            }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status=200, body=None):
+        data = json.dumps(body or {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject(self, endpoint):
+        self.server.count(endpoint)
+        self.server.delay()
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self._reply(503, {"message": "Injected error", "exception": "ServiceUnavailable"})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") == "/modes":
+            if self._inject("modes"):
+                return
+            self._reply(200, {"modes": MODES})
+        elif url.path.rstrip("/") == "/game":
+            if self._inject("game GET"):
+                return
+            mode = parse_qs(url.query).get("mode", ["Normal"])[0]
+            game = self.server.new_game(mode)
+            if game is None:
+                self._reply(400, {"message": "Unknown mode {}".format(mode), "exception": "ValueError"})
+                return
+            self._reply(200, {
+                "key": game["key"],
+                "digits": game["mode"]["digits"],
+                "guesses": game["mode"]["guesses_allowed"],
+                "served-by": "stub-game-server",
+            })
+        else:
+            self._reply(404, {"message": "Not found", "exception": "NotFound"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b"{}"
+        if urlparse(self.path).path.rstrip("/") != "/game":
+            self._reply(404, {"message": "Not found", "exception": "NotFound"})
+            return
+        if self._inject("game POST"):
+            return
+        try:
+            data = json.loads(body.decode("utf-8"))
+            self._reply(200, self.server.guess(data["key"], [int(d) for d in data["digits"]]))
+        except (KeyError, ValueError, TypeError) as e:
+            self._reply(400, {"message": "Bad guess", "exception": str(e)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the cowbull game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean latency in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency jitter in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    args = parser.parse_args(argv)
+
+    server = StubGameServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency / 1000.0,
+        jitter=args.jitter / 1000.0,
+        error_rate=args.error_rate
+    )
+    print("Stub game server listening; set COWBULL_URL={}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+############################################################################
+# Module: TrafficReplay.py                                                 #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Replays webhook traffic recorded by Utilities.TrafficCapture    #
+#          (CAPTURE_DIR) against the agent, for capacity planning. Each    #
+#          request is sent at the time it was captured, relative to the    #
+#          start of the capture, divided by --speed (1: as captured, 10:   #
+#          ten times as fast). Requests of the same session are sent in    #
+#          order, each after the response to the previous one, as          #
+#          Dialogflow would; sessions run concurrently. The game server is #
+#          the stub (Benchmarks.StubGameServer), which adopts the captured #
+#          game keys. Results are written in the WebhookBenchmark format,  #
+#          so runs can be compared with WebhookBenchmark --compare:        #
+#                                                                          #
+#          python -m Benchmarks.TrafficReplay capture/ --speed 5 \         #
+#              --latency 20 --output replay.json                           #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+import argparse
+import gzip
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+from Benchmarks.StubGameServer import StubGameServer
+from Benchmarks.WebhookBenchmark import HttpTarget, InProcessTarget, git_revision, is_error, \
+    percentile, summarize
+from Utilities.CircuitBreaker import CircuitBreaker
+
+
+def capture_files(paths):
+    """Return the capture files in paths (files, or directories of capture files), in order."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.endswith(".jsonl.gz") or name.endswith(".jsonl")
+            ))
+        else:
+            files.append(path)
+    return files
+
+
+def load(paths):
+    """
+    Read the records in the capture files. A file whose end is missing (e.g. still being
+    written) is read up to the last complete record.
+    :return: list - the records, in the order captured
+    """
+    records = []
+    for filename in capture_files(paths):
+        opener = gzip.open if filename.endswith(".gz") else open
+        try:
+            with opener(filename, "rb") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line.decode("utf-8")))
+                    except ValueError:
+                        break  # a partial last line
+        except (EOFError, IOError) as e:
+            print("{}: read up to {} ({})".format(filename, len(records), e), file=sys.stderr)
+    records.sort(key=lambda record: record["time"])
+    return records
+
+
+def sessions(records, limit=None):
+    """
+    Group records by session. A record without a session is a session of its own.
+    :return: list - each session's records in order, sessions ordered by their first request
+    """
+    grouped = {}
+    order = []
+    for index, record in enumerate(records):
+        key = record.get("session") or "record-{}".format(index)
+        if key not in grouped:
+            grouped[key] = []
+            order.append(key)
+        grouped[key].append(record)
+    result = [grouped[key] for key in order]
+    return result[:limit] if limit else result
+
+
+def request_body(record):
+    request = record["request"]
+    if isinstance(request, dict):
+        return json.dumps(request).encode("utf-8")
+    return (request or "").encode("utf-8")
+
+
+def captured_error(record):
+    """Return True if the captured response reported an error."""
+    response = record.get("response") or {}
+    speech = str(response.get("speech", ""))
+    return record.get("status") != 200 or speech.startswith("400 ") \
+        or speech == CircuitBreaker.UNAVAILABLE_TEXT
+
+
+def replay(target, grouped, speed=1.0):
+    """
+    Send the sessions' requests at their captured times (divided by speed).
+    :return: dict - latencies and lags (seconds), errors, mismatches (requests whose replayed
+             response and captured response disagree on whether it was an error), elapsed
+    """
+    results = {"latencies": [], "lags": [], "errors": 0, "mismatches": 0, "concurrency": 0}
+    lock = threading.Lock()
+    active = [0]
+    origin = min(session[0]["time"] for session in grouped)
+    start = time.time()
+
+    def due(record):
+        return start + (record["time"] - origin) / speed
+
+    def run_session(session):
+        client = target.client()
+        latencies, lags, errors, mismatches = [], [], 0, 0
+        for record in session:
+            wait = due(record) - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            sent = time.time()
+            status, data = target.post(client, request_body(record))
+            latencies.append(time.time() - sent)
+            lags.append(max(sent - due(record), 0.0))
+            error = status != 200 or is_error(data)
+            errors += 1 if error else 0
+            mismatches += 1 if error != captured_error(record) else 0
+        with lock:
+            results["latencies"].extend(latencies)
+            results["lags"].extend(lags)
+            results["errors"] += errors
+            results["mismatches"] += mismatches
+            active[0] -= 1
+
+    threads = []
+    for session in grouped:
+        wait = due(session[0]) - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        thread = threading.Thread(target=run_session, args=(session,))
+        thread.daemon = True
+        with lock:
+            active[0] += 1
+            results["concurrency"] = max(results["concurrency"], active[0])
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    results["elapsed"] = time.time() - start
+    return results
+
+
+def run(args):
+    records = load(args.capture)
+    if not records:
+        print("No captured requests found in {}".format(", ".join(args.capture)))
+        return None
+    grouped = sessions(records, limit=args.sessions)
+    captured_seconds = max(r["time"] for s in grouped for r in s) - min(s[0]["time"] for s in grouped)
+
+    stub = StubGameServer(
+        port=args.stub_port,
+        latency=args.latency / 1000.0,
+        jitter=args.jitter / 1000.0,
+        error_rate=args.error_rate
+    ).start()
+
+    if args.url:
+        print("Stub game server at {}".format(stub.url))
+        target = HttpTarget(args.url)
+    else:
+        os.environ["COWBULL_URL"] = stub.url
+        os.environ["COWBULL_ENGINE"] = "remote"
+        os.environ.setdefault("LOGGING_LEVEL", "40")
+        os.environ.pop("CAPTURE_DIR", None)  # the replay is not itself captured
+        target = InProcessTarget()
+
+    print("Replaying {} request(s) in {} session(s), captured over {:.1f}s, at {}x".format(
+        sum(len(s) for s in grouped), len(grouped), captured_seconds, args.speed))
+    replayed = replay(target, grouped, speed=args.speed)
+    stub.stop()
+
+    summary = summarize(replayed["latencies"], replayed["elapsed"])
+    summary.update({
+        "errors": replayed["errors"],
+        "error_mismatches": replayed["mismatches"],
+        "sessions": len(grouped),
+        "max_concurrent_sessions": replayed["concurrency"],
+        "lag_p95_ms": percentile(replayed["lags"], 95) * 1000.0,
+        "lag_max_ms": max(replayed["lags"]) * 1000.0 if replayed["lags"] else 0.0,
+    })
+    print("{:.1f} req/s  p50 {:.2f}ms  p95 {:.2f}ms  p99 {:.2f}ms  errors {} ({} differ from the "
+          "capture)  schedule lag p95 {:.2f}ms max {:.2f}ms  sessions {} (at most {} at once)".format(
+              summary["requests_per_second"], summary["p50_ms"], summary["p95_ms"],
+              summary["p99_ms"], summary["errors"], summary["error_mismatches"],
+              summary["lag_p95_ms"], summary["lag_max_ms"], summary["sessions"],
+              summary["max_concurrent_sessions"]))
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {
+            "capture": args.capture,
+            "speed": args.speed,
+            "sessions": len(grouped),
+            "latency_ms": args.latency,
+            "jitter_ms": args.jitter,
+            "error_rate": args.error_rate,
+            "target": args.url or "in-process",
+        },
+        "scenarios": {"replay": summary},
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Results written to {}".format(args.output))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured webhook traffic")
+    parser.add_argument("capture", nargs="+", help="capture files, or directories of them (CAPTURE_DIR)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed: 1 as captured, 10 ten times as fast")
+    parser.add_argument("--sessions", type=int, help="replay only the first N sessions")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub game server latency (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="stub game server jitter (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub game server 503 rate")
+    parser.add_argument("--stub-port", type=int, default=0, help="stub game server port (0: any free port)")
+    parser.add_argument("--url", help="replay against a running agent at this URL instead of in-process "
+                                      "(its COWBULL_URL must point at a stub game server)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed must be greater than 0")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+############################################################################
+# Module: WebhookBenchmark.py                                              #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Throughput and latency benchmark for the webhook. It starts     #
+#          the stub game server (Benchmarks.StubGameServer), points        #
+#          COWBULL_URL at it, then drives app.app with the payloads in     #
+#          testdata/ at a configurable concurrency. For each scenario it   #
+#          reports requests/s, p50/p95/p99 latency and upstream calls per  #
+#          request, and writes the results as JSON so that two runs (e.g.  #
+#          two versions of the agent) can be compared:                     #
+#                                                                          #
+#          python -m Benchmarks.WebhookBenchmark --requests 500 \          #
+#              --concurrency 8 --latency 5 --output before.json            #
+#          python -m Benchmarks.WebhookBenchmark --compare before.json \   #
+#              after.json                                                  #
+#                                                                          #
+#          --engine embedded runs the same scenarios against the embedded  #
+#          game engine (Utilities.GameEngine) instead of the stub server.  #
+#                                                                          #
+############################################################################
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+from Benchmarks.StubGameServer import StubGameServer, ENDPOINTS
+from Utilities.CircuitBreaker import CircuitBreaker
+
+
+TESTDATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "testdata")
+
+SCENARIOS = [
+    ("newgame", "newgame.json"),
+    ("hard-newgame", "hard-newgame.json"),
+    ("nomode-newgame", "nomode-newgame.json"),
+    ("badmode-newgame", "badmode-newgame.json"),
+    ("guess", "guess.json"),
+    ("context-guess", "context-guess.json"),
+    ("toomany-guess", "toomany-guess.json"),
+    ("slot", "slot.json"),
+]
+"""Benchmark scenarios: (name, payload file in testdata/)"""
+
+
+def percentile(samples, pct):
+    """Return the pct (0-100) percentile of samples using the nearest-rank method."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = int(round(pct / 100.0 * len(ordered) + 0.5)) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+def summarize(latencies, elapsed):
+    """Summarize a list of latencies (seconds) measured over elapsed seconds."""
+    return {
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000.0,
+        "p95_ms": percentile(latencies, 95) * 1000.0,
+        "p99_ms": percentile(latencies, 99) * 1000.0,
+        "max_ms": max(latencies) * 1000.0 if latencies else 0.0,
+    }
+
+
+class InProcessTarget(object):
+    """Sends payloads to app.app through Flask's test client (no HTTP server)."""
+
+    def __init__(self):
+        import app
+        self.app = app.app
+
+    def client(self):
+        return self.app.test_client()
+
+    @staticmethod
+    def post(client, body):
+        response = client.post("/", data=body, content_type="application/json")
+        return response.status_code, response.get_data()
+
+
+class HttpTarget(object):
+    """Sends payloads to a running agent (e.g. under gunicorn) over HTTP."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def client(self):
+        import requests
+        return requests.Session()
+
+    def post(self, client, body):
+        response = client.post(self.url, data=body, headers={"Content-Type": "application/json"})
+        return response.status_code, response.content
+
+
+def is_error(data):
+    """Return True if a webhook response's speech reports an error (or that the game server
+    isn't available)."""
+    try:
+        speech = json.loads(data.decode("utf-8"))["speech"]
+        return speech.startswith("400 ") or speech == CircuitBreaker.UNAVAILABLE_TEXT
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return True
+
+
+def run_scenario(target, body, requests, concurrency, warmup=0):
+    """
+    Send body requests times, split across concurrency threads. Returns (latencies, errors,
+    elapsed) where errors counts non-200 statuses and responses whose speech is an error.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0)
+                  for i in range(concurrency)]
+
+    def worker(count):
+        client = target.client()
+        for _ in range(warmup):
+            target.post(client, body)
+        local, local_errors = [], 0
+        for _ in range(count):
+            start = time.time()
+            status, data = target.post(client, body)
+            local.append(time.time() - start)
+            if status != 200 or is_error(data):
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in per_thread if n]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0], time.time() - start
+
+
+def seed_embedded_game(body):
+    """
+    Create, in the embedded engine, the game a guess payload refers to. The payloads in
+    testdata/ carry keys the engine never issued; the game is seeded so that the payload's
+    guess never wins or runs out of guesses, and can be replayed any number of times.
+    """
+    from Utilities.GameEngine import GameEngine
+
+    payload = json.loads(body.decode("utf-8"))
+    keys = [c["parameters"]["key"] for c in payload["result"]["contexts"] if c["name"] == "key"]
+    digits = [int(d) for d in payload["result"]["parameters"].get("digitlist", [])]
+    if not keys or not digits:
+        return
+
+    engine = GameEngine.default()
+    mode = dict([m for m in engine.modes()["modes"] if m["mode"] == "Normal"][0])
+    mode["guesses_allowed"] = sys.maxsize
+    engine.store.save(key=keys[0], game={
+        "key": keys[0],
+        "answer": [(digits[i % len(digits)] + 1) % 10 for i in range(mode["digits"])],
+        "status": "playing",
+        "guesses_made": 0,
+        "mode": mode,
+    })
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(TESTDATA)
+        ).decode("utf-8").strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    stub = StubGameServer(
+        port=args.stub_port,
+        latency=args.latency / 1000.0,
+        jitter=args.jitter / 1000.0,
+        error_rate=args.error_rate
+    ).start()
+
+    if args.url:
+        print("Stub game server at {}".format(stub.url))
+        target = HttpTarget(args.url)
+    else:
+        os.environ["COWBULL_URL"] = stub.url
+        os.environ["COWBULL_ENGINE"] = args.engine
+        os.environ.setdefault("LOGGING_LEVEL", "40")
+        # Every request repeats the payload's request id; cached, they would all be retries.
+        os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+        target = InProcessTarget()
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency,
+            "jitter_ms": args.jitter,
+            "error_rate": args.error_rate,
+            "target": args.url or "in-process",
+            "engine": "remote" if args.url else args.engine,
+        },
+        "scenarios": {},
+    }
+
+    selected = [s for s in SCENARIOS if not args.scenario or s[0] in args.scenario]
+    for name, filename in selected:
+        with open(os.path.join(TESTDATA, filename), "rb") as f:
+            body = f.read()
+        if args.engine == "embedded" and not args.url:
+            seed_embedded_game(body)
+
+        before = stub.snapshot()
+        latencies, errors, elapsed = run_scenario(
+            target, body, args.requests, args.concurrency, warmup=args.warmup
+        )
+        after = stub.snapshot()
+
+        upstream_total = args.requests + args.warmup * args.concurrency
+        summary = summarize(latencies, elapsed)
+        summary["errors"] = errors
+        summary["upstream_calls_per_request"] = dict(
+            (endpoint, (after[endpoint] - before[endpoint]) / float(upstream_total))
+            for endpoint in ENDPOINTS
+        )
+        results["scenarios"][name] = summary
+
+        print("{:<16} {:>9.1f} req/s  p50 {:>7.2f}ms  p95 {:>7.2f}ms  p99 {:>7.2f}ms  errors {:>5}  "
+              "upstream/req {}".format(
+                  name, summary["requests_per_second"], summary["p50_ms"], summary["p95_ms"],
+                  summary["p99_ms"], errors,
+                  ", ".join("{} {:.2f}".format(k, v)
+                            for k, v in sorted(summary["upstream_calls_per_request"].items()) if v)
+                  or "none"))
+
+    stub.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Results written to {}".format(args.output))
+    return results
+
+
+def compare(baseline_file, candidate_file, threshold=10.0):
+    """
+    Print the change in throughput and latency per scenario between two result files. Returns
+    the number of regressions, i.e. scenarios whose p95 latency rose or whose throughput fell by
+    more than threshold percent.
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    with open(candidate_file) as f:
+        candidate = json.load(f)
+
+    def change(old, new):
+        return (new - old) / old * 100.0 if old else 0.0
+
+    print("Comparing {} ({}) with {} ({})".format(
+        baseline_file, baseline.get("revision"), candidate_file, candidate.get("revision")))
+
+    regressions = 0
+    for name in sorted(set(baseline["scenarios"]) & set(candidate["scenarios"])):
+        old, new = baseline["scenarios"][name], candidate["scenarios"][name]
+        rps = change(old["requests_per_second"], new["requests_per_second"])
+        p95 = change(old["p95_ms"], new["p95_ms"])
+        regressed = rps < -threshold or p95 > threshold
+        regressions += 1 if regressed else 0
+        print("{:<16} req/s {:>+7.1f}%  p50 {:>+7.1f}%  p95 {:>+7.1f}%  p99 {:>+7.1f}%{}".format(
+            name, rps, change(old["p50_ms"], new["p50_ms"]), p95,
+            change(old["p99_ms"], new["p99_ms"]), "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Webhook throughput and latency benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--warmup", type=int, default=5, help="warmup requests per client")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub game server latency (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="stub game server jitter (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub game server 503 rate")
+    parser.add_argument("--stub-port", type=int, default=0, help="stub game server port (0: any free port)")
+    parser.add_argument("--scenario", action="append", help="run only the named scenario(s)")
+    parser.add_argument("--engine", choices=("remote", "embedded"), default="remote",
+                        help="play games on the stub game server (remote) or in-process (embedded)")
+    parser.add_argument("--url", help="benchmark a running agent at this URL instead of in-process "
+                                      "(its COWBULL_URL must point at a stub game server)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percentage change reported as a regression by --compare")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.threshold) else 0)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
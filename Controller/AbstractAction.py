@@ -10,13 +10,28 @@ class AbstractAction(object):
     Concrete classes must provide implementations of do_action (fulfillment) and do_slot (slot
     filling).
 
-    NOTE: The concrete class MUST be the same name (identical) to the API.ai action; for example,
-    if the action is called NewGame then the class must be called NewGame in a file called NewGame.py.
-    If it is not, then an error will be reported back to the user that the action has not been
+    NOTE: The concrete class MUST have the same name as the API.ai action, ignoring case and any
+    '-', '_', '.' or spaces; for example, the actions NewGame, newgame and new-game are all fulfilled
+    by the class NewGame. Other names can be listed in the class's aliases attribute. Actions are
+    discovered once at startup by Utilities.ActionRegistry from the modules in the Controller package.
+    If no class matches, then an error will be reported back to the user that the action has not been
     implemented.
+
+    NOTE: One instance of each action serves every request, in every thread (see
+    Utilities.ActionRegistry.instance), so an action must keep no per-request state on self;
+    what a request needs is passed to, and returned from, do_action and do_slot. State shared
+    by requests belongs to the class (or a process-wide object) and must be guarded by a lock.
+    Both return a Utilities.ActionResult.
     """
     __metaclass__ = ABCMeta
 
+    aliases = []
+    """Additional API.ai action names fulfilled by the concrete class"""
+
+    starts_game = False
+    """True if fulfilling the action starts a new game. When the agent is overloaded, such
+    requests wait behind the others (see Utilities.AdmissionControl)."""
+
     @abc.abstractmethod
     def __init__(self):
         pass
@@ -0,0 +1,34 @@
+import abc
+from abc import ABCMeta
+
+
+class AbstractAsyncAction(object, metaclass=ABCMeta):
+    """The asyncio counterpart of Controller.AbstractAction, used by the asyncio entry point
+    (async_app.py). do_action and do_slot are coroutines which must return the same result
+    (a Utilities.ActionResult) as the synchronous action of the same name.
+
+    NOTE: Concrete classes live in the Controller.Async package and are discovered, named and
+    shared by requests in the same way as the synchronous actions (see
+    Controller.AbstractAction): an action keeps no per-request state on self.
+    """
+
+    aliases = []
+    """Additional API.ai action names fulfilled by the concrete class"""
+
+    starts_game = False
+    """True if fulfilling the action starts a new game. When the agent is overloaded, such
+    requests wait behind the others (see Utilities.AdmissionControl)."""
+
+    @abc.abstractmethod
+    def __init__(self):
+        pass
+
+    @abc.abstractmethod
+    async def do_action(self, context, parameters):
+        """Action fulfillment"""
+        return
+
+    @abc.abstractmethod
+    async def do_slot(self, context, parameters):
+        """Slot filling"""
+        return
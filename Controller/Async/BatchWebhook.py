@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+
+from aiohttp import web
+
+from Controller.BatchWebhook import BatchWebhook as SyncBatchWebhook
+from Controller.Webhook import Webhook as SyncWebhook
+from Utilities.RequestProfiler import RequestProfiler
+from Utilities.RequestTimer import RequestTimer
+from Utilities.Settings import Settings
+from Utilities.WebhookResponse import WebhookResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWebhook(object):
+    """
+    The asyncio counterpart of Controller.BatchWebhook, handling each request with the async
+    webhook (Controller.Async.Webhook). Sessions run as tasks, at most BATCH_WORKERS at a time
+    across all the batches the process is handling; the requests of a session run in order.
+    """
+
+    def __init__(self, webhook=None):
+        self.webhook = webhook
+        self._slots = None
+
+    async def post(self, request):
+        logger.debug("BatchWebhook (async): Processing POST request")
+        started = time.time()
+        try:
+            items = SyncBatchWebhook.parse_batch(await request.read())
+        except ValueError as e:
+            return web.Response(
+                status=400,
+                body=SyncBatchWebhook.error_object(e).dumpb(),
+                content_type="application/json"
+            )
+
+        # Created here rather than in __init__, so that it belongs to the running event loop.
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(Settings.current().batch_workers)
+
+        results = [None] * len(items)
+        await asyncio.gather(*[self._run_session(items, indexes, results)
+                               for indexes in SyncBatchWebhook.sessions(items)])
+
+        SyncBatchWebhook.record_batch(len(items), started)
+        return web.Response(
+            status=200,
+            body=WebhookResponse.dumpb_all(results),
+            content_type="application/json"
+        )
+
+    async def _run_session(self, items=None, indexes=None, results=None):
+        async with self._slots:
+            for index in indexes:
+                started = time.time()
+                timer = RequestTimer()
+                response_object, action_name, outcome, request_id = await self.webhook.handle(
+                    payload=items[index], timer=timer)
+                timer.lap("respond")
+                SyncWebhook._record_metrics(action_name, outcome, started)
+                RequestProfiler.finish(None, timer, action=action_name, request_id=request_id)
+                results[index] = response_object
@@ -0,0 +1,12 @@
+from Controller.Async.AbstractAsyncAction import AbstractAsyncAction
+
+
+class GiveUp(AbstractAsyncAction):
+    def __init__(self):
+        super(GiveUp, self).__init__()
+
+    async def do_action(self, context, parameters):
+        pass
+
+    async def do_slot(self, context, parameters):
+        pass
@@ -0,0 +1,34 @@
+import logging
+
+from Controller.Async.AbstractAsyncAction import AbstractAsyncAction
+from Controller.MakeGuess import MakeGuess as SyncMakeGuess
+from Utilities.AsyncHttpClient import AsyncHttpClient
+from Utilities.LogPipeline import LogPipeline
+
+
+logger = logging.getLogger(__name__)
+
+
+class MakeGuess(AbstractAsyncAction):
+    def __init__(self):
+        super(MakeGuess, self).__init__()
+
+    async def do_action(self, context=None, parameters=None):
+        logger.debug("MakeGuess (async): In do_action for make guess fulfillment")
+
+        try:
+            user_data = SyncMakeGuess._user_data(context=context, parameters=parameters)
+        except ValueError as ve:
+            return SyncMakeGuess._error_output(error=ve)
+
+        guess_analysis = await AsyncHttpClient.execute_post_request(
+            url=SyncMakeGuess._game_url(context=context),
+            data=user_data
+        )
+        if LogPipeline.sample(logger):
+            logger.debug("Game object returned: %s", guess_analysis)
+
+        return SyncMakeGuess._guess_output(context=context, guess_analysis=guess_analysis)
+
+    async def do_slot(self, context, parameters):
+        pass
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+
+from Controller.Async.AbstractAsyncAction import AbstractAsyncAction
+from Controller.NewGame import NewGame as SyncNewGame
+from Utilities.AsyncFanOut import AsyncFanOut
+from Utilities.AsyncHttpClient import AsyncHttpClient
+from Utilities.BackendRouter import BackendRouter
+from Utilities.ResponseRenderer import ResponseRenderer
+
+
+logger = logging.getLogger(__name__)
+
+
+class NewGame(AbstractAsyncAction):
+    starts_game = True
+
+    _modes_future = None
+    """The in-flight load of the game modes, shared by every coroutine waiting for it"""
+
+    def __init__(self):
+        super(NewGame, self).__init__()
+
+    async def do_action(self, context=None, parameters=None):
+        logger.debug("NewGame (async): In do_action for new game fulfillment")
+
+        if context is None or parameters is None:
+            raise ValueError("Context and/or Parameters must be set")
+
+        mode = parameters["mode"]
+
+        game_object = SyncNewGame._take_pooled_game(mode=mode)
+        if game_object is not None:
+            return SyncNewGame._game_output(game_object=game_object)
+
+        # As in the synchronous NewGame: the modes and the game are fetched together unless
+        # the modes are cached.
+        if SyncNewGame._get_modes_cache().ready():
+            if not SyncNewGame._mode_in(mode=mode, game_modes=await self._fetch_modes()):
+                raise ValueError(ResponseRenderer.current().render("unsupported_mode", mode=mode))
+            return SyncNewGame._game_output(game_object=await self._fetch_game_object(mode=mode))
+
+        async with AsyncFanOut(action="NewGame") as fan_out:
+            modes = fan_out.call("modes", self._fetch_modes())
+            game = fan_out.call("game", self._fetch_game_object(mode=mode))
+            if not SyncNewGame._mode_in(mode=mode, game_modes=await modes.result()):
+                raise ValueError(ResponseRenderer.current().render("unsupported_mode", mode=mode))
+            return SyncNewGame._game_output(game_object=await game.result())
+
+    async def do_slot(self, context=None, parameters=None):
+        logger.debug("NewGame (async): In do_slot for new game fulfillment")
+
+        if context is None or parameters is None:
+            raise ValueError("Context and/or Parameters must be set")
+
+        return SyncNewGame._slot_output(modes=await self._fetch_modes())
+
+    @classmethod
+    async def _fetch_game_object(cls, mode=None):
+        async def fetch(backend):
+            game_object = await AsyncHttpClient.execute_get_request(
+                url=SyncNewGame._game_url(mode=mode, backend=backend)
+            )
+            return SyncNewGame._on_backend(game_object=game_object, backend=backend)
+
+        return await cls._failover(fetch)
+
+    @classmethod
+    async def _fetch_modes(cls):
+        """
+        Return the game modes from the same process-wide cache used by the synchronous
+        NewGame. On a miss, one coroutine fetches the modes without blocking the event loop
+        and every other coroutine awaits its result.
+        """
+        cache = SyncNewGame._get_modes_cache()
+        if cache.ready():
+            return cache.get()
+
+        if cls._modes_future is None:
+            cls._modes_future = asyncio.ensure_future(cls._load_modes(cache))
+        try:
+            return await asyncio.shield(cls._modes_future)
+        finally:
+            if cls._modes_future is not None and cls._modes_future.done():
+                cls._modes_future = None
+
+    @staticmethod
+    async def _failover(call=None):
+        """
+        The asyncio counterpart of BackendRouter.failover: await call(backend) on each
+        candidate backend in turn until one succeeds.
+        """
+        candidates = BackendRouter.candidates()
+        for attempt, backend in enumerate(candidates, 1):
+            try:
+                return await call(backend)
+            except IOError as e:
+                if attempt == len(candidates):
+                    raise
+                logger.warning("NewGame (async): %s failed (%s); trying another backend", backend.url, e)
+
+    @classmethod
+    async def _load_modes(cls, cache):
+        game_mode_query = await cls._failover(
+            lambda backend: AsyncHttpClient.execute_get_request(url=SyncNewGame._modes_url(backend=backend))
+        )
+        modes = SyncNewGame._parse_modes(game_mode_query=game_mode_query)
+        cache.set(modes)
+        return modes
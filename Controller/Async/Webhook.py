@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+
+from aiohttp import web
+
+from Controller.Async.AbstractAsyncAction import AbstractAsyncAction
+from Controller.Webhook import Webhook as SyncWebhook
+from Utilities.ActionRegistry import ActionRegistry
+from Utilities.AdmissionControl import AdmissionControl
+from Utilities.Deadline import Deadline
+from Utilities.Helpers import Helpers
+from Utilities.RequestProfiler import RequestProfiler
+from Utilities.RequestTimer import RequestTimer
+from Utilities.ResponseCache import ResponseCache
+from Utilities.ResponseRenderer import ResponseRenderer
+from Utilities.Settings import Settings
+from Utilities.TrafficCapture import TrafficCapture
+
+
+logger = logging.getLogger(__name__)
+
+
+class Webhook(object):
+    """
+    The asyncio counterpart of Controller.Webhook. post is an aiohttp request handler which
+    resolves the action from the Controller.Async package, awaits it, and returns the same
+    response JSON as the Flask view.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or ActionRegistry(
+            package="Controller.Async",
+            base=AbstractAsyncAction
+        ).build()
+
+    async def post(self, request):
+        logger.debug("Webhook (async): Processing POST request")
+        started = time.time()
+        # Stage timings only: cProfile follows the thread rather than the task, so a profile
+        # here would include every other request the event loop ran meanwhile.
+        timer = RequestTimer()
+
+        body = await request.read()
+        backlog = AdmissionControl.backlog(request.headers.get(AdmissionControl.HEADER))
+        response_object, action_name, outcome, request_id = await self.handle(
+            body=body, timer=timer, backlog=backlog)
+
+        response_body = response_object.dumpb()
+        timer.lap("respond")
+
+        SyncWebhook._record_metrics(action_name, outcome, started)
+        RequestProfiler.finish(None, timer, action=action_name, request_id=request_id)
+        TrafficCapture.record(body=body, response=response_object, status=response_object["status"],
+                              started=started, duration=timer.elapsed())
+        return web.Response(
+            status=response_object["status"],
+            body=response_body,
+            content_type="application/json"
+        )
+
+    async def handle(self, body=None, payload=None, timer=None, backlog=0.0):
+        """
+        Handle one webhook request, given its body or (from a batch) its decoded payload; see
+        Controller.Webhook.handle.
+        :return: tuple - (response object, action name, outcome, request id)
+        """
+        timer = timer or RequestTimer()
+        action_text = None
+        action_name = "unknown"
+        request_id = None
+        cache_key = None
+        outcome = "success"
+        # Deadlines are only applied where they are private to each task (Python 3.7+).
+        budget = Settings.current().webhook_deadline if Deadline.task_safe else None
+        try:
+            deadline = Deadline(budget=budget, started=time.time() - backlog)
+            with deadline, timer:
+                if body is not None:
+                    request_object = Helpers.parse_webhook_body(body=body)
+                else:
+                    request_object = Helpers.parse_webhook_json(json_dictionary=payload)
+                request_id = request_object.request_id
+                timer.lap("parse")
+
+                key = ResponseCache.key(request_object)
+                replayed, flight = ResponseCache.default().claim(key)
+                if flight is not None:
+                    # The earlier request is still being handled; wait without blocking the loop.
+                    replayed = await asyncio.get_event_loop().run_in_executor(
+                        None, flight.wait, ResponseCache.wait_timeout())
+                if replayed is not None:
+                    action_name, response_object = replayed
+                    outcome = "retry"
+                else:
+                    cache_key = key
+                    slot_filling = request_object.action_incomplete
+                    action_text = request_object.action
+
+                    logger.debug(
+                        "Webhook (async): Processing action '%s' for %s",
+                        action_text,
+                        'slot filling' if slot_filling else 'fulfillment'
+                    )
+
+                    action = self.registry.instance(action=action_text)
+                    action_name = type(action).__name__
+                    timer.lap("resolve")
+
+                    ticket = await self._admit(
+                        priority=AdmissionControl.priority(slot_filling, action),
+                        deadline=deadline if deadline.budget is not None else None
+                    )
+                    timer.lap("admission")
+
+                    lang = request_object.lang if ResponseRenderer.task_safe else None
+                    with ticket, ResponseRenderer.language(lang):
+                        if slot_filling:
+                            return_results = await action.do_slot(
+                                context=request_object.contexts,
+                                parameters=request_object.parameters
+                            )
+                        else:
+                            return_results = await action.do_action(
+                                context=request_object.contexts,
+                                parameters=request_object.parameters
+                            )
+                    response_object = SyncWebhook._build_response(return_results)
+                timer.lap("action")
+
+        except Exception as e:
+            timer.lap("error")
+            outcome = SyncWebhook._outcome(e)
+            response_object = SyncWebhook._handle_exception(e, action_text)
+
+        ResponseCache.default().finish(cache_key, action=action_name, response=response_object,
+                                       keep=outcome == "success")
+        return response_object, action_name, outcome, request_id
+
+    @staticmethod
+    async def _admit(priority="default", deadline=None):
+        """
+        Wait, without blocking the event loop, for a place to run the action; see
+        Utilities.AdmissionControl.admit.
+        :raises Overloaded: if the request is shed
+        """
+        admission = AdmissionControl.default()
+        loop = asyncio.get_event_loop()
+        admitted = loop.create_future()
+
+        def wake():
+            if not admitted.done():
+                admitted.set_result(True)
+
+        ticket = admission.claim(priority=priority, deadline=deadline,
+                                 wake=lambda: loop.call_soon_threadsafe(wake))
+        if not ticket.admitted:
+            try:
+                await asyncio.wait([admitted], timeout=admission.wait_timeout(deadline))
+            except asyncio.CancelledError:
+                admission.abandon(ticket)
+                raise
+            admission.settle(ticket)
+        return ticket
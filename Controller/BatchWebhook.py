@@ -0,0 +1,127 @@
+import logging
+import time
+
+from flask import request, Response
+from flask.views import MethodView
+
+from Controller.Webhook import Webhook
+from Utilities.JsonCodec import JsonCodec
+from Utilities.Metrics import Metrics
+from Utilities.RequestProfiler import RequestProfiler
+from Utilities.RequestTimer import RequestTimer
+from Utilities.Settings import Settings
+from Utilities.WebhookResponse import WebhookResponse
+from Utilities.WorkerPool import WorkerPool
+
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWebhook(MethodView):
+    """
+    POST /batch: a JSON array of webhook requests (each in the format POSTed to /), for bots
+    and offline evaluation jobs which would otherwise make one call per turn. Each request is
+    handled as Controller.Webhook handles it, and the array of their responses is returned,
+    in the same order. The requests of a session are handled in order, one after another;
+    sessions are handled concurrently on the process's worker pool (see Utilities.WorkerPool).
+    Each request has a deadline of its own (WEBHOOK_DEADLINE) from when it starts.
+    """
+
+    def post(self):
+        logger.debug("BatchWebhook: Processing POST request")
+        started = time.time()
+        try:
+            items = self.parse_batch(request.get_data(cache=False))
+        except ValueError as e:
+            return self._error_response(e)
+
+        results = [None] * len(items)
+        tasks = [WorkerPool.default().submit(self._run_session, items, indexes, results)
+                 for indexes in self.sessions(items)]
+        for task in tasks:
+            task.result()
+
+        self.record_batch(len(items), started)
+        return Response(
+            status=200,
+            response=WebhookResponse.dumpb_all(results),
+            mimetype="application/json"
+        )
+
+    @staticmethod
+    def parse_batch(body=None):
+        """
+        Decode a batch: a JSON array of at most BATCH_MAX_ITEMS webhook requests. The requests
+        themselves are validated as each is handled, so one bad request fails alone.
+        :raises ValueError: if the body is not such an array
+        :return: list
+        """
+        try:
+            items = JsonCodec.loads(body)
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            raise ValueError("The batch must be a JSON array of webhook requests")
+        max_items = Settings.current().batch_max_items
+        if len(items) > max_items:
+            raise ValueError("The batch has {} requests; at most {} are allowed".format(
+                len(items), max_items))
+        return items
+
+    @staticmethod
+    def sessions(items=None):
+        """
+        Group a batch's requests by session id, keeping each session's requests in order. A
+        request without a session id is a session of its own.
+        :return: list - the indexes of each session's requests, sessions by their first request
+        """
+        grouped = {}
+        order = []
+        for index, item in enumerate(items):
+            session_id = item.get("sessionId") if isinstance(item, dict) else None
+            key = ("session", session_id) if session_id is not None else ("item", index)
+            if key not in grouped:
+                grouped[key] = []
+                order.append(key)
+            grouped[key].append(index)
+        return [grouped[key] for key in order]
+
+    @staticmethod
+    def record_batch(size=0, started=None):
+        """Record a batch's size and the time taken to respond to it."""
+        Metrics.observe("cowbull_batch_size", size)
+        Metrics.observe("cowbull_batch_duration_seconds", time.time() - started)
+
+    @staticmethod
+    def _run_session(items=None, indexes=None, results=None):
+        # Runs on a pool thread: each request is timed and counted as if it had been POSTed to /.
+        for index in indexes:
+            started = time.time()
+            timer = RequestTimer()
+            response_object, action_name, outcome, request_id = Webhook.handle(
+                payload=items[index], timer=timer)
+            timer.lap("respond")
+            Webhook._record_metrics(action_name, outcome, started)
+            RequestProfiler.finish(None, timer, action=action_name, request_id=request_id)
+            results[index] = response_object
+
+    @staticmethod
+    def error_object(error=None):
+        """Return the error object for a batch which could not be read."""
+        response_object = Webhook._handle_error(400, str(error))
+        response_object.status = 400
+        return response_object
+
+    def _error_response(self, error=None):
+        response_object = self.error_object(error)
+        return Response(
+            status=400,
+            response=response_object.dumpb(),
+            mimetype="application/json"
+        )
+
+
+Metrics.describe("cowbull_batch_size", "histogram", "Webhook requests per batch",
+                 buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+Metrics.describe("cowbull_batch_duration_seconds", "histogram",
+                 "Time taken to respond to a batch of webhook requests")
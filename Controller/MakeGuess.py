@@ -1,72 +1,106 @@
 import logging
 
 from Controller.AbstractAction import AbstractAction
-from InitializationPackage import app
+from Utilities.ActionResult import ActionResult
+from Utilities.BackendRouter import BackendRouter
+from Utilities.GameStateCache import GameStateCache
 from Utilities.Helpers import Helpers
+from Utilities.LogPipeline import LogPipeline
+from Utilities.ResponseRenderer import ResponseRenderer
+from Utilities.Settings import Settings
+from Utilities.WebhookRequest import Contexts
+
+
+logger = logging.getLogger(__name__)
 
 
 class MakeGuess(AbstractAction):
     def __init__(self):
         super(MakeGuess, self).__init__()
-        logging.debug("MakeGuess: In __init__ for make guess fulfillment")
+        logger.debug("MakeGuess: In __init__ for make guess fulfillment")
 
     def do_action(self, context=None, parameters=None):
-        logging.debug("MakeGuess: In do_action for make guess fulfillment")
-        logging.debug("MakeGuess: Context: {}. Parameters: {}.".format(context, parameters))
-
-        # Step 1 - Get a helper
-        helper = Helpers()
+        logger.debug("MakeGuess: In do_action for make guess fulfillment")
+        if LogPipeline.sample(logger):
+            logger.debug("MakeGuess: Context: %s. Parameters: %s.", context, parameters)
 
         # Step 1 - Get the digits entered by the user and get the game key
         try:
-            user_data = {
-                "key": [n["parameters"]["key"] for n in context if n["name"] == "key"][0],
-                "digits": self._get_digits_entered(parameters)
-            }
+            user_data = self._user_data(context=context, parameters=parameters)
         except ValueError as ve:
-            return {
-                "contextOut": [],
-                "speech": str(ve),
-                "displayText": str(ve)
-            }
-
-        # Step 2 - Send the request to the game server
-        game_url = app.config.get("COWBULL_URL", None).format("game")
-        if not game_url:
-            raise ValueError("COWBULL_URL is not defined, so the game cannot be played")
+            return self._error_output(error=ve)
 
-        guess_analysis = helper.execute_post_request(url=game_url, data=user_data)
-        logging.debug("Game object returned: {}".format(guess_analysis))
+        # Step 2 - Send the request to the game server (the one which created the game)
+        game_url = self._game_url(context=context)
 
-        # Step 3 - Analyze the guess
-        response_text = self._analyze_result(guess_analysis=guess_analysis)
+        guess_analysis = Helpers.execute_post_request(url=game_url, data=user_data)
+        if LogPipeline.sample(logger):
+            logger.debug("Game object returned: %s", guess_analysis)
 
-        # Step 4 - Return the results
-        output = {
-            "contextOut": context,
-            "speech": response_text,
-            "displayText": response_text
-        }
-
-        return output
+        # Step 3 & 4 - Analyze the guess and return the results
+        return self._guess_output(context=context, guess_analysis=guess_analysis)
 
     def do_slot(self, context, parameters):
         pass
 
+    @classmethod
+    def _user_data(cls, context=None, parameters=None):
+        key_context = Contexts.find(context, "key")
+        if key_context is None:
+            raise ValueError("There is no game in progress; please start a new game")
+
+        user_data = {
+            "key": key_context["parameters"]["key"],
+            "digits": cls._get_digits_entered(parameters)
+        }
+
+        # Reject a guess the game server is known to refuse without calling it.
+        GameStateCache.default().check_guess(key=user_data["key"], digits=user_data["digits"])
+        return user_data
+
+    @staticmethod
+    def _error_output(error=None):
+        return ActionResult(speech=str(error), context_out=[])
+
+    @staticmethod
+    def _game_url(context=None):
+        # When games are routed across several game servers, the game's backend is kept in
+        # the key context with its key (see NewGame._game_output).
+        key_context = Contexts.find(context, "key")
+        backend = BackendRouter.pinned(
+            backend_id=key_context["parameters"].get("backend") if key_context is not None else None
+        )
+        if backend is not None:
+            return backend.game_url
+
+        game_url = Settings.current().game_url
+        if game_url is None:
+            raise ValueError("COWBULL_URL is not defined, so the game cannot be played")
+
+        return game_url
+
+    @classmethod
+    def _guess_output(cls, context=None, guess_analysis=None):
+        GameStateCache.default().remember_guess(guess_analysis=guess_analysis)
+        response_text = cls._analyze_result(guess_analysis=guess_analysis)
+
+        return ActionResult(speech=response_text, context_out=context)
+
     @staticmethod
     def _analyze_result(guess_analysis):
         game = guess_analysis.get('game', None)
         status = game.get('status', None)
-        logging.debug("_analyze_result: Game status is {} ".format(status))
+        logger.debug("_analyze_result: Game status is %s ", status)
 
         guesses_made = int(game.get('guesses_made', 0))
         guesses_allowed = int(game.get('mode').get('guesses_allowed'))
         guesses_remaining = guesses_allowed - guesses_made
-        logging.debug("_analyze_result: Guesses remaining are {} ( {} - {} )".format(
+        logger.debug(
+            "_analyze_result: Guesses remaining are %s ( %s - %s )",
             guesses_remaining,
             guesses_allowed,
             guesses_made
-        ))
+        )
 
         outcome = guess_analysis.get('outcome', None)
         message = outcome.get('status', None)
@@ -77,27 +111,17 @@ class MakeGuess(AbstractAction):
         if status.lower() in ["won", "lost"]:
             response_text = message
         else:
-            message_text = ""
-            for a in analysis:
-                if a["match"]:
-                    message_text += "{} is a bull".format(a["digit"])
-                elif a["in_word"]:
-                    message_text += "{} is a cow".format(a["digit"])
-                else:
-                    message_text += "{} is a miss".format(a["digit"])
-
-                if a["multiple"]:
-                    message_text += " and occurs more than once. "
-                else:
-                    message_text += ". "
-
-            message_text += "You have {} goes remaining!".format(guesses_remaining)
-            response_text = "You have {} cows and {} bulls. {}".format(cows, bulls, message_text)
+            response_text = ResponseRenderer.current().guess(
+                analysis=analysis,
+                cows=cows,
+                bulls=bulls,
+                remaining=guesses_remaining
+            )
 
         return response_text
 
     @staticmethod
     def _get_digits_entered(parameters):
         digits_entered = [int(i) for i in parameters["digitlist"]]
-        logging.debug("The digits input were: {}".format(digits_entered))
+        logger.debug("The digits input were: %s", digits_entered)
         return digits_entered
@@ -0,0 +1,15 @@
+from flask import Response
+from flask.views import MethodView
+
+from Utilities.Metrics import Metrics
+
+
+class MetricsView(MethodView):
+    """Serves the agent's metrics in the Prometheus text format (see Utilities.Metrics)."""
+
+    def get(self):
+        return Response(
+            status=200,
+            response=Metrics.render(),
+            mimetype="text/plain; version=0.0.4"
+        )
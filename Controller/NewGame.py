@@ -1,100 +1,243 @@
 import logging
+import threading
+from collections import OrderedDict
 
 from Controller.AbstractAction import AbstractAction
-from InitializationPackage import app
+from Utilities.ActionResult import ActionResult
+from Utilities.BackendRouter import BackendRouter
+from Utilities.CachedValue import CachedValue
+from Utilities.FanOut import FanOut
+from Utilities.GamePool import GamePool
+from Utilities.GameStateCache import GameStateCache
 from Utilities.Helpers import Helpers
+from Utilities.LogPipeline import LogPipeline
+from Utilities.ResponseRenderer import ResponseRenderer
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
 
 
 class NewGame(AbstractAction):
+    starts_game = True
+
+    _modes_cache = None
+    """Process-wide cache of the game modes, created on first use (see _fetch_modes)"""
+    _modes_cache_lock = threading.Lock()
+
+    _game_pool = None
+    """Process-wide pool of pre-created games, if GAME_POOL_SIZES is set (see game_pool)"""
+    _game_pool_lock = threading.Lock()
+
     def __init__(self):
         super(NewGame, self).__init__()
 
     def do_action(self, context=None, parameters=None):
-        logging.debug("NewGame: In do_action for new game fulfillment")
-        logging.debug("NewGame: Context: {}. Parameters: {}.".format(context, parameters))
+        logger.debug("NewGame: In do_action for new game fulfillment")
+        if LogPipeline.sample(logger):
+            logger.debug("NewGame: Context: %s. Parameters: %s.", context, parameters)
 
         if context is None or parameters is None:
             raise ValueError("Context and/or Parameters must be set")
 
         mode = parameters["mode"]
-        mode_valid = self._validate_mode(mode=mode)
-        if not mode_valid:
-            raise ValueError("The mode you entered ({}) isn't supported".format(mode))
 
-        return self._fetch_game(mode=mode)
+        # A pooled game was created by the game server, so its mode needs no validation.
+        game_object = self._take_pooled_game(mode=mode)
+        if game_object is not None:
+            return self._game_output(game_object=game_object)
+
+        # With the modes cached, validating the mode is a lookup, so the game is fetched after
+        # it. Otherwise the modes and the game are fetched together, and the game is ignored
+        # if the mode turns out not to be valid.
+        if self._get_modes_cache().ready():
+            mode_valid = self._validate_mode(mode=mode)
+            if not mode_valid:
+                raise ValueError(ResponseRenderer.current().render("unsupported_mode", mode=mode))
+            return self._fetch_game(mode=mode)
+
+        with FanOut(action="NewGame") as fan_out:
+            modes = fan_out.call("modes", self._fetch_modes)
+            game = fan_out.call("game", self._fetch_game_object, mode=mode)
+            if not self._mode_in(mode=mode, game_modes=modes.result()):
+                raise ValueError(ResponseRenderer.current().render("unsupported_mode", mode=mode))
+            return self._game_output(game_object=game.result())
 
     def do_slot(self, context=None, parameters=None):
-        logging.debug("NewGame: In do_slot for new game fulfillment")
-        logging.debug("NewGame: Context: {}. Parameters: {}.".format(context, parameters))
+        logger.debug("NewGame: In do_slot for new game fulfillment")
+        if LogPipeline.sample(logger):
+            logger.debug("NewGame: Context: %s. Parameters: %s.", context, parameters)
 
         if context is None or parameters is None:
             raise ValueError("Context and/or Parameters must be set")
 
-        modes = self._fetch_modes()
-        text_message = "Choose one of the following modes: {}".format(modes)
-        output = {
-            "contextOut": [
-                {"name": "modes", "lifespan": 15, "parameters": {"digits": modes}}
-            ],
-            "speech": text_message,
-            "displayText": text_message
-        }
-
-        return output
+        return self._slot_output(modes=self._fetch_modes())
 
     @staticmethod
-    def _fetch_game(mode=None):
-        logging.debug("_fetch_game: Start")
-        output = {}
+    def _slot_output(modes=None):
+        modes = ", ".join(modes)
+        text_message = ResponseRenderer.current().render("choose_mode", modes=modes)
+        return ActionResult(
+            speech=text_message,
+            context_out=[{"name": "modes", "lifespan": 15, "parameters": {"digits": modes}}]
+        )
 
-        game_url = app.config.get("COWBULL_URL", None)
-        if not game_url:
-            raise ValueError("COWBULL_URL is not defined, so the game cannot be played")
+    @classmethod
+    def _fetch_game(cls, mode=None):
+        logger.debug("_fetch_game: Start")
+        return cls._game_output(game_object=cls._fetch_game_object(mode=mode))
 
-        url = game_url.format("game") + "?mode={}".format(mode.capitalize())
-        logging.debug("_fetch_game: Game URL is {}".format(url))
+    @classmethod
+    def _fetch_game_object(cls, mode=None):
+        def fetch(backend):
+            url = cls._game_url(mode=mode, backend=backend)
+            logger.debug("_fetch_game: Game URL is %s", url)
 
-        helper = Helpers()
-        game_object = helper.execute_get_request(url=url)
+            return cls._on_backend(game_object=Helpers.execute_get_request(url=url), backend=backend)
 
-        output["contextOut"] = [
-            {"name": "key", "lifespan": 15, "parameters": {"key": game_object["key"]}}
-        ]
-        output["speech"] = output["displayText"] = \
-            "Okay, I've started a new game. You have {} guesses to guess {} numbers." \
-            .format(
-                game_object["guesses"],
-                game_object["digits"]
-            )
+        return BackendRouter.failover(fetch)
 
-        return output
+    @staticmethod
+    def _on_backend(game_object=None, backend=None):
+        """
+        Note the backend a game was created on (when games are routed across several game
+        servers), so its key context can pin the game's guesses to it.
+        """
+        if backend is None:
+            return game_object
+        game_object = dict(game_object)
+        game_object["backend"] = backend.id
+        return game_object
+
+    @classmethod
+    def game_pool(cls):
+        """
+        Return the process-wide pool of pre-created games (starting it on first use), or None
+        if GAME_POOL_SIZES is not set.
+        :return: GamePool
+        """
+        if cls._game_pool is None and Settings.current().game_pool_sizes:
+            with cls._game_pool_lock:
+                if cls._game_pool is None:
+                    settings = Settings.current()
+                    cls._game_pool = GamePool(
+                        fetch=lambda mode: cls._fetch_game_object(mode=mode),
+                        sizes=GamePool.parse_sizes(settings.game_pool_sizes),
+                        max_age=settings.game_pool_max_age,
+                        refill_interval=settings.game_pool_refill_interval
+                    )
+                    cls._game_pool.start()
+        return cls._game_pool
+
+    @classmethod
+    def _take_pooled_game(cls, mode=None):
+        pool = cls.game_pool()
+        return pool.take(mode=mode) if pool is not None else None
 
-    def _validate_mode(self, mode):
-        # TODO Add caching for the game modes to avoid unwanted round trips
+    @staticmethod
+    def _game_url(mode=None, backend=None):
+        if backend is not None:
+            return backend.new_game_url + mode.capitalize()
 
-        _mode = mode.capitalize() or "Normal"
+        new_game_url = Settings.current().new_game_url
+        if new_game_url is None:
+            raise ValueError("COWBULL_URL is not defined, so the game cannot be played")
+
+        return new_game_url + mode.capitalize()
 
-        logging.debug("_validate_mode: Checking mode(s)")
+    @staticmethod
+    def _game_output(game_object=None):
+        # Every new game (fetched or pooled) passes through here, so remember it for MakeGuess.
+        GameStateCache.default().remember_new_game(game_object=game_object)
+
+        key_parameters = {"key": game_object["key"]}
+        if game_object.get("backend"):
+            key_parameters["backend"] = game_object["backend"]
+
+        return ActionResult(
+            speech=ResponseRenderer.current().render(
+                "new_game",
+                guesses=game_object["guesses"],
+                digits=game_object["digits"]
+            ),
+            context_out=[{"name": "key", "lifespan": 15, "parameters": key_parameters}]
+        )
+
+    def _validate_mode(self, mode):
+        logger.debug("_validate_mode: Checking mode(s)")
+        return self._mode_in(mode=mode, game_modes=self._fetch_modes())
 
-        game_modes = self._fetch_modes()
-        logging.debug("_validate_mode: Mode {} found? {}".format(_mode, _mode in game_modes))
+    @staticmethod
+    def _mode_in(mode=None, game_modes=None):
+        _mode = mode.capitalize() or "Normal"
 
-        if _mode in game_modes:
-            return True
-        else:
-            return False
+        found = _mode in game_modes
+        logger.debug("_validate_mode: Mode %s found? %s", _mode, found)
+
+        return found
+
+    @classmethod
+    def _fetch_modes(cls):
+        """
+        Return the game modes supported by the game server as an OrderedDict of mode name
+        to the mode description returned by the server. The modes are cached for
+        MODES_CACHE_TTL seconds (and served stale for a further MODES_CACHE_STALE_TTL
+        seconds while they are refreshed), so validating a mode is a dictionary lookup
+        rather than a round trip to the game server.
+        """
+        return cls._get_modes_cache().get()
+
+    @classmethod
+    def _get_modes_cache(cls):
+        if cls._modes_cache is None:
+            with cls._modes_cache_lock:
+                if cls._modes_cache is None:
+                    settings = Settings.current()
+                    cls._modes_cache = CachedValue(
+                        loader=cls._load_modes,
+                        ttl=settings.modes_cache_ttl,
+                        stale_ttl=settings.modes_cache_stale_ttl,
+                        name="modes"
+                    )
+        return cls._modes_cache
+
+    @classmethod
+    def _load_modes(cls):
+        # Every backend is expected to serve the same modes.
+        game_mode_query = BackendRouter.failover(
+            lambda backend: Helpers.execute_get_request(url=cls._modes_url(backend=backend))
+        )
+        return cls._parse_modes(game_mode_query=game_mode_query)
 
     @staticmethod
-    def _fetch_modes():
-        game_url = app.config.get("COWBULL_URL", None)
-        if not game_url:
+    def _modes_url(backend=None):
+        if backend is not None:
+            return backend.modes_url
+
+        modes_url = Settings.current().modes_url
+        if modes_url is None:
             raise ValueError("COWBULL_URL is not defined, so the game cannot be played")
 
-        url = game_url.format("modes")
+        return modes_url
+
+    @classmethod
+    def _settings_changed(cls, previous=None, settings=None):
+        """
+        Settings listener: when the game server changes, discard its modes and pooled games.
+        """
+        if previous.cowbull_url == settings.cowbull_url and \
+                previous.cowbull_backends == settings.cowbull_backends:
+            return
+        if cls._modes_cache is not None:
+            cls._modes_cache.invalidate()
+        if cls._game_pool is not None:
+            cls._game_pool.clear()
+
+    @staticmethod
+    def _parse_modes(game_mode_query=None):
+        return OrderedDict(
+            (str(mode["mode"]), mode) for mode in game_mode_query["modes"]
+        )
 
-        helper = Helpers()
-        game_mode_query = helper.execute_get_request(url=url)
 
-        modes = game_mode_query["modes"]
-        return str([str(mode["mode"]) for mode in modes]) \
-            .replace('[', '').replace(']', '').replace("'", "")
+Settings.add_listener(NewGame._settings_changed)
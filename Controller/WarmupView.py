@@ -0,0 +1,15 @@
+from flask import Response
+from flask.views import MethodView
+
+from Utilities.Warmup import Warmup
+
+
+class WarmupView(MethodView):
+    """
+    Serves App Engine's warmup request (GET /_ah/warmup, see inbound_services in app.yaml),
+    which primes the agent's pools and caches (see Utilities.Warmup) before traffic arrives.
+    """
+
+    def get(self):
+        Warmup.run()
+        return Response(status=200, response="", mimetype="text/plain")
@@ -1,103 +1,208 @@
-import json
 import logging
+import time
 
 from flask import request, Response
 from flask.views import MethodView
 
-from Controller.AbstractAction import AbstractAction
+from Utilities.AdmissionControl import AdmissionControl, Overloaded
+from Utilities.CircuitBreaker import CircuitOpen
+from Utilities.Deadline import Deadline
 from Utilities.Helpers import Helpers
+from Utilities.LogPipeline import LogPipeline
+from Utilities.Metrics import Metrics
+from Utilities.RequestProfiler import RequestProfiler
+from Utilities.RequestTimer import RequestTimer
+from Utilities.ResponseCache import ResponseCache
+from Utilities.ResponseRenderer import ResponseRenderer
+from Utilities.Settings import Settings
+from Utilities.TrafficCapture import TrafficCapture
+from Utilities.WebhookResponse import WebhookResponse
+
+
+logger = logging.getLogger(__name__)
 
 
 class Webhook(MethodView):
     def post(self):
-        logging.debug("Webhook: Processing POST request")
-
-        response_object = {
-            "status": 200,
-            "message": "success",
-            "speech": None,
-            "displayText": None,
-            "data": {},
-            "source": "cowbull-agent",
-            "followupEvent": {},
-            "contextOut": []
-        }
-
-        # Step 1: Instantiate a helper
-        helper = Helpers()
+        logger.debug("Webhook: Processing POST request")
+        started = time.time()
+        timer = RequestTimer()
+        profiler = RequestProfiler.start(request.headers.get(RequestProfiler.HEADER))
+
+        # Step 1: Get the request. The body is read once (and not cached by Flask), and kept
+        # for the traffic capture.
+        body = request.get_data(cache=False)
+        backlog = AdmissionControl.backlog(request.headers.get(AdmissionControl.HEADER))
+
+        # Steps 2 to 5: Parse the request and act on it.
+        response_object, action_name, outcome, request_id = self.handle(
+            body=body, timer=timer, backlog=backlog)
+
+        # Step n: Return the response to the user.
+        response_body = response_object.dumpb()
+        timer.lap("respond")
+
+        self._record_metrics(action_name, outcome, started)
+        RequestProfiler.finish(profiler, timer, action=action_name, request_id=request_id)
+        TrafficCapture.record(body=body, response=response_object, status=response_object["status"],
+                              started=started, duration=timer.elapsed())
+        return Response(
+            status=response_object["status"],
+            response=response_body,
+            mimetype="application/json"
+        )
+
+    @classmethod
+    def handle(cls, body=None, payload=None, timer=None, backlog=0.0):
+        """
+        Handle one webhook request, given its body or (from a batch) its decoded payload, and
+        return its response. Nothing is raised: a failure is returned as an error response.
+        :param body: bytes - the request body
+        :param payload: dict - the decoded request, instead of body
+        :param timer: RequestTimer - the request's stage timings (lapped up to "action")
+        :param backlog: float - the seconds the request waited before reaching the worker,
+        which are taken off its deadline
+        :return: tuple - (response object, action name, outcome, request id)
+        """
+        timer = timer or RequestTimer()
 
         action_text = None
+        action_name = "unknown"
+        request_id = None
+        cache_key = None
+        outcome = "success"
         try:
-            # Step 2: Get and _validate the JSON in the request
-            request_object = helper.validate_json(request_data=request)
-            if request_object == {}:
-                raise ValueError("The request object returned is None!")
-
-            slot_filling = request_object["actionIncomplete"]
-            action_text = request_object["action"]
-
-            logging.debug("Webhook: Processing action '{}' for {}".format(
-                action_text,
-                'slot filling' if slot_filling else 'fulfillment'
-            ))
-
-            action_class = helper.get_action_class(action=action_text)
-            if not issubclass(action_class, AbstractAction):
-                raise TypeError("The action class is not a concrete implementation of AbstractAction")
-            logging.debug("Webhook: Loaded action module")
-
-            action = action_class()
-            logging.debug("Webhook: Instantiated action class")
-
-            if slot_filling:
-                return_results = action.do_slot(
-                    context=request_object["contexts"],
-                    parameters=request_object["parameters"]
-                )
-            else:
-                return_results = action.do_action(
-                    context=request_object["contexts"],
-                    parameters=request_object["parameters"]
-                )
-                logging.debug("Return results: {}".format(return_results))
-            response_object["contextOut"] = return_results["contextOut"]
-            response_object["speech"] = return_results["speech"]
-            response_object["displayText"] = return_results["displayText"]
-
-        except KeyError as ke:
-            response_object = self._handle_error(
+            # Every game server call made for this request shares the request's deadline, and
+            # adds its duration to the request's upstream time.
+            deadline = Deadline(budget=Settings.current().webhook_deadline, started=time.time() - backlog)
+            with deadline, timer:
+                # Step 2: Get and _validate the JSON in the request.
+                if body is not None:
+                    request_object = Helpers.parse_webhook_body(body=body)
+                else:
+                    request_object = Helpers.parse_webhook_json(json_dictionary=payload)
+                request_id = request_object.request_id
+                timer.lap("parse")
+
+                # Step 3: A retry of a request which has been (or is being) handled is given the
+                # same response, rather than acting - e.g. making a guess - a second time.
+                key = ResponseCache.key(request_object)
+                replayed = ResponseCache.default().lookup(key)
+                if replayed is not None:
+                    action_name, response_object = replayed
+                    outcome = "retry"
+                    logger.debug("Webhook: Returning the response to request %s again", request_id)
+                else:
+                    cache_key = key
+                    slot_filling = request_object.action_incomplete
+                    action_text = request_object.action
+
+                    logger.debug(
+                        "Webhook: Processing action '%s' for %s",
+                        action_text,
+                        'slot filling' if slot_filling else 'fulfillment'
+                    )
+
+                    # Step 4: Resolve the action and run it.
+                    action = Helpers.get_action(action=action_text)
+                    action_name = type(action).__name__
+                    logger.debug("Webhook: Resolved action %s", action_name)
+                    timer.lap("resolve")
+
+                    # Step 5: Wait for a place to run the action, unless the request can no
+                    # longer be answered before its deadline.
+                    ticket = AdmissionControl.default().admit(
+                        priority=AdmissionControl.priority(slot_filling, action),
+                        deadline=deadline if deadline.budget is not None else None
+                    )
+                    timer.lap("admission")
+
+                    # Responses are rendered in the language of the request.
+                    with ticket, ResponseRenderer.language(request_object.lang):
+                        if slot_filling:
+                            return_results = action.do_slot(
+                                context=request_object.contexts,
+                                parameters=request_object.parameters
+                            )
+                        else:
+                            return_results = action.do_action(
+                                context=request_object.contexts,
+                                parameters=request_object.parameters
+                            )
+                            if LogPipeline.sample(logger):
+                                logger.debug("Return results: %s", return_results)
+                    response_object = cls._build_response(return_results)
+                timer.lap("action")
+
+        except Exception as e:
+            timer.lap("error")
+            outcome = cls._outcome(e)
+            response_object = cls._handle_exception(e, action_text)
+
+        # Any retry waiting for this request gets the same response; only a success is kept
+        # for later retries, so a retry of a failed request is handled afresh.
+        ResponseCache.default().finish(cache_key, action=action_name, response=response_object,
+                                       keep=outcome == "success")
+        return response_object, action_name, outcome, request_id
+
+    @staticmethod
+    def _build_response(return_results):
+        return WebhookResponse.from_result(return_results)
+
+    @staticmethod
+    def _outcome(exception):
+        """
+        Classify an exception handled by _handle_exception for the request metrics.
+        """
+        if isinstance(exception, KeyError):
+            return "bad_request"
+        if isinstance(exception, ImportError):
+            return "unknown_action"
+        if isinstance(exception, Overloaded):
+            return "shed"
+        if isinstance(exception, CircuitOpen):
+            return "circuit_open"
+        if isinstance(exception, IOError):
+            return "upstream_error"
+        return "error"
+
+    @staticmethod
+    def _record_metrics(action_name, outcome, started):
+        """
+        Record the request count and latency by action (the resolved class name, so that the
+        label cannot grow with whatever actions are sent) and outcome.
+        """
+        Metrics.inc("cowbull_webhook_requests_total", action=action_name, outcome=outcome)
+        Metrics.observe(
+            "cowbull_webhook_request_duration_seconds", time.time() - started,
+            action=action_name, outcome=outcome
+        )
+
+    @classmethod
+    def _handle_exception(cls, exception, action_text=None):
+        """
+        Map an exception raised while processing a webhook to the error response returned to
+        the user. Shared by the Flask view and the asyncio entry point (Controller.Async).
+        """
+        if isinstance(exception, KeyError):
+            return cls._handle_error(
                 400,
-                "The json is badly formed. Missing key {}".format(str(ke))
+                "The json is badly formed. Missing key {}".format(str(exception))
             )
-        except ImportError:
-            response_object = self._handle_error(
+        if isinstance(exception, ImportError):
+            return cls._handle_error(
                 400,
                 "Sorry, the action you wanted ({}), isn't available yet.".format(action_text)
             )
-        except Exception as e:
-            response_object = self._handle_error(400, str(e))
-
-        # Step n: Return the response to the user.
-        return Response(
-            status=response_object["status"],
-            response=json.dumps(response_object),
-            mimetype="application/json"
-        )
+        if isinstance(exception, (Overloaded, CircuitOpen)):
+            # A shed request, or one failed fast by an open circuit breaker, is told the game
+            # server isn't available - the existing friendly speech, without an error code.
+            return WebhookResponse(speech=str(exception), context_out=[])
+        return cls._handle_error(400, str(exception))
 
     @staticmethod
     def _handle_error(error_code, error_msg):
-        logging.debug("Error Raised: {} {}".format(error_code, error_msg))
+        logger.debug("Error Raised: %s %s", error_code, error_msg)
 
         error_text = "{} {}".format(error_code, error_msg)
-        response_object = {
-            "status": 200,
-            "message": "success",
-            "speech": error_text,
-            "displayText": error_text,
-            "data": {},
-            "source": "cowbull-agent",
-            "followupEvent": {},
-            "contextOut": []
-        }
-
-        return response_object
+        return WebhookResponse(speech=error_text, context_out=[])
@@ -5,12 +5,21 @@
 # Purpose: Initializes the application, creates an instance of a Flask     #
 #          object (app), and sets the configuration of the app. app is     #
 #          created in an initialization package so it can be imported in   #
-#          any package or module within the app.                           #
+#          any package or module within the app. Importing the package     #
+#          only creates app; create_app() configures it (once per          #
+#          process), so the entry points (app.py and async_app.py) decide  #
+#          when that cost is paid and tools can import modules cheaply.    #
+#          Modules read the settings from the typed snapshot published by  #
+#          Config (Utilities.Settings.current()).                          #
 ############################################################################
 
 import os
+import threading
+
 from flask import Flask
 from Utilities.Config import Config
+from Utilities.JsonCodec import JsonCodec
+from Utilities.Metrics import Metrics
 
 
 # Initialize the Flask app and set the location of templates and statics
@@ -24,9 +33,78 @@ app = Flask(
     static_path='/static/'
 )
 
-# Get a configuration helper that will be used to set configuration values
-# such as the URL of the game server.
-config = Config(app=app)
+config = None
+"""The configuration helper, set by create_app()"""
+
+_create_lock = threading.Lock()
+
+_deferred_pid = None
+"""The process in which start() is deferred (see defer_start)"""
+
+
+def create_app():
+    """
+    Configure app from the environment (and CONFIG_FILE) and return it. The configuration is
+    parsed, logged and applied on the first call only; later calls return the same app.
+    :return: Flask
+    """
+    global config
+
+    if config is not None:
+        return app
+
+    with _create_lock:
+        if config is not None:
+            return app
+
+        # Get a configuration helper that will be used to set configuration values
+        # such as the URL of the game server.
+        configuration = Config(app=app)
+
+        # For logging purposes, dump the configuration.
+        configuration.dump()
+
+        # Select the JSON backend used for payloads, game server calls and responses.
+        JsonCodec.configure(name=configuration.settings.json_codec)
+
+        # Metrics are kept per process; if a directory is configured, each worker
+        # shares a snapshot of its metrics there so that any worker can report all.
+        Metrics.configure(
+            directory=configuration.settings.metrics_dir,
+            flush_interval=configuration.settings.metrics_flush_interval
+        )
+
+        config = configuration
+    return app
+
+
+def start():
+    """
+    Start this process's background work: watching CONFIG_FILE for changes, filling the game
+    pool (if GAME_POOL_SIZES is set) and, if WARMUP is set, the warmup. Each is started once
+    per process; see defer_start for servers which fork after importing the app.
+    """
+    if _deferred_pid == os.getpid():
+        return
+    create_app()
+
+    # Imported here as the controllers import this package.
+    from Controller.NewGame import NewGame
+    from Utilities.Warmup import Warmup
+
+    config.watch()
+    pool = NewGame.game_pool()
+    if pool is not None:
+        pool.start()
+    if config.settings.warmup:
+        Warmup.run()
+
 
-# For logging purposes, dump the configuration.
-config.dump()
+def defer_start():
+    """
+    Make start() do nothing in this process. A server which imports the app and then forks
+    its workers (see server.py) calls this first, so no threads are started (and no locks
+    held) in the process being forked, then calls start() in each worker.
+    """
+    global _deferred_pid
+    _deferred_pid = os.getpid()
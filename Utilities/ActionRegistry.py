@@ -0,0 +1,143 @@
+############################################################################
+# Module: ActionRegistry.py                                                #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Builds, once at startup, an index of every concrete             #
+#          AbstractAction subclass in the Controller package keyed by its  #
+#          normalized action name (and any aliases). Resolving the action  #
+#          named in a webhook is then a single dictionary lookup rather    #
+#          than an import on every request. Actions are stateless, so each #
+#          class is instantiated once, on first use, and the instance      #
+#          serves every request (see Controller.AbstractAction).           #
+############################################################################
+
+import importlib
+import inspect
+import logging
+import pkgutil
+import threading
+
+from Controller.AbstractAction import AbstractAction
+
+
+logger = logging.getLogger(__name__)
+
+
+class ActionRegistry(object):
+    """
+    An index of action name -> action class. Names are normalized (see normalize) so that
+    API.ai actions such as 'makeguess', 'MakeGuess' and 'make-guess' all resolve to the
+    MakeGuess class. Action classes may declare further names in their aliases attribute.
+    """
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, package="Controller", base=AbstractAction):
+        self.package = package
+        self.base = base
+        self.actions = {}
+        self.names = {}
+        self.instances = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def default(cls):
+        """
+        Return the process-wide registry, building it on first use.
+        :return: ActionRegistry
+        """
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    cls._default = cls().build()
+        return cls._default
+
+    @staticmethod
+    def normalize(action=None):
+        """
+        Normalize an action name for lookup: case is ignored, as are '-', '_', '.' and spaces.
+        :param action: str - the action name, e.g. 'make-guess'
+        :return: str - e.g. 'makeguess'
+        """
+        return "".join(c for c in str(action).lower() if c not in "-_. ")
+
+    def build(self):
+        """
+        Import every module in the package and register the subclasses of base found. Sub-packages
+        (e.g. Controller.Async) are not searched; they have registries of their own.
+        :return: ActionRegistry - self, to allow chaining.
+        """
+        pkg = importlib.import_module(self.package)
+        for _, module_name, is_pkg in pkgutil.iter_modules(pkg.__path__):
+            if is_pkg:
+                continue
+            mod = importlib.import_module("{}.{}".format(self.package, module_name))
+            for _, obj in inspect.getmembers(mod, inspect.isclass):
+                if obj.__module__ != mod.__name__:
+                    continue
+                if obj is self.base or inspect.isabstract(obj):
+                    continue
+                if issubclass(obj, self.base):
+                    self.register(obj)
+
+        logger.debug("ActionRegistry: Registered actions %s", sorted(self.actions))
+        return self
+
+    def register(self, action_class=None):
+        """
+        Register an action class under its class name and any aliases it declares.
+        :param action_class: a concrete subclass of base.
+        """
+        if not inspect.isclass(action_class) or not issubclass(action_class, self.base):
+            raise TypeError(
+                "The action class is not a concrete implementation of {}".format(self.base.__name__)
+            )
+
+        names = [action_class.__name__] + list(getattr(action_class, "aliases", []) or [])
+        for name in names:
+            key = self.normalize(name)
+            existing = self.actions.get(key)
+            if existing is not None and existing is not action_class:
+                raise ValueError(
+                    "Action name '{}' is claimed by both {} and {}".format(
+                        name, existing.__name__, action_class.__name__
+                    )
+                )
+            self.actions[key] = action_class
+            # Actions are usually sent as the class name or its normalized form; either is
+            # then found without normalizing.
+            self.names[name] = self.names[key] = action_class
+
+    def resolve(self, action=None):
+        """
+        Return the class implementing the action.
+        :param action: str - the action name sent by API.ai
+        :return: the action class
+        :raises ImportError: if no action class is registered under that name.
+        """
+        if not action:
+            raise ValueError("ActionRegistry:resolve: Action was set to None!")
+
+        action_class = self.names.get(action)
+        if action_class is not None:
+            return action_class
+        try:
+            return self.actions[self.normalize(action)]
+        except KeyError:
+            raise ImportError("No action class is registered for '{}'".format(action))
+
+    def instance(self, action=None):
+        """
+        Return the shared instance of the class implementing the action, created on first use.
+        :param action: str - the action name sent by API.ai
+        :return: the action
+        :raises ImportError: if no action class is registered under that name.
+        """
+        action_class = self.resolve(action=action)
+        action_object = self.instances.get(action_class)
+        if action_object is None:
+            with self._lock:
+                action_object = self.instances.get(action_class)
+                if action_object is None:
+                    action_object = self.instances[action_class] = action_class()
+        return action_object
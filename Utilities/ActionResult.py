@@ -0,0 +1,43 @@
+############################################################################
+# Module: ActionResult.py                                                  #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: What an action returns to the webhook: the text to speak (and   #
+#          display) and the contexts to set. A slotted object rather than  #
+#          a dictionary, as one is made for every request; the webhook     #
+#          copies its fields straight into the response. It can still be   #
+#          read as the dictionary actions used to return, e.g.             #
+#          result["speech"].                                               #
+############################################################################
+
+
+class ActionResult(object):
+    """
+    The outcome of an action's do_action or do_slot.
+
+        return ActionResult(speech=text, context_out=[...])
+    """
+    __slots__ = ("speech", "display_text", "context_out")
+
+    FIELDS = {"speech": "speech", "displayText": "display_text", "contextOut": "context_out"}
+    """The response field names (as in the webhook response) of each attribute"""
+
+    def __init__(self, speech=None, context_out=None, display_text=None):
+        """
+        :param speech: str - the text to speak
+        :param context_out: list - the contexts to set
+        :param display_text: str - the text to display, if not the speech
+        """
+        self.speech = speech
+        self.display_text = speech if display_text is None else display_text
+        self.context_out = context_out
+
+    def __getitem__(self, name):
+        return getattr(self, self.FIELDS[name])
+
+    def __repr__(self):
+        return "ActionResult({!r})".format(self.as_dict())
+
+    def as_dict(self):
+        """Return the result as a dictionary of response fields."""
+        return {"contextOut": self.context_out, "speech": self.speech, "displayText": self.display_text}
@@ -0,0 +1,345 @@
+############################################################################
+# Module: AdmissionControl.py                                              #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Sheds webhook requests which cannot be answered in time, rather #
+#          than doing work nobody will receive. Each worker process runs   #
+#          at most a limited number of actions at once; the limit starts   #
+#          at ADMISSION_MAX_CONCURRENCY and adapts to the game server,     #
+#          falling when requests spend longer than                         #
+#          ADMISSION_TARGET_LATENCY waiting for it and rising again while  #
+#          they do not. A request beyond the limit waits, slot filling     #
+#          first and new games last. A request whose deadline leaves too   #
+#          little time to run its action - judged by how long actions have #
+#          been taking - is shed at once, or as soon as that happens while #
+#          it waits, and is given the game server unavailable speech. The  #
+#          time a request waits is reported, including, when a proxy sends #
+#          X-Request-Start, the time it spent in the server's backlog,     #
+#          which is also taken off its deadline.                           #
+############################################################################
+
+import heapq
+import logging
+import threading
+import time
+
+from Utilities.CircuitBreaker import CircuitBreaker
+from Utilities.Metrics import Metrics
+from Utilities.RequestTimer import RequestTimer
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(IOError):
+    """Raised when a request is shed. Its text is the speech returned to the user."""
+
+    def __init__(self, reason="deadline"):
+        super(Overloaded, self).__init__(CircuitBreaker.UNAVAILABLE_TEXT)
+        self.reason = reason
+
+
+class AdmissionControl(object):
+    """
+    The actions running in a worker process. The webhook enters a ticket around each action:
+
+        with AdmissionControl.default().admit(priority=priority):
+            ... action.do_action(...) ...
+
+    admit() waits for a place (see claim() for the asyncio webhook) and raises Overloaded if
+    the request is shed.
+    """
+    PRIORITIES = ("slot_filling", "default", "new_game")
+    """Priority classes, highest first: filling a slot, playing (e.g. a guess), starting a game"""
+
+    HEADER = "X-Request-Start"
+    """The header in which a proxy sends the time it received a request"""
+
+    DEFAULT_MAX_CONCURRENCY = 32
+    DEFAULT_MIN_CONCURRENCY = 2
+    DEFAULT_TARGET_LATENCY = 1.0
+
+    DECREASE = 0.75
+    """The fraction of the limit kept when requests are waiting too long for the game server"""
+
+    SMOOTHING = 0.2
+    """The weight of the latest action in the moving average of action durations"""
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, min_concurrency=DEFAULT_MIN_CONCURRENCY,
+                 target_latency=DEFAULT_TARGET_LATENCY):
+        """
+        :param max_concurrency: int - the most actions run at once; 0 turns admission control off
+        :param min_concurrency: int - the limit is never reduced below this
+        :param target_latency: float - the seconds of game server time per request above which
+        the limit is reduced
+        """
+        self.enabled = int(max_concurrency) > 0
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.min_concurrency = min(max(int(min_concurrency), 1), self.max_concurrency)
+        self.target_latency = float(target_latency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.service_time = 0.0
+        self.completed = 0
+        self._waiters = []
+        self._sequence = 0
+        self._decreased = 0.0
+        self._lock = threading.Lock()
+        Metrics.add_collector(self.collect_metrics)
+
+    @classmethod
+    def default(cls):
+        """
+        Return the process-wide admission control, created from the ADMISSION_* settings on
+        first use.
+        :return: AdmissionControl
+        """
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    settings = Settings.current()
+                    cls._default = cls(
+                        max_concurrency=settings.admission_max_concurrency,
+                        min_concurrency=settings.admission_min_concurrency,
+                        target_latency=settings.admission_target_latency
+                    )
+        return cls._default
+
+    @staticmethod
+    def priority(slot_filling=False, action=None):
+        """
+        Return the priority class of a request: slot filling, then requests for a game in
+        progress, then requests starting a game (see AbstractAction.starts_game).
+        """
+        if slot_filling:
+            return "slot_filling"
+        if getattr(action, "starts_game", False):
+            return "new_game"
+        return "default"
+
+    @staticmethod
+    def backlog(header=None):
+        """
+        Return (and report) the seconds since a proxy received a request, from its
+        X-Request-Start header ("t=<time>" or "<time>", in seconds, milliseconds or
+        microseconds since the epoch), or 0.0 if the header is missing or cannot be read.
+        """
+        if not header:
+            return 0.0
+        try:
+            received = float(header.strip().split("t=", 1)[-1])
+        except ValueError:
+            return 0.0
+        if received > 1e14:
+            received /= 1e6
+        elif received > 1e11:
+            received /= 1e3
+        # Clocks may differ a little between the proxy and the worker.
+        seconds = max(time.time() - received, 0.0)
+        Metrics.observe("cowbull_webhook_backlog_seconds", seconds)
+        return seconds
+
+    def admit(self, priority="default", deadline=None):
+        """
+        Wait for a place for the request, for as long as its deadline allows.
+        :param priority: str - one of PRIORITIES
+        :param deadline: Deadline - the request's deadline, if any
+        :raises Overloaded: if the request is shed
+        :return: _Ticket - to be entered around the action
+        """
+        ticket = self.claim(priority=priority, deadline=deadline)
+        if not ticket.admitted:
+            ticket.event.wait(self.wait_timeout(deadline))
+            self.settle(ticket)
+        return ticket
+
+    def claim(self, priority="default", deadline=None, wake=None):
+        """
+        The non-blocking part of admit(), for the asyncio webhook: return a ticket which is
+        either admitted or queued. A queued ticket is admitted when wake() (or, without wake,
+        ticket.event.set()) is called, from any thread; the caller then waits no longer than
+        wait_timeout() before calling settle().
+        :raises Overloaded: if the request is shed at once
+        :return: _Ticket
+        """
+        ticket = _Ticket(self, priority, deadline, wake)
+        if not self.enabled:
+            ticket.admitted = True
+            return ticket
+        with self._lock:
+            # An idle worker runs any request with time left, so that it learns when actions
+            # speed up again.
+            if deadline is not None:
+                remaining = deadline.remaining()
+                if remaining <= 0 or (self.in_flight and remaining < self.service_time):
+                    self._shed(priority, "deadline")
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                ticket.admitted = True
+                ticket.started = time.time()
+            else:
+                self._sequence += 1
+                ticket.sequence = self._sequence
+                heapq.heappush(self._waiters, ticket)
+        if ticket.admitted:
+            self._record_wait(ticket)
+        return ticket
+
+    def settle(self, ticket=None):
+        """
+        Finish waiting for a queued ticket: leave the queue, and shed the request, if it was not
+        admitted meanwhile.
+        :raises Overloaded: if the request is shed
+        """
+        with self._lock:
+            # A ticket left in the queue is skipped when it reaches the front.
+            ticket.cancelled = ticket.cancelled or not ticket.admitted
+        self._record_wait(ticket)
+        if ticket.cancelled:
+            self._shed(ticket.priority, "queue")
+
+    def abandon(self, ticket=None):
+        """
+        Give up a queued ticket whose request was cancelled (e.g. the asyncio webhook's client
+        went away) without settling it: its place, if it was given one, is passed on.
+        """
+        with self._lock:
+            ticket.cancelled = not ticket.admitted
+            if ticket.admitted:
+                self.in_flight -= 1
+                self._wake()
+
+    def wait_timeout(self, deadline=None):
+        """
+        Return the seconds a queued request may wait: while its deadline leaves time to run the
+        action (None, i.e. indefinitely, without a deadline).
+        """
+        if deadline is None:
+            return None
+        return max(deadline.remaining() - self.service_time, 0.0)
+
+    @staticmethod
+    def _shed(priority=None, reason="deadline"):
+        Metrics.inc("cowbull_admission_shed_total", priority=priority, reason=reason)
+        logger.debug("AdmissionControl: Shed a %s request (%s)", priority, reason)
+        raise Overloaded(reason)
+
+    @staticmethod
+    def _record_wait(ticket=None):
+        Metrics.observe("cowbull_admission_wait_seconds", time.time() - ticket.queued,
+                        priority=ticket.priority)
+
+    def release(self, ticket=None, upstream=0.0):
+        """
+        Give up the place of a request whose action has finished, and adapt the limit.
+        :param ticket: _Ticket - the request's admitted ticket
+        :param upstream: float - the seconds it spent waiting for the game server
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            duration = now - ticket.started
+            self.completed += 1
+            if self.completed == 1:
+                self.service_time = duration
+            else:
+                self.service_time += self.SMOOTHING * (duration - self.service_time)
+
+            if upstream > self.target_latency:
+                # Reduce the limit at most once per target latency, so the requests already
+                # running when the game server slowed down do not each reduce it.
+                if now - self._decreased >= self.target_latency:
+                    self.limit = max(self.limit * self.DECREASE, float(self.min_concurrency))
+                    self._decreased = now
+            elif saturated:
+                # Raise the limit by one per limit's worth of requests answered in time.
+                self.limit = min(self.limit + 1.0 / self.limit, float(self.max_concurrency))
+
+            self._wake()
+
+    def _wake(self):
+        # Admit the highest priority waiters (the earliest of each) while there is room.
+        while self._waiters and self.in_flight < int(self.limit):
+            ticket = heapq.heappop(self._waiters)
+            if ticket.cancelled:
+                continue
+            if ticket.deadline is not None and ticket.deadline.remaining() < self.service_time:
+                # Too late to be answered in time now; it is shed when it wakes.
+                ticket.cancelled = True
+                ticket.wake()
+                continue
+            ticket.admitted = True
+            ticket.started = time.time()
+            self.in_flight += 1
+            ticket.wake()
+
+    def collect_metrics(self):
+        """Metrics collector (see Utilities.Metrics) reporting the limit and the requests running
+        and waiting."""
+        if not self.enabled:
+            return []
+        return [
+            ("cowbull_admission_limit", {}, int(self.limit)),
+            ("cowbull_admission_in_flight", {}, self.in_flight),
+            ("cowbull_admission_waiting", {}, len([w for w in self._waiters if not w.cancelled])),
+        ]
+
+
+class _Ticket(object):
+    """A request's place (or place in the queue), released when the action exits."""
+    __slots__ = ("control", "priority", "deadline", "rank", "sequence", "queued", "started",
+                 "admitted", "cancelled", "event", "callback")
+
+    def __init__(self, control=None, priority="default", deadline=None, callback=None):
+        self.control = control
+        self.priority = priority
+        self.deadline = deadline
+        self.rank = AdmissionControl.PRIORITIES.index(priority)
+        self.sequence = 0
+        self.queued = time.time()
+        self.started = None
+        self.admitted = False
+        self.cancelled = False
+        self.event = threading.Event() if callback is None else None
+        self.callback = callback
+
+    def __lt__(self, other):
+        # Queued by priority, and then in order of arrival.
+        return (self.rank, self.sequence) < (other.rank, other.sequence)
+
+    def wake(self):
+        if self.callback is not None:
+            self.callback()
+        else:
+            self.event.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        timer = RequestTimer.current()
+        self.control.release(self, upstream=timer.upstream if timer is not None else 0.0)
+        return False
+
+
+Metrics.describe("cowbull_admission_limit", "gauge",
+                 "Actions each worker process runs at once (adapted to the game server; the mean of "
+                 "the workers)", aggregate="mean")
+Metrics.describe("cowbull_admission_in_flight", "gauge", "Actions running in the worker processes",
+                 aggregate="sum")
+Metrics.describe("cowbull_admission_waiting", "gauge",
+                 "Requests waiting to run their action in the worker processes", aggregate="sum")
+Metrics.describe("cowbull_admission_wait_seconds", "histogram",
+                 "Time requests waited to run their action, by priority")
+Metrics.describe("cowbull_admission_shed_total", "counter",
+                 "Requests shed as they could not be answered before their deadline, by priority and "
+                 "reason: deadline (on arrival) or queue (while waiting)")
+Metrics.describe("cowbull_webhook_backlog_seconds", "histogram",
+                 "Time requests spent queued before reaching a worker (from the X-Request-Start header)")
@@ -0,0 +1,99 @@
+############################################################################
+# Module: AsyncFanOut.py                                                   #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: The asyncio counterpart of Utilities.FanOut, used by the        #
+#          asyncio actions (Controller.Async). Each call is a task, which  #
+#          inherits the request's deadline; a call whose result is not     #
+#          wanted is cancelled, even while it is waiting for the game      #
+#          server. Call durations are reported as by FanOut. Requires      #
+#          Python 3.5+.                                                    #
+############################################################################
+
+import asyncio
+import logging
+import time
+
+from Utilities.FanOut import FanOut
+from Utilities.RequestTimer import RequestTimer
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFanOut(object):
+    """
+    The concurrent calls of one asyncio action.
+
+        async with AsyncFanOut(action="NewGame") as fan_out:
+            modes = fan_out.call("modes", fetch_modes())
+            game = fan_out.call("game", fetch_game(mode))
+            if not valid(mode, await modes.result()):
+                raise ValueError(...)       # the game is cancelled
+            return output(await game.result())
+    """
+
+    def __init__(self, action="unknown"):
+        self.action = action
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        for call in self.calls:
+            call.cancel()
+        return False
+
+    def call(self, name=None, coroutine=None):
+        """
+        Start a coroutine, a game server call, as a task.
+        :param name: str - the call's name, for the metrics
+        :return: _AsyncFanOutCall
+        """
+        call = _AsyncFanOutCall(asyncio.ensure_future(self._run(name, coroutine)))
+        self.calls.append(call)
+        return call
+
+    async def _run(self, name=None, coroutine=None):
+        # The time the request waits for the call is added to its upstream time by result().
+        RequestTimer.detach()
+        started = time.time()
+        outcome = "error"
+        try:
+            value = await coroutine
+            outcome = "used"
+            return value
+        except asyncio.CancelledError:
+            outcome = "ignored"
+            logger.debug("AsyncFanOut: Cancelled %s.%s", self.action, name)
+            raise
+        finally:
+            FanOut.record(self.action, name, outcome, time.time() - started)
+
+
+class _AsyncFanOutCall(object):
+    """A call made by AsyncFanOut.call()."""
+    __slots__ = ("task",)
+
+    def __init__(self, task=None):
+        self.task = task
+
+    async def result(self):
+        """
+        Wait for the call and return its result.
+        :raises: whatever the call raised
+        """
+        waited = time.time()
+        try:
+            return await self.task
+        finally:
+            RequestTimer.add_upstream(time.time() - waited)
+
+    def cancel(self):
+        """Cancel the call if it has not finished."""
+        if not self.task.done():
+            self.task.cancel()
+        elif not self.task.cancelled():
+            # Retrieved, so that a failure nobody waited for is not logged as unhandled.
+            self.task.exception()
@@ -0,0 +1,182 @@
+############################################################################
+# Module: AsyncHttpClient.py                                               #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Non-blocking game server client used by the asyncio entry       #
+#          point (async_app.py). It mirrors Helpers.execute_get_request    #
+#          and Helpers.execute_post_request, including the error text      #
+#          reported to the user, but awaits the game server instead of     #
+#          blocking a worker. Requires Python 3.5+ and aiohttp.            #
+############################################################################
+
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from Utilities.BackendRouter import BackendRouter
+from Utilities.CircuitBreaker import CircuitBreaker
+from Utilities.Deadline import Deadline
+from Utilities.GameEngine import GameEngine
+from Utilities.Helpers import Helpers
+from Utilities.HttpClient import HttpClient
+from Utilities.JsonCodec import JsonCodec
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHttpClient(object):
+    """
+    Holder of a pooled aiohttp.ClientSession shared by every coroutine in the process. The
+    session is created on first use inside the running event loop and closed by close(),
+    which async_app.py registers as an application cleanup handler.
+    """
+    _session = None
+
+    DEFAULT_POOL_MAXSIZE = 100
+    RETRY_STATUSES = (502, 503, 504)
+
+    @classmethod
+    def session(cls):
+        if cls._session is None or cls._session.closed:
+            settings = Settings.current()
+            connect_timeout, read_timeout = settings.timeout
+            pool_maxsize = settings.async_pool_maxsize
+
+            logger.debug("AsyncHttpClient: Creating pooled session (pool size %s)", pool_maxsize)
+            cls._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, limit_per_host=pool_maxsize),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+            )
+        return cls._session
+
+    @classmethod
+    async def close(cls, *args):
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+
+    @staticmethod
+    def _timeout():
+        # The configured timeouts, capped at the time left before the request's deadline.
+        connect_timeout, read_timeout = Deadline.timeout(*HttpClient.timeout())
+        deadline = Deadline.current()
+        return aiohttp.ClientTimeout(
+            total=deadline.remaining() if deadline is not None else None,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+
+    @classmethod
+    async def execute_get_request(cls, url=None):
+        # The embedded engine never blocks on the network, so it is called directly.
+        if GameEngine.handles(url):
+            return Helpers.execute_embedded_request(method="GET", url=url)
+
+        retries = HttpClient.get_retries()
+
+        # As with the pooled synchronous client, GETs are retried on connection errors and
+        # 502/503/504 responses with a short backoff.
+        backend = BackendRouter.for_url(url)
+        breaker = CircuitBreaker.for_endpoint(Helpers.breaker_name(method="GET", url=url, backend=backend))
+        attempt = 0
+        while True:
+            timeout = cls._timeout()
+            breaker.before()
+            if backend is not None:
+                backend.begin()
+            started = time.time()
+            recorded = False
+            try:
+                logger.debug("AsyncHttpClient: Connecting to %s", url)
+                async with cls.session().get(url, timeout=timeout) as r:
+                    Metrics.upstream(url=url, method="GET", status=r.status, started=started)
+                    success = not CircuitBreaker.is_failure_status(r.status)
+                    breaker.record(success=success, duration=time.time() - started)
+                    if backend is not None:
+                        backend.end(duration=time.time() - started, success=success)
+                    recorded = True
+                    if r.status in cls.RETRY_STATUSES and attempt < retries:
+                        raise aiohttp.ClientResponseError(
+                            r.request_info, r.history, status=r.status
+                        )
+                    if r.status != 200:
+                        raise IOError(Helpers.game_error_text(r.status))
+                    return JsonCodec.loads(await r.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not isinstance(e, aiohttp.ClientResponseError):
+                    breaker.record(success=False)
+                    if backend is not None:
+                        backend.end(success=False)
+                    Metrics.upstream(url=url, method="GET", status="error", started=started)
+                if attempt >= retries:
+                    raise IOError("Game reported an exception: {}".format(repr(e)))
+            except asyncio.CancelledError:
+                if not recorded:
+                    cls._abandon(breaker, backend)
+                raise
+            attempt += 1
+            await asyncio.sleep(HttpClient.DEFAULT_RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+    @classmethod
+    async def execute_post_request(cls, url=None, data=None, headers=None):
+        if headers is not None and not isinstance(headers, dict):
+            raise TypeError("Headers supplied as a {}; it must be a dict".format(type(headers)))
+        if data is not None and not isinstance(data, dict):
+            raise TypeError("Data supplied as a {}; it must be a dict".format(type(data)))
+
+        if not headers:
+            headers = {"Content-Type": "application/json"}
+
+        if not (headers.get("content-type") or headers.get("Content-Type")):
+            headers["Content-Type"] = "application/json"
+
+        if GameEngine.handles(url):
+            return Helpers.execute_embedded_request(method="POST", url=url, data=data)
+
+        # A POST makes a guess, so it is never retried.
+        timeout = cls._timeout()
+        backend = BackendRouter.for_url(url)
+        breaker = CircuitBreaker.for_endpoint(Helpers.breaker_name(method="POST", url=url, backend=backend))
+        breaker.before()
+        if backend is not None:
+            backend.begin()
+        started = time.time()
+        recorded = False
+        try:
+            logger.debug("AsyncHttpClient: Connecting to %s", url)
+            async with cls.session().post(url, data=JsonCodec.dumpb(data), headers=headers, timeout=timeout) as r:
+                Metrics.upstream(url=url, method="POST", status=r.status, started=started)
+                success = not CircuitBreaker.is_failure_status(r.status)
+                breaker.record(success=success, duration=time.time() - started)
+                if backend is not None:
+                    backend.end(duration=time.time() - started, success=success)
+                recorded = True
+                if r.status != 200:
+                    json_output = JsonCodec.loads(await r.read()) if r.status == 400 else None
+                    raise IOError(Helpers.game_error_text(r.status, json_output=json_output))
+                return JsonCodec.loads(await r.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            breaker.record(success=False)
+            if backend is not None:
+                backend.end(success=False)
+            Metrics.upstream(url=url, method="POST", status="error", started=started)
+            raise IOError("Game reported an exception: {}".format(repr(e)))
+        except ValueError as e:
+            raise IOError("Game reported an exception: {}".format(repr(e)))
+        except asyncio.CancelledError:
+            if not recorded:
+                cls._abandon(breaker, backend)
+            raise
+
+    @staticmethod
+    def _abandon(breaker=None, backend=None):
+        # A call cancelled before its result was recorded (e.g. by Utilities.AsyncFanOut)
+        # releases the breaker's probe and the backend's count of calls in flight.
+        breaker.abandon()
+        if backend is not None:
+            backend.abandon()
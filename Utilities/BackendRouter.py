@@ -0,0 +1,335 @@
+############################################################################
+# Module: BackendRouter.py                                                 #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Spreads games across several game servers (COWBULL_BACKENDS, a  #
+#          comma separated list of URL templates like COWBULL_URL). A new  #
+#          game, or the game modes, comes from the backend expected to     #
+#          answer soonest (COWBULL_ROUTING): ewma - the lowest moving      #
+#          average latency, weighted by the calls it already has in        #
+#          flight - or least_outstanding - the fewest calls in flight.     #
+#          A game lives on the backend which created it, so the backend's  #
+#          id is kept in the key context next to the game key and every    #
+#          guess is sent there, whichever worker or instance handles it. A #
+#          background thread checks each backend's health (GET modes)      #
+#          every COWBULL_HEALTH_INTERVAL seconds; unhealthy backends are   #
+#          not given new games. With fewer than two backends there is no   #
+#          routing and COWBULL_URL is used as before.                      #
+############################################################################
+
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class Backend(object):
+    """
+    A game server, its rendered URLs and what the router has learned about it: its latency
+    (an exponentially weighted moving average), the calls in flight and its health.
+    """
+    ALPHA = 0.3
+    """The weight of the latest call in the moving average latency"""
+
+    FAILURE_THRESHOLD = 3
+    """Consecutive failed calls after which the backend is unhealthy until its next health check"""
+
+    def __init__(self, url=None):
+        self.url = url
+        self.id = self.backend_id(url)
+        self.prefix = url.split("{}", 1)[0]
+        self.modes_url = url.format("modes")
+        self.game_url = url.format("game")
+        self.new_game_url = self.game_url + "?mode="
+
+        self.latency = None
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def backend_id(url=None):
+        """
+        Return the backend's id: a digest of its URL template, so every worker and instance
+        configured with the same backend gives it the same id (whatever the order of the list).
+        """
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()[:8]
+
+    @property
+    def host(self):
+        return self.prefix.split("://", 1)[-1].split("/", 1)[0]
+
+    def begin(self):
+        """Record the start of a call."""
+        with self._lock:
+            self.outstanding += 1
+
+    def end(self, duration=0.0, success=True):
+        """Record the end of a call (begun with begin()), its duration and whether it succeeded."""
+        with self._lock:
+            self.outstanding = max(self.outstanding - 1, 0)
+            self._observe(duration, success)
+
+    def abandon(self):
+        """Record the end of a call (begun with begin()) which was cancelled before its result."""
+        with self._lock:
+            self.outstanding = max(self.outstanding - 1, 0)
+
+    def checked(self, duration=0.0, success=True):
+        """Record the result of a health check."""
+        with self._lock:
+            self._observe(duration, success)
+            self.healthy = success
+            if success:
+                self.failures = 0
+
+    def _observe(self, duration, success):
+        if success:
+            self.failures = 0
+            self.latency = duration if self.latency is None else \
+                self.ALPHA * duration + (1 - self.ALPHA) * self.latency
+        else:
+            self.failures += 1
+            if self.failures >= self.FAILURE_THRESHOLD and self.healthy:
+                self.healthy = False
+                logger.warning("BackendRouter: %s is unhealthy after %s failed calls", self.url, self.failures)
+
+    def score(self, routing="ewma"):
+        """Return the backend's score for a new game; the lowest score is chosen."""
+        if routing == "least_outstanding":
+            return self.outstanding, self.latency or 0.0
+        # A backend not yet measured scores 0, so it is tried straight away.
+        return (self.latency or 0.0) * (self.outstanding + 1), self.outstanding
+
+
+class BackendRouter(object):
+    """
+    The process-wide router, built from the COWBULL_BACKENDS setting (see default()). Use
+    candidates() to choose where to create a game, pinned() to find the backend of a game, and
+    for_url() to find the backend a game server call goes to.
+    """
+    ROUTING = ("ewma", "least_outstanding")
+
+    FAILOVER_ATTEMPTS = 2
+    """Backends tried, best first, for a call which may go to any backend"""
+
+    EXPLORE = 0.05
+    """
+    Fraction of calls sent to a healthy backend at random, so that a backend which was slow
+    once (e.g. while opening its first connection) is measured again and can win back traffic
+    """
+
+    _default = None
+    _built = False
+    _default_lock = threading.Lock()
+
+    def __init__(self, urls=None, routing="ewma", health_interval=5.0, primary=None):
+        """
+        :param urls: list - the backends' URL templates
+        :param routing: str - ewma or least_outstanding
+        :param health_interval: float - seconds between health checks (0: no health checks)
+        :param primary: str - the URL template of the backend for games with no backend id
+        """
+        if routing not in self.ROUTING:
+            raise ValueError("The routing (COWBULL_ROUTING) must be one of {}, not {}".format(
+                ", ".join(self.ROUTING), routing))
+        self.backends = [Backend(url) for url in urls]
+        self.by_id = dict((backend.id, backend) for backend in self.backends)
+        self.routing = routing
+        self.health_interval = float(health_interval)
+        self.primary = self.by_id.get(Backend.backend_id(primary)) if primary else None
+        self.primary = self.primary or self.backends[0]
+        self._pid = None
+        self._stopped = threading.Event()
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def default(cls):
+        """
+        Return the process-wide router, built from the settings on first use, or None if fewer
+        than two backends are configured (or the game engine is embedded).
+        :return: BackendRouter
+        """
+        if cls._built:
+            return cls._default
+
+        with cls._default_lock:
+            if not cls._built:
+                settings = Settings.current()
+                urls = cls.parse_backends(settings.cowbull_backends)
+                if len(urls) > 1 and settings.cowbull_engine != "embedded":
+                    cls._default = cls(
+                        urls=urls,
+                        routing=settings.cowbull_routing,
+                        health_interval=settings.cowbull_health_interval,
+                        primary=settings.cowbull_url
+                    )
+                    logger.info("BackendRouter: Routing games across %s backends by %s",
+                                len(urls), settings.cowbull_routing)
+                cls._built = True
+        return cls._default
+
+    @staticmethod
+    def parse_backends(backends=None):
+        """Parse a COWBULL_BACKENDS setting into a list of URL templates."""
+        return [url.strip() for url in (backends or "").split(",") if url.strip()]
+
+    @classmethod
+    def candidates(cls, attempts=FAILOVER_ATTEMPTS):
+        """
+        Return the backends to try, best first, for a call which may go to any backend (a new
+        game, or the modes). Without routing this is [None]: use the COWBULL_URL settings.
+        :return: list
+        """
+        router = cls.default()
+        if router is None:
+            return [None]
+        return router.ranked()[:attempts]
+
+    @classmethod
+    def failover(cls, call=None):
+        """
+        Return call(backend) from the first of the candidates() for which it does not raise
+        IOError (the error of a game server call); if it fails on every one, raise the last error.
+        """
+        candidates = cls.candidates()
+        for attempt, backend in enumerate(candidates, 1):
+            try:
+                return call(backend)
+            except IOError as e:
+                if attempt == len(candidates):
+                    raise
+                logger.warning("BackendRouter: %s failed (%s); trying another backend", backend.url, e)
+
+    @classmethod
+    def pinned(cls, backend_id=None):
+        """
+        Return the backend of a game, given the backend id kept with its key, or None without
+        routing. A game with no (or an unknown) backend id is taken to be on the primary
+        backend, COWBULL_URL.
+        :return: Backend
+        """
+        router = cls.default()
+        if router is None:
+            return None
+        backend = router.by_id.get(backend_id)
+        if backend is None:
+            if backend_id:
+                logger.warning("BackendRouter: No backend has the id %s; using %s",
+                               backend_id, router.primary.url)
+            backend = router.primary
+        return backend
+
+    @classmethod
+    def for_url(cls, url=None):
+        """Return the backend a game server URL belongs to, or None (e.g. without routing)."""
+        router = cls._default if cls._built else cls.default()
+        if router is None:
+            return None
+        router.start()
+        for backend in router.backends:
+            if url.startswith(backend.prefix):
+                return backend
+        return None
+
+    @classmethod
+    def reset(cls):
+        """Discard the router; the next call to default() builds one from the settings."""
+        with cls._default_lock:
+            if cls._default is not None:
+                cls._default.stop()
+            cls._default = None
+            cls._built = False
+
+    def ranked(self):
+        """
+        Return the backends, healthy first, each group best score first (ties at random) - or,
+        for EXPLORE of calls, each group in random order.
+        """
+        self.start()
+        if random.random() < self.EXPLORE:
+            return sorted(self.backends, key=lambda backend: (not backend.healthy, random.random()))
+        return sorted(self.backends, key=lambda backend: (
+            not backend.healthy, backend.score(self.routing), random.random()))
+
+    def start(self):
+        """Start the health check thread for this process."""
+        pid = os.getpid()
+        if self._pid == pid or self.health_interval <= 0:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+        t = threading.Thread(target=self._check_forever, name="backend-health")
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def check(self):
+        """Check the health of every backend (GET modes)."""
+        # Imported here, as in Utilities.Warmup, so the router does not pull in the client stack.
+        from Utilities.HttpClient import HttpClient
+
+        for backend in self.backends:
+            started = time.time()
+            try:
+                r = HttpClient.session().get(backend.modes_url, timeout=HttpClient.timeout())
+                success = r.status_code == 200
+            except Exception as e:
+                logger.debug("BackendRouter: Health check of %s failed: %s", backend.url, e)
+                success = False
+            was_healthy = backend.healthy
+            backend.checked(duration=time.time() - started, success=success)
+            if backend.healthy != was_healthy:
+                logger.warning("BackendRouter: %s is %s", backend.url,
+                               "healthy" if backend.healthy else "unhealthy")
+
+    def _check_forever(self):
+        pid = os.getpid()
+        while self._pid == pid and not self._stopped.is_set():
+            self.check()
+            self._stopped.wait(self.health_interval)
+
+    @classmethod
+    def collect_metrics(cls):
+        """Metrics collector (see Utilities.Metrics) reporting each backend's state."""
+        router = cls._default
+        if router is None:
+            return []
+        samples = []
+        for backend in router.backends:
+            labels = {"backend": backend.host, "id": backend.id}
+            samples.append(("cowbull_backend_healthy", labels, 1 if backend.healthy else 0))
+            samples.append(("cowbull_backend_outstanding", labels, backend.outstanding))
+            samples.append(("cowbull_backend_latency_seconds", labels, backend.latency or 0.0))
+        return samples
+
+    @classmethod
+    def _settings_changed(cls, previous=None, settings=None):
+        """Settings listener: rebuild the router when the backends or routing change."""
+        changed = previous.changed(settings)
+        if set(changed) & {"cowbull_backends", "cowbull_routing", "cowbull_health_interval",
+                           "cowbull_url", "cowbull_engine"}:
+            cls.reset()
+
+
+Metrics.describe("cowbull_backend_healthy", "gauge", "Whether each game server backend is healthy",
+                 aggregate="max")
+Metrics.describe("cowbull_backend_outstanding", "gauge", "Game server calls in flight per backend",
+                 aggregate="sum")
+Metrics.describe("cowbull_backend_latency_seconds", "gauge",
+                 "Moving average latency of each game server backend", aggregate="mean")
+Metrics.add_collector(BackendRouter.collect_metrics)
+Settings.add_listener(BackendRouter._settings_changed)
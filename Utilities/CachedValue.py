@@ -0,0 +1,169 @@
+############################################################################
+# Module: CachedValue.py                                                   #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: An in-process, thread-safe cache for a single value which is    #
+#          expensive to fetch (e.g. the game modes from the game server).  #
+#          The value is served fresh for ttl seconds, then served stale    #
+#          for up to stale_ttl seconds while ONE thread refreshes it in    #
+#          the background (stale-while-revalidate). Once the stale window  #
+#          has passed, the first caller loads it and every other caller    #
+#          waits for that result (single-flight) - for no longer than its  #
+#          own request's deadline, after which it is given the stale value #
+#          if there is one.                                                #
+############################################################################
+
+import logging
+import threading
+import time
+
+from Utilities.Deadline import Deadline
+from Utilities.Metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class CachedValue(object):
+    """
+    Cache a single value returned by loader, a callable taking no arguments.
+
+    ttl: seconds for which the value is considered fresh.
+    stale_ttl: further seconds for which the stale value is returned while a background
+    refresh runs. Set to 0 to always refresh synchronously.
+    """
+
+    def __init__(self, loader=None, ttl=300, stale_ttl=60, name=None):
+        if loader is None or not callable(loader):
+            raise TypeError("CachedValue must be passed a callable loader")
+
+        self.loader = loader
+        self.ttl = float(ttl)
+        self.stale_ttl = float(stale_ttl)
+        self.name = name or getattr(loader, "__name__", "value")
+
+        self._value = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._loading = None  # threading.Event while a load is in flight
+
+        self.hits = 0
+        self.misses = 0
+        Metrics.add_collector(self.collect_metrics)
+
+    def get(self):
+        """
+        Return the cached value, loading or refreshing it as required.
+        """
+        now = time.time()
+        loaded_at = self._loaded_at
+
+        if loaded_at is not None:
+            age = now - loaded_at
+            if age < self.ttl:
+                with self._lock:
+                    self.hits += 1
+                return self._value
+            if age < self.ttl + self.stale_ttl:
+                with self._lock:
+                    self.hits += 1
+                self._refresh_in_background()
+                return self._value
+
+        with self._lock:
+            self.misses += 1
+        return self._load()
+
+    def collect_metrics(self):
+        """Metrics collector (see Utilities.Metrics) reporting the cache's hits and misses."""
+        return [
+            ("cowbull_cache_requests_total", {"cache": self.name, "result": "hit"}, self.hits),
+            ("cowbull_cache_requests_total", {"cache": self.name, "result": "miss"}, self.misses),
+        ]
+
+    def ready(self):
+        """
+        Return True if get() can return without loading the value, i.e. the value is fresh or
+        within its stale window. Used by callers (such as the asyncio actions) which must not
+        block on a load.
+        """
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.time() - loaded_at < self.ttl + self.stale_ttl
+
+    def set(self, value=None):
+        """
+        Store a value loaded by the caller, e.g. one fetched with a non-blocking client.
+        """
+        with self._lock:
+            self._value = value
+            self._loaded_at = time.time()
+
+    def invalidate(self):
+        """
+        Discard the cached value; the next get() loads it again.
+        """
+        with self._lock:
+            self._value = None
+            self._loaded_at = None
+
+    def _load(self):
+        with self._lock:
+            # Another thread may have completed a load while this one was waiting.
+            if self._loaded_at is not None and time.time() - self._loaded_at < self.ttl:
+                return self._value
+
+            event = self._loading
+            leader = event is None
+            if leader:
+                event = self._loading = threading.Event()
+
+        if not leader:
+            deadline = Deadline.current()
+            if not event.wait(max(deadline.remaining(), 0.0) if deadline is not None else None):
+                # The leader was given its own request's time; this request has less left.
+                with self._lock:
+                    value, loaded_at = self._value, self._loaded_at
+                if loaded_at is not None:
+                    logger.debug("CachedValue: Returning the stale %s while it loads", self.name)
+                    return value
+                raise IOError("The game server could not be reached within {}s".format(deadline.budget))
+            if self._loaded_at is None:
+                # The leader failed; make this caller's own attempt.
+                return self._load()
+            return self._value
+
+        try:
+            logger.debug("CachedValue: Loading %s", self.name)
+            value = self.loader()
+            with self._lock:
+                self._value = value
+                self._loaded_at = time.time()
+            return value
+        finally:
+            with self._lock:
+                self._loading = None
+            event.set()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._loading is not None:
+                return
+            event = self._loading = threading.Event()
+
+        def refresh():
+            try:
+                value = self.loader()
+                with self._lock:
+                    self._value = value
+                    self._loaded_at = time.time()
+            except Exception as e:
+                # Keep serving the stale value; the next expiry will try again.
+                logger.warning("CachedValue: Background refresh of %s failed: %r", self.name, e)
+            finally:
+                with self._lock:
+                    self._loading = None
+                event.set()
+
+        t = threading.Thread(target=refresh, name="refresh-{}".format(self.name))
+        t.daemon = True
+        t.start()
@@ -0,0 +1,158 @@
+############################################################################
+# Module: CircuitBreaker.py                                                #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: A circuit breaker per game server endpoint (e.g. GET modes,     #
+#          POST game). After CIRCUIT_FAILURE_THRESHOLD consecutive         #
+#          failures - errors, 5xx/404 responses or calls slower than       #
+#          CIRCUIT_SLOW_CALL seconds - the breaker opens and calls fail    #
+#          immediately with a friendly message instead of tying up a       #
+#          worker. After CIRCUIT_RESET_TIMEOUT seconds one probe call is   #
+#          let through (half open); if it succeeds the breaker closes.     #
+############################################################################
+
+import logging
+import threading
+import time
+
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpen(IOError):
+    """Raised instead of a call while a breaker is open. Its text is the speech returned to the
+    user."""
+
+
+class CircuitBreaker(object):
+    """
+    A thread-safe circuit breaker. Use for_endpoint() to get the process-wide breaker for a
+    game server endpoint, call before() ahead of the call, and record() with its result.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    UNAVAILABLE_TEXT = "Oh shoot! It appears that the game server isn't available."
+    """The speech returned while the breaker is open"""
+
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_RESET_TIMEOUT = 10.0
+    DEFAULT_SLOW_CALL = 2.0
+
+    _breakers = {}
+    _breakers_lock = threading.Lock()
+
+    def __init__(self, name=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT, slow_call=DEFAULT_SLOW_CALL):
+        self.name = name
+        self.failure_threshold = int(failure_threshold)
+        self.reset_timeout = float(reset_timeout)
+        self.slow_call = float(slow_call)
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_endpoint(cls, name=None):
+        """
+        Return the process-wide breaker for the named endpoint, creating it from the
+        CIRCUIT_* settings on first use.
+        """
+        breaker = cls._breakers.get(name)
+        if breaker is not None:
+            return breaker
+
+        settings = Settings.current()
+        with cls._breakers_lock:
+            breaker = cls._breakers.get(name)
+            if breaker is None:
+                breaker = cls._breakers[name] = cls(
+                    name=name,
+                    failure_threshold=settings.circuit_failure_threshold,
+                    reset_timeout=settings.circuit_reset_timeout,
+                    slow_call=settings.circuit_slow_call
+                )
+        return breaker
+
+    def before(self):
+        """
+        Call before making the call.
+        :raises CircuitOpen: with UNAVAILABLE_TEXT if the breaker is open (or a probe is already
+        in flight while half open).
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                logger.info("CircuitBreaker: %s is half open; probing", self.name)
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpen(self.UNAVAILABLE_TEXT)
+
+    def record(self, success=True, duration=0.0):
+        """
+        Record the result of a call. A successful call slower than slow_call counts as a failure.
+        """
+        failed = not success or duration > self.slow_call
+        with self._lock:
+            self._probing = False
+            if not failed:
+                if self.state != self.CLOSED:
+                    logger.info("CircuitBreaker: %s is closed", self.name)
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("CircuitBreaker: %s is open after %s failure(s)", self.name, self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+    def abandon(self):
+        """
+        Record that a call was cancelled before its result was known (see Utilities.AsyncFanOut):
+        it counts as neither a success nor a failure, but no longer holds the half-open probe.
+        """
+        with self._lock:
+            self._probing = False
+
+    @staticmethod
+    def is_failure_status(status_code=None):
+        """Return True if a game server response status indicates the server is unhealthy."""
+        return status_code >= 500 or status_code == 404
+
+    @classmethod
+    def collect_metrics(cls):
+        """Metrics collector (see Utilities.Metrics) reporting each breaker's state."""
+        samples = []
+        for name, breaker in list(cls._breakers.items()):
+            for state in (cls.CLOSED, cls.OPEN, cls.HALF_OPEN):
+                samples.append(("cowbull_circuit_breaker_state", {"endpoint": name, "state": state},
+                                1 if breaker.state == state else 0))
+            samples.append(("cowbull_circuit_breaker_rejected_total", {"endpoint": name}, breaker.rejected))
+        return samples
+
+
+Metrics.describe(
+    "cowbull_circuit_breaker_state", "gauge",
+    "Game server circuit breaker state by endpoint (1 for the current state)",
+    aggregate="max"
+)
+Metrics.describe(
+    "cowbull_circuit_breaker_rejected_total", "counter",
+    "Game server calls rejected by an open circuit breaker by endpoint"
+)
+Metrics.add_collector(CircuitBreaker.collect_metrics)
@@ -9,13 +9,23 @@
 #                                                                          #
 # app.config["COWBULL_URL"] would return the setting for COWBULL_URL..     #
 #                                                                          #
+# The validated settings are also published as an immutable, typed        #
+# snapshot (Utilities.Settings), which is replaced whole when CONFIG_FILE  #
+# changes (see Config.watch).                                              #
+#                                                                          #
 ############################################################################
 
 from __future__ import print_function
 import logging  # Use Python's standard logging
 import os       # For getting OS environment variables
 import sys      # For getting the Python version number
+import threading
+import time
 from flask import Flask
+from Utilities.BackendRouter import BackendRouter
+from Utilities.GameEngine import GameEngine
+from Utilities.LogPipeline import LogPipeline
+from Utilities.Settings import Settings
 
 # ConfigParser differs between Python major versions 2 and 3; therefore, check
 # the version being used and import from the correct package.
@@ -34,6 +44,9 @@ class Config(object):
     """
     app = None
     """the representation of the Flask object"""
+    settings = None
+    """the typed snapshot of the settings in force (see Utilities.Settings)"""
+    _watch_pid = None
 
     def __init__(self, app=None):
         """
@@ -50,69 +63,305 @@ class Config(object):
         # Store the Flask object passed to the instantiation
         self.app = app
 
-        # Set any values from env vars. NOTE: Logging format and level are THE ONLY values
+        # Set any values from env vars. NOTE: Logging settings are THE ONLY values
         # to be defaulted. This is to enable Config itself to issue debug statements.
         #
-        self.app.config["LOGGING_FORMAT"] = os.getenv(
+        values = {}
+        values["LOGGING_FORMAT"] = os.getenv(
             "LOGGING_FORMAT",
             "[%(asctime)s] [%(levelname)s]: %(message)s"
         )
-        self.app.config["LOGGING_LEVEL"] = int(os.getenv("LOGGING_LEVEL", 10))
-        logging.basicConfig(
-            level=self.app.config["LOGGING_LEVEL"],
-            format=self.app.config["LOGGING_FORMAT"]
+        values["LOGGING_LEVEL"] = int(os.getenv("LOGGING_LEVEL", logging.INFO))
+        values["LOGGING_LEVELS"] = os.getenv("LOGGING_LEVELS", "")
+        values["LOGGING_ASYNC"] = \
+            os.getenv("LOGGING_ASYNC", "true").lower() not in ("0", "false", "no", "off")
+        values["LOGGING_PAYLOAD_SAMPLE_RATE"] = float(os.getenv("LOGGING_PAYLOAD_SAMPLE_RATE", 1.0))
+        LogPipeline.configure(
+            level=values["LOGGING_LEVEL"],
+            log_format=values["LOGGING_FORMAT"],
+            levels=values["LOGGING_LEVELS"],
+            async_handlers=values["LOGGING_ASYNC"],
+            payload_sample_rate=values["LOGGING_PAYLOAD_SAMPLE_RATE"]
         )
 
-        # Get any env vars for config. NOTE, defaults are None.
-        self.app.config["AGENT_HOST"] = os.getenv("AGENT_HOST", None)
-        self.app.config["AGENT_PORT"] = os.getenv("AGENT_PORT", None)
-        self.app.config["AGENT_DEBUG"] = os.getenv("AGENT_DEBUG", None)
-        self.app.config["COWBULL_URL"] = os.getenv("COWBULL_URL", None)
-
-        # Check if a configuration filename has been set in the OS
-        config_file = os.getenv("CONFIG_FILE", None)
-        if config_file:
-            self._load(filename=config_file)
-
-        self._validate()
+        self._read(values)
+        self._apply(values)
 
-    def _validate(self):
+    def reload(self):
         """
-        Validate ensures that all settings have been configured or defaults them where
-        possible. The only exception which will be raised is if the COWBULL_URL (the URL
-        for the game server) has not been set, as the agent cannot run without it and
-        cannot guess it.
+        Read the settings again (from environment variables and CONFIG_FILE) and, if they are
+        valid, swap them in. The logging settings are not reloaded. A request in flight keeps
+        the snapshot it started with (see Utilities.Settings); pools, caches and breakers
+        already created keep the sizes they were created with.
+        :raises ValueError, TypeError or IOError: if the settings are not valid; the current
+        settings are then left in force.
+        :return: list - the names of the settings which changed
         """
         self._check_app_set()
 
-        logging_level = self.app.config["LOGGING_LEVEL"] or None
-        if not logging_level:
-            self.app.config["LOGGING_LEVEL"] = logging.DEBUG
+        values = dict((key, self.app.config[key]) for key in self.app.config if key.startswith("LOGGING_"))
+        self._read(values)
+        settings = Settings.from_config(values)
+        changed = settings.changed(self.settings)
+        if changed:
+            self._apply(values, settings=settings)
+        return changed
 
-        logging_format = self.app.config["LOGGING_FORMAT"] or None
-        if not logging_format:
-            self.app.config["LOGGING_FORMAT"] = "[%(asctime)s] [%(levelname)s]: %(message)s"
-
-        agent_host = self.app.config["AGENT_HOST"] or None
-        if not agent_host:
-            self.app.config["AGENT_HOST"] = "0.0.0.0"
-
-        agent_port = self.app.config["AGENT_PORT"] or None
-        if not agent_port:
-            self.app.config["AGENT_PORT"] = 5000
+    def watch(self):
+        """
+        Start a thread (in this process) which reloads the settings when CONFIG_FILE changes,
+        checking every CONFIG_RELOAD_INTERVAL seconds (0 disables the check). A file which is
+        not valid - e.g. one being written - is logged and ignored until it changes again.
+        """
+        pid = os.getpid()
+        if self._watch_pid == pid or not self.settings.config_file \
+                or self.settings.config_reload_interval <= 0:
+            return
+        self._watch_pid = pid
+
+        t = threading.Thread(target=self._watch_forever, name="config-watch")
+        t.daemon = True
+        t.start()
+
+    def _watch_forever(self):
+        pid = os.getpid()
+        last_modified = self._modified()
+        while self._watch_pid == pid:
+            time.sleep(self.settings.config_reload_interval)
+            modified = self._modified()
+            if modified == last_modified:
+                continue
+            last_modified = modified
+            try:
+                changed = self.reload()
+            except Exception as e:
+                logging.error("Config: Ignoring the changed configuration file {}: {}"
+                              .format(self.settings.config_file, e))
+                continue
+            if changed:
+                logging.info("Config: Reloaded {}; changed {}"
+                             .format(self.settings.config_file, ", ".join(changed)))
+
+    def _modified(self):
+        try:
+            stat = os.stat(self.settings.config_file)
+            return stat.st_mtime, stat.st_size
+        except OSError:
+            return None
 
-        agent_debug = self.app.config["AGENT_DEBUG"] or None
-        if not agent_debug:
-            self.app.config["AGENT_DEBUG"] = True
+    def _apply(self, values=None, settings=None):
+        self.app.config.update(values)
+        self.settings = settings or Settings.from_config(values)
+        Settings.install(self.settings)
 
-        cowbull_url = self.app.config["COWBULL_URL"] or None
+    def _read(self, values=None):
+        """
+        Read the settings (other than logging) from environment variables and CONFIG_FILE into
+        values, then validate them.
+        """
+        # Get any env vars for config. NOTE, defaults are None.
+        values["AGENT_HOST"] = os.getenv("AGENT_HOST", None)
+        values["AGENT_PORT"] = os.getenv("AGENT_PORT", None)
+        values["AGENT_DEBUG"] = os.getenv("AGENT_DEBUG", None)
+        values["COWBULL_URL"] = os.getenv("COWBULL_URL", None)
+
+        # remote to play the game on the game server at COWBULL_URL, or embedded to play it
+        # in-process (see Utilities.GameEngine), keeping games in the COWBULL_STORE.
+        values["COWBULL_ENGINE"] = os.getenv("COWBULL_ENGINE", None)
+
+        # Games may be spread across several game servers: COWBULL_BACKENDS lists their URL
+        # templates, COWBULL_ROUTING how new games are routed (see Utilities.BackendRouter).
+        values["COWBULL_BACKENDS"] = os.getenv("COWBULL_BACKENDS", None)
+        values["COWBULL_ROUTING"] = os.getenv("COWBULL_ROUTING", None)
+        values["COWBULL_HEALTH_INTERVAL"] = os.getenv("COWBULL_HEALTH_INTERVAL", None)
+        values["COWBULL_STORE"] = os.getenv("COWBULL_STORE", None)
+        values["COWBULL_STORE_PATH"] = os.getenv("COWBULL_STORE_PATH", None)
+        values["COWBULL_STORE_MAX_GAMES"] = os.getenv("COWBULL_STORE_MAX_GAMES", None)
+        values["COWBULL_STORE_TTL"] = os.getenv("COWBULL_STORE_TTL", None)
+
+        # The JSON backend (see Utilities.JsonCodec): auto, orjson, ujson or json.
+        values["JSON_CODEC"] = os.getenv("JSON_CODEC", None)
+
+        # Connection pool settings for the game server client (see Utilities.HttpClient).
+        values["COWBULL_POOL_CONNECTIONS"] = os.getenv("COWBULL_POOL_CONNECTIONS", None)
+        values["COWBULL_POOL_MAXSIZE"] = os.getenv("COWBULL_POOL_MAXSIZE", None)
+        values["COWBULL_CONNECT_TIMEOUT"] = os.getenv("COWBULL_CONNECT_TIMEOUT", None)
+        values["COWBULL_READ_TIMEOUT"] = os.getenv("COWBULL_READ_TIMEOUT", None)
+        values["COWBULL_GET_RETRIES"] = os.getenv("COWBULL_GET_RETRIES", None)
+        values["COWBULL_ASYNC_POOL_MAXSIZE"] = os.getenv("COWBULL_ASYNC_POOL_MAXSIZE", None)
+
+        # Time budget for a webhook call and the game server circuit breakers (see
+        # Utilities.Deadline and Utilities.CircuitBreaker).
+        values["WEBHOOK_DEADLINE"] = os.getenv("WEBHOOK_DEADLINE", None)
+        values["CIRCUIT_FAILURE_THRESHOLD"] = os.getenv("CIRCUIT_FAILURE_THRESHOLD", None)
+        values["CIRCUIT_RESET_TIMEOUT"] = os.getenv("CIRCUIT_RESET_TIMEOUT", None)
+        values["CIRCUIT_SLOW_CALL"] = os.getenv("CIRCUIT_SLOW_CALL", None)
+
+        # Directory shared by all workers for metrics snapshots (see Utilities.Metrics).
+        values["METRICS_DIR"] = os.getenv("METRICS_DIR", None)
+        values["METRICS_FLUSH_INTERVAL"] = os.getenv("METRICS_FLUSH_INTERVAL", None)
+
+        # Games created ahead of time per mode, e.g. Easy:2,Normal:5 (see Utilities.GamePool).
+        values["GAME_POOL_SIZES"] = os.getenv("GAME_POOL_SIZES", None)
+        values["GAME_POOL_MAX_AGE"] = os.getenv("GAME_POOL_MAX_AGE", None)
+        values["GAME_POOL_REFILL_INTERVAL"] = os.getenv("GAME_POOL_REFILL_INTERVAL", None)
+
+        # The state of recent games, used to check guesses (see Utilities.GameStateCache).
+        values["GAME_STATE_CACHE_SIZE"] = os.getenv("GAME_STATE_CACHE_SIZE", None)
+        values["GAME_STATE_CACHE_TTL"] = os.getenv("GAME_STATE_CACHE_TTL", None)
+
+        # Lifetime (in seconds) of the cached game modes (see Controller.NewGame).
+        values["MODES_CACHE_TTL"] = os.getenv("MODES_CACHE_TTL", None)
+        values["MODES_CACHE_STALE_TTL"] = os.getenv("MODES_CACHE_STALE_TTL", None)
+
+        # The responses returned to webhook retries (see Utilities.ResponseCache); a size of
+        # 0 turns the cache off.
+        values["RESPONSE_CACHE_SIZE"] = os.getenv("RESPONSE_CACHE_SIZE", None)
+        values["RESPONSE_CACHE_TTL"] = os.getenv("RESPONSE_CACHE_TTL", None)
+
+        # The batch webhook, POST /batch (see Controller.BatchWebhook): the threads on which
+        # each worker process runs batched sessions, and the most requests in one batch.
+        values["BATCH_WORKERS"] = os.getenv("BATCH_WORKERS", None)
+        values["BATCH_MAX_ITEMS"] = os.getenv("BATCH_MAX_ITEMS", None)
+
+        # The threads on which each worker process makes an action's independent game server
+        # calls concurrently (see Utilities.FanOut).
+        values["FANOUT_WORKERS"] = os.getenv("FANOUT_WORKERS", None)
+
+        # Admission control (see Utilities.AdmissionControl): the most actions each worker
+        # process runs at once (0 turns admission control off), the least the limit is reduced
+        # to, and the game server time per request above which it is reduced.
+        values["ADMISSION_MAX_CONCURRENCY"] = os.getenv("ADMISSION_MAX_CONCURRENCY", None)
+        values["ADMISSION_MIN_CONCURRENCY"] = os.getenv("ADMISSION_MIN_CONCURRENCY", None)
+        values["ADMISSION_TARGET_LATENCY"] = os.getenv("ADMISSION_TARGET_LATENCY", None)
+
+        # Prime the agent's pools and caches at startup, before traffic (see Utilities.Warmup).
+        values["WARMUP"] = os.getenv("WARMUP", None)
+
+        # Check if a configuration filename has been set in the OS. The file is
+        # checked for changes every CONFIG_RELOAD_INTERVAL seconds (see watch).
+        values["CONFIG_FILE"] = os.getenv("CONFIG_FILE", None)
+        values["CONFIG_RELOAD_INTERVAL"] = os.getenv("CONFIG_RELOAD_INTERVAL", None)
+
+        # The production server (see server.py and Utilities.WorkerSizing): the worker
+        # class, workers and threads (0 to size them from the cores and the expected
+        # seconds per request waiting for the game server and using the CPU).
+        values["SERVER_WORKER_CLASS"] = os.getenv("SERVER_WORKER_CLASS", None)
+        values["SERVER_WORKERS"] = os.getenv("SERVER_WORKERS", None)
+        values["SERVER_THREADS"] = os.getenv("SERVER_THREADS", None)
+        values["SERVER_UPSTREAM_WAIT"] = os.getenv("SERVER_UPSTREAM_WAIT", None)
+        values["SERVER_REQUEST_CPU"] = os.getenv("SERVER_REQUEST_CPU", None)
+
+        # Full profiles of sampled requests, or of requests sent with an X-Cowbull-Profile
+        # header matching PROFILE_TOKEN, are written to PROFILE_DIR (see
+        # Utilities.RequestProfiler).
+        values["PROFILE_DIR"] = os.getenv("PROFILE_DIR", None)
+        values["PROFILE_SAMPLE_RATE"] = os.getenv("PROFILE_SAMPLE_RATE", None)
+        values["PROFILE_TOKEN"] = os.getenv("PROFILE_TOKEN", None)
+        values["PROFILE_MAX_FILES"] = os.getenv("PROFILE_MAX_FILES", None)
+
+        # Webhook traffic is captured to CAPTURE_DIR for replay (see Utilities.TrafficCapture
+        # and Benchmarks.TrafficReplay).
+        values["CAPTURE_DIR"] = os.getenv("CAPTURE_DIR", None)
+        values["CAPTURE_SAMPLE_RATE"] = os.getenv("CAPTURE_SAMPLE_RATE", None)
+        values["CAPTURE_REDACT"] = os.getenv("CAPTURE_REDACT", None)
+        values["CAPTURE_FILE_BYTES"] = os.getenv("CAPTURE_FILE_BYTES", None)
+        values["CAPTURE_MAX_BYTES"] = os.getenv("CAPTURE_MAX_BYTES", None)
+
+        if values["CONFIG_FILE"]:
+            self._load(filename=values["CONFIG_FILE"], values=values)
+
+        self._validate(values)
+
+    def _validate(self, values=None):
+        """
+        Validate converts each setting to its type, defaulting those which are not set (both
+        as listed in Utilities.Settings.FIELDS), and then checks their values. The logging
+        settings are defaulted when they are read (see __init__). An exception is raised if a
+        setting is not valid, e.g. if the COWBULL_URL (the URL for the game server) has not
+        been set, as the agent cannot run without it and cannot guess it (unless the game
+        engine is embedded, when it is not used).
+        """
+        self._check_app_set()
+        values = self.app.config if values is None else values
+        values.update(Settings.typed(values))
+
+        # Settings for which 0 (or less) would mean nothing sensible; a few others (e.g.
+        # RESPONSE_CACHE_SIZE, ADMISSION_MAX_CONCURRENCY) turn a feature off with 0.
+        for setting in ("AGENT_PORT", "COWBULL_POOL_CONNECTIONS", "COWBULL_POOL_MAXSIZE",
+                        "COWBULL_CONNECT_TIMEOUT", "COWBULL_READ_TIMEOUT", "COWBULL_ASYNC_POOL_MAXSIZE",
+                        "WEBHOOK_DEADLINE", "CIRCUIT_FAILURE_THRESHOLD", "CIRCUIT_RESET_TIMEOUT",
+                        "CIRCUIT_SLOW_CALL", "METRICS_FLUSH_INTERVAL", "GAME_POOL_MAX_AGE",
+                        "GAME_POOL_REFILL_INTERVAL", "GAME_STATE_CACHE_SIZE", "GAME_STATE_CACHE_TTL",
+                        "RESPONSE_CACHE_TTL", "BATCH_WORKERS", "BATCH_MAX_ITEMS", "FANOUT_WORKERS",
+                        "ADMISSION_MIN_CONCURRENCY", "ADMISSION_TARGET_LATENCY", "PROFILE_MAX_FILES",
+                        "CAPTURE_FILE_BYTES", "CAPTURE_MAX_BYTES", "COWBULL_STORE_MAX_GAMES",
+                        "COWBULL_STORE_TTL"):
+            if values[setting] <= 0:
+                raise ValueError("The setting {} must be more than 0, not {}"
+                                 .format(setting, values[setting]))
+
+        for setting in ("COWBULL_GET_RETRIES", "MODES_CACHE_TTL", "MODES_CACHE_STALE_TTL",
+                        "RESPONSE_CACHE_SIZE", "ADMISSION_MAX_CONCURRENCY", "CONFIG_RELOAD_INTERVAL",
+                        "SERVER_WORKERS", "SERVER_THREADS", "SERVER_UPSTREAM_WAIT",
+                        "SERVER_REQUEST_CPU", "COWBULL_HEALTH_INTERVAL"):
+            if values[setting] < 0:
+                raise ValueError("The setting {} cannot be negative, not {}"
+                                 .format(setting, values[setting]))
+
+        for setting in ("PROFILE_SAMPLE_RATE", "CAPTURE_SAMPLE_RATE"):
+            if not 0.0 <= values[setting] <= 1.0:
+                raise ValueError("The setting {} must be between 0 and 1, not {}"
+                                 .format(setting, values[setting]))
+
+        server_worker_class = values["SERVER_WORKER_CLASS"].lower()
+        if server_worker_class not in ("sync", "gthread", "gevent", "aiohttp"):
+            raise ValueError("The server worker class (SERVER_WORKER_CLASS) must be sync, gthread, "
+                             "gevent or aiohttp, not {}".format(server_worker_class))
+        values["SERVER_WORKER_CLASS"] = server_worker_class
+
+        cowbull_engine = values["COWBULL_ENGINE"].lower()
+        if cowbull_engine not in ("remote", "embedded"):
+            raise ValueError("The game engine (COWBULL_ENGINE) must be remote or embedded, "
+                             "not {}".format(cowbull_engine))
+        values["COWBULL_ENGINE"] = cowbull_engine
+        if cowbull_engine == "embedded":
+            values["COWBULL_URL"] = GameEngine.URL
+
+        cowbull_store = values["COWBULL_STORE"].lower()
+        if cowbull_store not in ("memory", "file"):
+            raise ValueError("The game store (COWBULL_STORE) must be memory or file, not {}"
+                             .format(cowbull_store))
+        values["COWBULL_STORE"] = cowbull_store
+        # The memory store is private to a process, so a game would only be found by the worker
+        # which started it; server.py runs a single worker in that case, unless told otherwise.
+        if cowbull_engine == "embedded" and cowbull_store == "memory" and values["SERVER_WORKERS"] > 1:
+            raise ValueError("The embedded game engine's memory store (COWBULL_STORE=memory) is "
+                             "private to one process, so SERVER_WORKERS must be 1, not {}; use "
+                             "COWBULL_STORE=file to share games between workers"
+                             .format(values["SERVER_WORKERS"]))
+
+        # With several backends, COWBULL_URL (the backend of games started before they were
+        # listed) defaults to the first of them.
+        cowbull_backends = BackendRouter.parse_backends(values["COWBULL_BACKENDS"])
+        values["COWBULL_BACKENDS"] = ",".join(cowbull_backends)
+        if cowbull_backends and not values["COWBULL_URL"]:
+            values["COWBULL_URL"] = cowbull_backends[0]
+
+        cowbull_routing = values["COWBULL_ROUTING"].lower()
+        if cowbull_routing not in BackendRouter.ROUTING:
+            raise ValueError("The routing (COWBULL_ROUTING) must be one of {}, not {}".format(
+                ", ".join(BackendRouter.ROUTING), cowbull_routing))
+        values["COWBULL_ROUTING"] = cowbull_routing
+
+        cowbull_url = values["COWBULL_URL"] or None
         if not cowbull_url:
             raise ValueError("The game server (COWBULL_URL) is not set in "
                              "environment variables or configuration files "
                              "and cannot be defaulted! The agent cannot "
                              "start.")
 
-    def _load(self, filename=None):
+    def _load(self, filename=None, values=None):
         """
         Load settings from a configuration file. The settings are loaded using ConfigParser.ConfigParser (
         Python 2) and configparser.ConfigParser (Python 3). Follow the documentation at
@@ -130,6 +379,7 @@ class Config(object):
 
         """
         self._check_app_set()
+        values = self.app.config if values is None else values
 
         if not filename or filename == "":
             raise ValueError("The configuration filename cannot be empty")
@@ -148,7 +398,11 @@ class Config(object):
         cp = ConfigParser()
 
         logging.debug("Loading configuration from file.")
-        cp.readfp(f)
+        # readfp was renamed read_file in Python 3.2 (and removed in 3.12).
+        if hasattr(cp, "read_file"):
+            cp.read_file(f)
+        else:
+            cp.readfp(f)
         f.close()
 
         if not cp.sections():
@@ -166,7 +420,7 @@ class Config(object):
                                     "use env vars to set {}".format(key.upper()))
                 value = parameter[1]
                 logging.debug("Setting {} = {}".format(key, value))
-                self.app.config[parameter[0].upper()] = parameter[1]
+                values[parameter[0].upper()] = parameter[1]
 
     def _check_app_set(self):
         """
@@ -198,8 +452,105 @@ class Config(object):
                     .format(dump_pretext, self.app.config["AGENT_DEBUG"]))
         dump_action("{}Logging format is {}"
                     .format(dump_pretext, self.app.config["LOGGING_FORMAT"]))
-        dump_action("{}Logging level is {}"
-                    .format(dump_pretext, self.app.config["LOGGING_LEVEL"]))
+        dump_action("{}Logging level is {} (per logger: {})"
+                    .format(dump_pretext,
+                            self.app.config["LOGGING_LEVEL"],
+                            self.app.config["LOGGING_LEVELS"] or "none"))
+        dump_action("{}Logging is {}; payload dumps sampled at {}"
+                    .format(dump_pretext,
+                            "queued" if self.app.config["LOGGING_ASYNC"] else "synchronous",
+                            self.app.config["LOGGING_PAYLOAD_SAMPLE_RATE"]))
+        dump_action("{}JSON codec is {}"
+                    .format(dump_pretext, self.app.config["JSON_CODEC"]))
         dump_action("{}Cowbull URL is {}"
                     .format(dump_pretext, self.app.config["COWBULL_URL"]))
+        if len(BackendRouter.parse_backends(self.app.config["COWBULL_BACKENDS"])) > 1:
+            dump_action("{}Cowbull backends are {} (routed by {}, health checked every {}s)"
+                        .format(dump_pretext,
+                                self.app.config["COWBULL_BACKENDS"],
+                                self.app.config["COWBULL_ROUTING"],
+                                self.app.config["COWBULL_HEALTH_INTERVAL"]))
+        if self.app.config["COWBULL_ENGINE"] == "embedded":
+            dump_action("{}Cowbull engine is embedded; games are kept in the {} store{} "
+                        "(expiring after {}s)"
+                        .format(dump_pretext,
+                                self.app.config["COWBULL_STORE"],
+                                " at {}".format(self.app.config["COWBULL_STORE_PATH"])
+                                if self.app.config["COWBULL_STORE_PATH"] else "",
+                                self.app.config["COWBULL_STORE_TTL"]))
+        dump_action("{}Cowbull pool is {} host(s) x {} connection(s)"
+                    .format(dump_pretext,
+                            self.app.config["COWBULL_POOL_CONNECTIONS"],
+                            self.app.config["COWBULL_POOL_MAXSIZE"]))
+        dump_action("{}Cowbull timeouts are {}s connect, {}s read; GET retries {}"
+                    .format(dump_pretext,
+                            self.app.config["COWBULL_CONNECT_TIMEOUT"],
+                            self.app.config["COWBULL_READ_TIMEOUT"],
+                            self.app.config["COWBULL_GET_RETRIES"]))
+        dump_action("{}Webhook deadline is {}s; circuit breakers open after {} failure(s) "
+                    "or calls slower than {}s and probe after {}s"
+                    .format(dump_pretext,
+                            self.app.config["WEBHOOK_DEADLINE"],
+                            self.app.config["CIRCUIT_FAILURE_THRESHOLD"],
+                            self.app.config["CIRCUIT_SLOW_CALL"],
+                            self.app.config["CIRCUIT_RESET_TIMEOUT"]))
+        dump_action("{}Metrics directory is {} (flushed every {}s)"
+                    .format(dump_pretext,
+                            self.app.config["METRICS_DIR"] or "not set; metrics are per process",
+                            self.app.config["METRICS_FLUSH_INTERVAL"]))
+        dump_action("{}Game pool is {} (games discarded after {}s)"
+                    .format(dump_pretext,
+                            self.app.config["GAME_POOL_SIZES"] or "disabled",
+                            self.app.config["GAME_POOL_MAX_AGE"]))
+        dump_action("{}Game state cache holds {} game(s) for {}s"
+                    .format(dump_pretext,
+                            self.app.config["GAME_STATE_CACHE_SIZE"],
+                            self.app.config["GAME_STATE_CACHE_TTL"]))
+        dump_action("{}Modes cache TTL is {}s (stale for a further {}s)"
+                    .format(dump_pretext,
+                            self.app.config["MODES_CACHE_TTL"],
+                            self.app.config["MODES_CACHE_STALE_TTL"]))
+        dump_action("{}Responses to retries are {}"
+                    .format(dump_pretext,
+                            "cached for {}s ({} request(s))".format(
+                                self.app.config["RESPONSE_CACHE_TTL"],
+                                self.app.config["RESPONSE_CACHE_SIZE"])
+                            if int(self.app.config["RESPONSE_CACHE_SIZE"]) > 0 else "not cached"))
+        dump_action("{}Batches of up to {} requests run on {} thread(s)"
+                    .format(dump_pretext,
+                            self.app.config["BATCH_MAX_ITEMS"],
+                            self.app.config["BATCH_WORKERS"]))
+        dump_action("{}Concurrent game server calls run on {} thread(s)"
+                    .format(dump_pretext, self.app.config["FANOUT_WORKERS"]))
+        dump_action("{}Admission control is {}"
+                    .format(dump_pretext,
+                            "on ({} to {} action(s) at once, target game server time {}s)".format(
+                                self.app.config["ADMISSION_MIN_CONCURRENCY"],
+                                self.app.config["ADMISSION_MAX_CONCURRENCY"],
+                                self.app.config["ADMISSION_TARGET_LATENCY"])
+                            if int(self.app.config["ADMISSION_MAX_CONCURRENCY"]) > 0 else "off"))
+        dump_action("{}Warmup at startup is {}"
+                    .format(dump_pretext, "on" if self.app.config["WARMUP"] else "off"))
+        dump_action("{}Request profiles are {}"
+                    .format(dump_pretext,
+                            "written to {} (sampled at {}{}, at most {})".format(
+                                self.app.config["PROFILE_DIR"],
+                                self.app.config["PROFILE_SAMPLE_RATE"],
+                                " or on request" if self.app.config["PROFILE_TOKEN"] else "",
+                                self.app.config["PROFILE_MAX_FILES"])
+                            if self.app.config["PROFILE_DIR"] else "off"))
+        dump_action("{}Traffic capture is {}"
+                    .format(dump_pretext,
+                            "written to {} (sampled at {}, redacting {}; files of {} bytes, at most {} bytes)"
+                            .format(self.app.config["CAPTURE_DIR"],
+                                    self.app.config["CAPTURE_SAMPLE_RATE"],
+                                    self.app.config["CAPTURE_REDACT"] or "nothing",
+                                    self.app.config["CAPTURE_FILE_BYTES"],
+                                    self.app.config["CAPTURE_MAX_BYTES"])
+                            if self.app.config["CAPTURE_DIR"] else "off"))
+        if self.app.config["CONFIG_FILE"]:
+            dump_action("{}Configuration file is {} (checked for changes every {}s)"
+                        .format(dump_pretext,
+                                self.app.config["CONFIG_FILE"],
+                                self.app.config["CONFIG_RELOAD_INTERVAL"]))
 
@@ -0,0 +1,115 @@
+############################################################################
+# Module: Deadline.py                                                      #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: A time budget for one webhook call. The webhook starts a        #
+#          Deadline when a request arrives (WEBHOOK_DEADLINE seconds,      #
+#          a little under the conversational platform's own limit) and     #
+#          every game server call made while handling the request is       #
+#          given, at most, the time which remains. A call which cannot     #
+#          start before the deadline fails immediately.                    #
+############################################################################
+
+import threading
+import time
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+
+class Deadline(object):
+    """
+    The deadline of the request being handled. The current deadline is held in a context
+    variable (Python 3.7+), which is private to each thread and to each asyncio task, or in a
+    thread local on older versions of Python.
+
+        with Deadline(budget=4.5):
+            ... Deadline.current().remaining() ...
+
+    A Deadline with a budget of None does nothing, i.e. calls made within it are not limited.
+    """
+    __slots__ = ("budget", "started", "expires_at", "_token", "_previous")
+
+    if contextvars is not None:
+        _current = contextvars.ContextVar("cowbull_deadline", default=None)
+    else:
+        _current = None
+    _local = threading.local()
+
+    task_safe = contextvars is not None
+    """True if deadlines are private to each asyncio task (not just to each thread)"""
+
+    def __init__(self, budget=None, started=None):
+        """
+        :param budget: float - the seconds allowed, or None
+        :param started: float - when the request arrived, if before now (see
+        Utilities.AdmissionControl.backlog)
+        """
+        self.budget = float(budget) if budget is not None else None
+        self.started = started or time.time()
+        self.expires_at = self.started + self.budget if self.budget is not None else None
+        self._token = None
+        self._previous = None
+
+    def __enter__(self):
+        if self.budget is None:
+            return self
+        if Deadline._current is not None:
+            self._token = Deadline._current.set(self)
+        else:
+            self._previous = getattr(Deadline._local, "deadline", None)
+            Deadline._local.deadline = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.budget is None:
+            return False
+        if Deadline._current is not None:
+            Deadline._current.reset(self._token)
+        else:
+            Deadline._local.deadline = self._previous
+        return False
+
+    @classmethod
+    def current(cls):
+        """Return the deadline of the request being handled, or None."""
+        if cls._current is not None:
+            return cls._current.get()
+        return getattr(cls._local, "deadline", None)
+
+    def copy(self):
+        """
+        Return a deadline which expires when this one does, to be entered by another thread
+        working on the same request (see Utilities.FanOut).
+        """
+        return Deadline(budget=self.budget, started=self.started)
+
+    def remaining(self):
+        """Seconds left before the deadline (negative once it has passed)."""
+        return self.expires_at - time.time()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    @classmethod
+    def timeout(cls, connect_timeout=None, read_timeout=None, attempts=1):
+        """
+        Return the (connect, read) timeouts for a game server call: the configured timeouts
+        capped at the time remaining before the current deadline (if any).
+        :param attempts: int - the number of times the call may be made (i.e. retries + 1);
+        the remaining time is shared between them.
+        :raises IOError: if the deadline has already passed.
+        """
+        deadline = cls.current()
+        if deadline is None:
+            return connect_timeout, read_timeout
+
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise IOError(
+                "The game server could not be reached within {}s".format(deadline.budget)
+            )
+        remaining = remaining / max(1, attempts)
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
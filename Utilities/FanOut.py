@@ -0,0 +1,172 @@
+############################################################################
+# Module: FanOut.py                                                        #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Runs an action's independent game server calls concurrently,    #
+#          rather than one after another. An action declares each call     #
+#          with call(); it starts at once on a thread of the fan-out pool  #
+#          (FANOUT_WORKERS threads per worker process) under the request's #
+#          deadline, and result() waits for it. A call whose result is not #
+#          wanted - e.g. a speculative call, when the check it was made    #
+#          alongside fails - is cancelled if it has not started, and its   #
+#          result is ignored if it has. When the pool has no free thread   #
+#          a call is not queued but made in the caller, when result() is   #
+#          called, as it would have been without fan-out. Each call's      #
+#          duration is reported by action, call and outcome. See           #
+#          Utilities.AsyncFanOut for the asyncio counterpart.              #
+############################################################################
+
+import logging
+import threading
+import time
+
+from Utilities.Deadline import Deadline
+from Utilities.Metrics import Metrics
+from Utilities.RequestTimer import RequestTimer
+from Utilities.Settings import Settings
+from Utilities.WorkerPool import WorkerPool
+
+
+logger = logging.getLogger(__name__)
+
+
+class FanOut(object):
+    """
+    The concurrent calls of one action.
+
+        with FanOut(action="NewGame") as fan_out:
+            modes = fan_out.call("modes", fetch_modes)
+            game = fan_out.call("game", fetch_game, mode)
+            if not valid(mode, modes.result()):
+                raise ValueError(...)       # the game is cancelled or ignored
+            return output(game.result())
+
+    The time the caller waits in result() is added to the request's upstream time (see
+    Utilities.RequestTimer), rather than each call's duration, as the calls overlap.
+    """
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    def __init__(self, action="unknown"):
+        """
+        :param action: str - the action making the calls, for the metrics
+        """
+        self.action = action
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for call in self.calls:
+            call.cancel()
+        return False
+
+    @classmethod
+    def pool(cls):
+        """
+        Return the process-wide fan-out pool, created from the FANOUT_WORKERS setting on first
+        use. It is not the batch webhook's pool, so a batched session never waits for a thread
+        held by another session.
+        :return: WorkerPool
+        """
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    cls._pool = WorkerPool(size=Settings.current().fanout_workers, name="fanout")
+        return cls._pool
+
+    def call(self, name=None, function=None, *args, **kwargs):
+        """
+        Start function(*args, **kwargs), a game server call, on a thread of the pool if one is
+        free; otherwise it is made by result().
+        :param name: str - the call's name, for the metrics
+        :return: _FanOutCall
+        """
+        call = _FanOutCall(self.action, name, function, args, kwargs)
+        self.calls.append(call)
+        call.task = self.pool().try_submit(call.run, Deadline.current())
+        return call
+
+    @staticmethod
+    def record(action=None, name=None, outcome="used", seconds=0.0):
+        """Record the duration of a call: used, ignored or error (the call raised)."""
+        Metrics.observe("cowbull_fanout_call_duration_seconds", seconds,
+                        action=action, call=name, outcome=outcome)
+
+
+class _FanOutCall(object):
+    """A call made by FanOut.call()."""
+    __slots__ = ("action", "name", "function", "args", "kwargs", "task", "state", "value",
+                 "error", "duration", "_lock")
+
+    def __init__(self, action=None, name=None, function=None, args=(), kwargs=None):
+        self.action = action
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.task = None
+        self.state = "pending"
+        self.value = None
+        self.error = None
+        self.duration = None
+        self._lock = threading.Lock()
+
+    def _claim(self, state="running"):
+        # A call is started once only: by the pool, by result() or (to stop it) by cancel().
+        with self._lock:
+            if self.state != "pending":
+                return False
+            self.state = state
+            return True
+
+    def run(self, deadline=None):
+        """Make the call (on a pool thread, under a copy of the request's deadline)."""
+        if not self._claim():
+            return
+        with deadline.copy() if deadline is not None else Deadline():
+            self._make()
+
+    def _make(self):
+        started = time.time()
+        try:
+            self.value = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            self.error = e
+        self.duration = time.time() - started
+        with self._lock:
+            ignored = self.state == "cancelled"
+            self.state = "cancelled" if ignored else "done"
+        outcome = "ignored" if ignored else ("error" if self.error is not None else "used")
+        FanOut.record(self.action, self.name, outcome, self.duration)
+        if ignored:
+            logger.debug("FanOut: Ignored the result of %s.%s", self.action, self.name)
+
+    def result(self):
+        """
+        Wait for the call and return its result (making the call now if no thread was free).
+        :raises: whatever the call raised
+        """
+        if self._claim():
+            self._make()
+        elif self.task is not None:
+            waited = time.time()
+            self.task.result()
+            RequestTimer.add_upstream(time.time() - waited)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def cancel(self):
+        """Cancel the call if it has not started, or ignore its result if it has."""
+        if self._claim("cancelled"):
+            return
+        with self._lock:
+            if self.state == "running":
+                self.state = "cancelled"
+
+
+Metrics.describe("cowbull_fanout_call_duration_seconds", "histogram",
+                 "Duration of game server calls made concurrently by an action (see Utilities.FanOut), "
+                 "by outcome: used, ignored or error")
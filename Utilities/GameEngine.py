@@ -0,0 +1,177 @@
+############################################################################
+# Module: GameEngine.py                                                    #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: An embedded, in-process implementation of the game server      #
+#          contract (GET modes, GET game?mode= and POST game) for single   #
+#          node and edge deployments, where the HTTP round trip to the     #
+#          game server is most of the cost of a webhook call. Setting      #
+#          COWBULL_ENGINE=embedded points COWBULL_URL at URL, and Helpers  #
+#          then hands calls to that URL to the engine instead of sending   #
+#          them over HTTP. Games are kept in a Utilities.GameStore.        #
+############################################################################
+
+import logging
+import random
+import threading
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+
+class GameEngine(object):
+    """
+    Plays cows and bulls. The responses have the same structure as the game server's:
+
+        modes()               -> {"modes": [{"mode", "digits", "guesses_allowed"}, ...]}
+        new_game(mode)        -> {"key", "digits", "guesses", "served-by"}
+        guess(key, digits)    -> {"game": {...}, "outcome": {"status", "bulls", "cows", "analysis"}}
+
+    Requests the game server would reject with a 400 raise ValueError with its message.
+    """
+    URL = "embedded:///{}"
+    """The COWBULL_URL template used when the engine is embedded"""
+
+    SERVED_BY = "embedded-game-engine"
+
+    MODES = [
+        {"mode": "Easy", "digits": 3, "guesses_allowed": 15},
+        {"mode": "Normal", "digits": 4, "guesses_allowed": 10},
+        {"mode": "Hard", "digits": 6, "guesses_allowed": 6},
+    ]
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, store=None, modes=None):
+        from Utilities.GameStore import GameStore
+
+        self.store = store if store is not None else GameStore.create()
+        self._modes = modes or self.MODES
+        self._lock = threading.Lock()
+        self._random = random.SystemRandom()
+
+    @classmethod
+    def default(cls):
+        """
+        Return the process-wide engine, creating it (and its store) from the COWBULL_STORE*
+        settings on first use.
+        :return: GameEngine
+        """
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    from Utilities.GameStore import GameStore
+                    from Utilities.Settings import Settings
+                    settings = Settings.current()
+                    cls._default = cls(store=GameStore.create(
+                        kind=settings.cowbull_store,
+                        path=settings.cowbull_store_path,
+                        max_games=settings.cowbull_store_max_games,
+                        ttl=settings.cowbull_store_ttl
+                    ))
+                    logger.debug("GameEngine: Created with a %s", type(cls._default.store).__name__)
+        return cls._default
+
+    @classmethod
+    def handles(cls, url=None):
+        """Return True if url addresses the embedded engine rather than a game server."""
+        return url is not None and url.startswith(cls.URL.format(""))
+
+    def modes(self):
+        return {"modes": [dict(mode) for mode in self._modes]}
+
+    def new_game(self, mode=None, key=None):
+        """
+        Start a game.
+        :param mode: str - the mode name (case is ignored); Normal if not given
+        :param key: str - the key for the game; a new uuid if not given
+        """
+        mode_name = (mode or "Normal").capitalize()
+        game_mode = [m for m in self._modes if m["mode"] == mode_name]
+        if not game_mode:
+            raise ValueError("The mode {} is not supported".format(mode_name))
+        game_mode = game_mode[0]
+
+        game = {
+            "key": key or str(uuid.uuid4()),
+            "answer": [self._random.randint(0, 9) for _ in range(game_mode["digits"])],
+            "status": "playing",
+            "guesses_made": 0,
+            "mode": dict(game_mode),
+        }
+        self.store.save(key=game["key"], game=game)
+
+        return {
+            "key": game["key"],
+            "digits": game_mode["digits"],
+            "guesses": game_mode["guesses_allowed"],
+            "served-by": self.SERVED_BY,
+        }
+
+    def guess(self, key=None, digits=None):
+        """
+        Make a guess.
+        :param key: str - the key of the game
+        :param digits: list - the digits guessed (ints)
+        """
+        try:
+            digits = [int(d) for d in digits]
+        except (TypeError, ValueError):
+            raise ValueError("The digits guessed must be numbers")
+        if [d for d in digits if not 0 <= d <= 9]:
+            raise ValueError("The digits guessed must be between 0 and 9")
+
+        # The thread lock serializes this process's guesses; the store's lock, other workers'.
+        with self._lock, self.store.locked(key=key):
+            game = self.store.get(key=key)
+            if game is None:
+                raise ValueError("The game {} does not exist or has expired".format(key))
+
+            mode = game["mode"]
+            if game["status"] != "playing":
+                raise ValueError("The game has already been {}".format(game["status"]))
+            if len(digits) != mode["digits"]:
+                raise ValueError("The guess must be {} digits; {} were given"
+                                 .format(mode["digits"], len(digits)))
+
+            answer = game["answer"]
+            analysis = [
+                {
+                    "digit": digit,
+                    "match": answer[index] == digit,
+                    "in_word": digit in answer,
+                    "multiple": answer.count(digit) > 1,
+                }
+                for index, digit in enumerate(digits)
+            ]
+            bulls = len([a for a in analysis if a["match"]])
+            cows = len([a for a in analysis if a["in_word"] and not a["match"]])
+
+            game["guesses_made"] += 1
+            if bulls == len(answer):
+                game["status"] = "won"
+                message = "Congratulations, you won!"
+            elif game["guesses_made"] >= mode["guesses_allowed"]:
+                game["status"] = "lost"
+                message = "Sorry, you lost! The answer was {}".format("".join(str(d) for d in answer))
+            else:
+                message = "Your guess has been analyzed"
+
+            self.store.save(key=key, game=game)
+
+        return {
+            "game": {
+                "key": game["key"],
+                "status": game["status"],
+                "guesses_made": game["guesses_made"],
+                "mode": dict(mode),
+            },
+            "outcome": {
+                "status": message,
+                "bulls": bulls,
+                "cows": cows,
+                "analysis": analysis,
+            },
+        }
@@ -0,0 +1,166 @@
+############################################################################
+# Module: GamePool.py                                                      #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: A pool of games created ahead of time, per game mode, so that   #
+#          a new game can be started without waiting for the game server.  #
+#          A background thread keeps each mode's pool topped up to the     #
+#          size set in GAME_POOL_SIZES (e.g. Easy:2,Normal:5,Hard:2) and   #
+#          discards games older than GAME_POOL_MAX_AGE seconds. When a     #
+#          mode's pool is empty the caller fetches a game as before.       #
+############################################################################
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from Utilities.Metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class GamePool(object):
+    """
+    Pooled games by mode. fetch(mode) must return a new game (the game server's response to
+    GET game?mode=); take(mode) returns a pooled game or None.
+    """
+    DEFAULT_MAX_AGE = 300.0
+    DEFAULT_REFILL_INTERVAL = 1.0
+
+    def __init__(self, fetch=None, sizes=None, max_age=DEFAULT_MAX_AGE,
+                 refill_interval=DEFAULT_REFILL_INTERVAL):
+        """
+        :param fetch: callable - fetch(mode) returns a new game
+        :param sizes: dict - the number of games to keep per mode name
+        :param max_age: float - seconds after which a pooled game is discarded
+        :param refill_interval: float - seconds between checks of the pools
+        """
+        self.fetch = fetch
+        self.sizes = dict((mode.capitalize(), int(size)) for mode, size in (sizes or {}).items())
+        self.max_age = float(max_age)
+        self.refill_interval = float(refill_interval)
+
+        self.hits = dict((mode, 0) for mode in self.sizes)
+        self.misses = dict((mode, 0) for mode in self.sizes)
+        self._games = dict((mode, deque()) for mode in self.sizes)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+        Metrics.add_collector(self.collect_metrics)
+
+    @staticmethod
+    def parse_sizes(sizes=None):
+        """
+        Parse a GAME_POOL_SIZES setting, e.g. "Easy:2,Normal:5" -> {"Easy": 2, "Normal": 5}.
+        :raises ValueError: if the setting is malformed
+        """
+        parsed = {}
+        for entry in (sizes or "").split(","):
+            if not entry.strip():
+                continue
+            mode, _, size = entry.partition(":")
+            try:
+                parsed[mode.strip().capitalize()] = int(size)
+            except ValueError:
+                raise ValueError("GAME_POOL_SIZES entries must be mode:size, not '{}'".format(entry))
+        return parsed
+
+    def take(self, mode=None):
+        """Return a pooled game for mode, or None if there isn't one."""
+        self.start()
+        mode = (mode or "Normal").capitalize()
+        games = self._games.get(mode)
+        if games is None:
+            return None
+
+        game = None
+        oldest = time.time() - self.max_age
+        with self._lock:
+            while games:
+                created, candidate = games.popleft()
+                if created >= oldest:
+                    game = candidate
+                    break
+            if game is None:
+                self.misses[mode] += 1
+            else:
+                self.hits[mode] += 1
+
+        Metrics.inc("cowbull_game_pool_requests_total", mode=mode, result="miss" if game is None else "hit")
+        self._wake.set()
+        return game
+
+    def clear(self):
+        """Discard every pooled game (e.g. when the game server changes)."""
+        with self._lock:
+            for games in self._games.values():
+                games.clear()
+        self._wake.set()
+
+    def depth(self, mode=None):
+        return len(self._games.get((mode or "Normal").capitalize(), ()))
+
+    def start(self):
+        """
+        Start the refill thread for this process. A forked process (e.g. a gunicorn worker)
+        discards the games it inherited, as its parent may hand out the same games.
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                for games in self._games.values():
+                    games.clear()
+            self._pid = pid
+
+        t = threading.Thread(target=self._refill_forever, name="game-pool")
+        t.daemon = True
+        t.start()
+
+    def refill(self):
+        """Discard stale games and fetch games until every pool is full (or a fetch fails)."""
+        oldest = time.time() - self.max_age
+        for mode, size in self.sizes.items():
+            games = self._games[mode]
+            with self._lock:
+                while games and games[0][0] < oldest:
+                    games.popleft()
+
+            while len(games) < size:
+                try:
+                    game = self.fetch(mode)
+                except Exception as e:
+                    logger.warning("GamePool: Unable to create a %s game: %s", mode, e)
+                    break
+                with self._lock:
+                    games.append((time.time(), game))
+
+    def _refill_forever(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            self.refill()
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
+
+    def collect_metrics(self):
+        """Metrics collector (see Utilities.Metrics) reporting the depth of each pool."""
+        return [("cowbull_game_pool_depth", {"mode": mode}, len(games))
+                for mode, games in self._games.items()]
+
+
+Metrics.describe(
+    "cowbull_game_pool_depth", "gauge",
+    "Games waiting in the pre-created game pool by mode",
+    aggregate="sum"
+)
+Metrics.describe(
+    "cowbull_game_pool_requests_total", "counter",
+    "New games requested from the game pool by mode and result (hit or miss)"
+)
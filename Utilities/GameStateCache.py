@@ -0,0 +1,128 @@
+############################################################################
+# Module: GameStateCache.py                                                #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Remembers what the agent has learned about each game (its       #
+#          digits, guesses allowed and made, and status) from new games    #
+#          and guess responses, so MakeGuess can reject a guess the game   #
+#          server would refuse - the wrong number of digits, or a game     #
+#          which is over - without calling it. The cache is per process    #
+#          and bounded (GAME_STATE_CACHE_SIZE games, least recently used   #
+#          first out, each kept for GAME_STATE_CACHE_TTL seconds). A game  #
+#          which is not in the cache is simply not checked locally.        #
+############################################################################
+
+import logging
+import threading
+
+from Utilities.GameStore import MemoryGameStore
+from Utilities.Metrics import Metrics
+from Utilities.ResponseRenderer import ResponseRenderer
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class GameStateCache(object):
+    """
+    The state of each game, keyed by the game key. The state only ever moves forward (guesses
+    made rises and a finished game stays finished), so a state which is out of date - e.g.
+    when another worker handled the latest guess - can only let through a guess the game
+    server then rejects; it never rejects a valid one.
+    """
+    DEFAULT_SIZE = 10000
+    DEFAULT_TTL = 3600.0
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, size=DEFAULT_SIZE, ttl=DEFAULT_TTL, name="game_state"):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._store = MemoryGameStore(max_games=size, ttl=ttl)
+        Metrics.add_collector(self.collect_metrics)
+
+    @classmethod
+    def default(cls):
+        """
+        Return the process-wide cache, created from the GAME_STATE_CACHE_* settings on first use.
+        :return: GameStateCache
+        """
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    settings = Settings.current()
+                    cls._default = cls(
+                        size=settings.game_state_cache_size,
+                        ttl=settings.game_state_cache_ttl
+                    )
+        return cls._default
+
+    def remember_new_game(self, game_object=None):
+        """Remember a game from the game server's response to GET game?mode=."""
+        try:
+            self._store.save(key=game_object["key"], game={
+                "digits": int(game_object["digits"]),
+                "guesses_allowed": int(game_object["guesses"]),
+                "guesses_made": 0,
+                "status": "playing",
+            })
+        except (KeyError, TypeError, ValueError):
+            logger.debug("GameStateCache: Unable to remember new game %s", game_object)
+
+    def remember_guess(self, guess_analysis=None):
+        """Remember a game's state from the game server's response to a guess (POST game)."""
+        try:
+            game = guess_analysis["game"]
+            self._store.save(key=game["key"], game={
+                "digits": int(game["mode"]["digits"]),
+                "guesses_allowed": int(game["mode"]["guesses_allowed"]),
+                "guesses_made": int(game["guesses_made"]),
+                "status": str(game["status"]).lower(),
+            })
+        except (KeyError, TypeError, ValueError):
+            logger.debug("GameStateCache: Unable to remember guess %s", guess_analysis)
+
+    def forget(self, key=None):
+        self._store.delete(key=key)
+
+    def check_guess(self, key=None, digits=None):
+        """
+        Check a guess against the game's known state.
+        :raises ValueError: with the text for the user if the guess cannot be accepted.
+        """
+        state = self._store.get(key=key)
+        if state is None:
+            self.misses += 1
+            return
+        self.hits += 1
+
+        renderer = ResponseRenderer.current()
+        if state["status"] in ("won", "lost"):
+            error = renderer.render("game_over", status=state["status"])
+        elif state["guesses_made"] >= state["guesses_allowed"]:
+            error = renderer.render("no_guesses_left", guesses=state["guesses_allowed"])
+        elif len(digits) != state["digits"]:
+            error = renderer.render("wrong_digits", digits=state["digits"], given=len(digits))
+        else:
+            return
+
+        self.rejected += 1
+        raise ValueError(error)
+
+    def collect_metrics(self):
+        """Metrics collector (see Utilities.Metrics) reporting hits, misses and rejections."""
+        return [
+            ("cowbull_cache_requests_total", {"cache": self.name, "result": "hit"}, self.hits),
+            ("cowbull_cache_requests_total", {"cache": self.name, "result": "miss"}, self.misses),
+            ("cowbull_guesses_rejected_total", {}, self.rejected),
+        ]
+
+
+Metrics.describe(
+    "cowbull_guesses_rejected_total", "counter",
+    "Guesses rejected by the agent (from the cached game state) without calling the game server"
+)
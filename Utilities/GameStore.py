@@ -0,0 +1,222 @@
+############################################################################
+# Module: GameStore.py                                                     #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Storage for the games played by the embedded game engine       #
+#          (Utilities.GameEngine). A game is a JSON-serializable dict      #
+#          saved under its key. Two stores are provided:                   #
+#                                                                          #
+#          memory - games are held in the process, the least recently      #
+#                   used being evicted once COWBULL_STORE_MAX_GAMES are    #
+#                   held. Only suitable when a single process serves the   #
+#                   agent (e.g. async_app.py or gunicorn with 1 worker).   #
+#          file   - one JSON file per game in COWBULL_STORE_PATH, so       #
+#                   every worker on the node sees every game. A guess's    #
+#                   read and write of its game are serialized across the   #
+#                   workers with a lock file (fcntl.flock, where there is  #
+#                   one).                                                  #
+#                                                                          #
+#          Games which have not been played for COWBULL_STORE_TTL seconds  #
+#          are discarded by both stores.                                   #
+############################################################################
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class GameStore(object):
+    """
+    The interface of a game store. get() returns a copy of the game saved under key (or None),
+    so a caller must save() a game it has changed, within locked() if others may change it:
+
+        with store.locked(key):
+            game = store.get(key)
+            ...
+            store.save(key, game)
+    """
+    DEFAULT_MAX_GAMES = 10000
+    DEFAULT_TTL = 3600.0
+
+    _key_pattern = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+    @staticmethod
+    def create(kind="memory", path=None, max_games=DEFAULT_MAX_GAMES, ttl=DEFAULT_TTL):
+        """
+        Return a new store.
+        :param kind: str - memory or file
+        :param path: str - the directory used by the file store
+        :param max_games: int - the number of games held by the memory store
+        :param ttl: float - seconds after which an unplayed game is discarded
+        :return: GameStore
+        """
+        kind = (kind or "memory").lower()
+        if kind == "memory":
+            return MemoryGameStore(max_games=max_games, ttl=ttl)
+        if kind == "file":
+            return FileGameStore(path=path, ttl=ttl)
+        raise ValueError("The game store '{}' is not supported; use memory or file".format(kind))
+
+    @classmethod
+    def valid_key(cls, key=None):
+        """Return True if key could have been issued by the engine (a uuid)."""
+        return isinstance(key, (str, type(u""))) and cls._key_pattern.match(key) is not None
+
+    def get(self, key=None):
+        raise NotImplementedError()
+
+    def save(self, key=None, game=None):
+        raise NotImplementedError()
+
+    def delete(self, key=None):
+        raise NotImplementedError()
+
+    @contextmanager
+    def locked(self, key=None):
+        """
+        Hold the game saved under key while it is read, changed and saved. Only the file store
+        locks between processes; a process's own threads must be serialized by the caller.
+        """
+        yield
+
+    def __len__(self):
+        raise NotImplementedError()
+
+
+class MemoryGameStore(GameStore):
+    """An in-process store which evicts the least recently used game when full."""
+
+    def __init__(self, max_games=GameStore.DEFAULT_MAX_GAMES, ttl=GameStore.DEFAULT_TTL):
+        self.max_games = int(max_games)
+        self.ttl = float(ttl)
+        self.evictions = 0
+        self._games = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key=None):
+        with self._lock:
+            entry = self._games.get(key)
+            if entry is None:
+                return None
+            saved_at, data = entry
+            if time.time() - saved_at > self.ttl:
+                del self._games[key]
+                return None
+            self._games[key] = self._games.pop(key)
+        return json.loads(data)
+
+    def save(self, key=None, game=None):
+        # Games are held serialized so that callers can never share (and race on) a dict.
+        data = json.dumps(game)
+        with self._lock:
+            self._games.pop(key, None)
+            self._games[key] = (time.time(), data)
+            while len(self._games) > self.max_games:
+                self._games.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key=None):
+        with self._lock:
+            self._games.pop(key, None)
+
+    def __len__(self):
+        return len(self._games)
+
+
+class FileGameStore(GameStore):
+    """
+    A store keeping each game in its own JSON file, shared by every process on the node.
+    Expired games are swept at most once every ttl / 10 seconds.
+    """
+
+    LOCK_FILENAME = ".lock"
+    """The file, in the store's directory, locked while a game is read, changed and saved"""
+
+    def __init__(self, path=None, ttl=GameStore.DEFAULT_TTL):
+        self.path = path or os.path.join(tempfile.gettempdir(), "cowbull-games")
+        self.ttl = float(ttl)
+        self._swept_at = time.time()
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def _filename(self, key=None):
+        return os.path.join(self.path, "{}.json".format(key))
+
+    def get(self, key=None):
+        if not self.valid_key(key):
+            return None
+        filename = self._filename(key)
+        try:
+            if time.time() - os.path.getmtime(filename) > self.ttl:
+                self.delete(key)
+                return None
+            with open(filename) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, key=None, game=None):
+        if not self.valid_key(key):
+            raise ValueError("The game key '{}' is not valid".format(key))
+        filename = self._filename(key)
+        temp_filename = "{}.{}.tmp".format(filename, os.getpid())
+        with open(temp_filename, "w") as f:
+            json.dump(game, f)
+        os.rename(temp_filename, filename)
+        self._sweep()
+
+    def delete(self, key=None):
+        if not self.valid_key(key):
+            return
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+
+    @contextmanager
+    def locked(self, key=None):
+        # One lock for the store rather than one per game: a guess holds it for well under a
+        # millisecond, and there are no lock files to sweep. Games are saved by renaming a new
+        # file over the old, so the game's own file cannot be the one locked.
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, self.LOCK_FILENAME), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return len([f for f in os.listdir(self.path) if f.endswith(".json")])
+
+    def _sweep(self):
+        now = time.time()
+        if now - self._swept_at < self.ttl / 10.0:
+            return
+        self._swept_at = now
+        for filename in os.listdir(self.path):
+            if filename == self.LOCK_FILENAME:
+                continue
+            filename = os.path.join(self.path, filename)
+            try:
+                if now - os.path.getmtime(filename) > self.ttl:
+                    os.remove(filename)
+            except OSError:
+                continue
+        logger.debug("FileGameStore: Swept expired games from %s", self.path)
@@ -7,13 +7,35 @@
 #                                                                          #
 ############################################################################
 
-import importlib
-import json
 import logging
-import requests
+import sys
+import time
+
+from Utilities.ActionRegistry import ActionRegistry
+from Utilities.BackendRouter import BackendRouter
+from Utilities.CircuitBreaker import CircuitBreaker
+from Utilities.Deadline import Deadline
+from Utilities.GameEngine import GameEngine
+from Utilities.HttpClient import HttpClient
+from Utilities.JsonCodec import JsonCodec
+from Utilities.LogPipeline import LogPipeline
+from Utilities.Metrics import Metrics
+from Utilities.WebhookRequest import WebhookRequest
+
+if sys.version_info[0] == 2:
+    from urlparse import urlparse, parse_qs
+else:
+    from urllib.parse import urlparse, parse_qs
+
+
+logger = logging.getLogger(__name__)
 
 
 class Helpers(object):
+    """
+    Stateless helpers for the webhook and the actions. Every method is static (or a class
+    method), so there is no need to create a Helpers.
+    """
     def __init__(self):
         pass
 
@@ -21,12 +43,18 @@ class Helpers(object):
         if not action:
             raise ValueError("Helpers:get_package: Action was set to None!")
 
-        package_name = "{}".format(action)
-        mod = importlib.import_module(
-            "Controller.{}".format(package_name),
-            package=package_name
-        )
-        return getattr(mod, package_name)
+        return ActionRegistry.default().resolve(action=action)
+
+    @staticmethod
+    def get_action(action=None):
+        """
+        Return the action fulfilling the named action: the one instance of its class, shared by
+        every request (see Utilities.ActionRegistry.instance).
+        """
+        if not action:
+            raise ValueError("Helpers:get_action: Action was set to None!")
+
+        return ActionRegistry.default().instance(action=action)
 
     @staticmethod
     def execute_post_request(url=None, data=None, headers=None):
@@ -41,59 +69,129 @@ class Helpers(object):
         if not (headers.get("content-type") or headers.get("Content-Type")):
             headers["Content-Type"] = "application/json"
 
-        r = None
-        try:
-            #
-            logging.debug("Helper: Connecting to {}".format(url))
-            r = requests.post(url=url, data=json.dumps(data), headers=headers)
-        except Exception as e:
-            raise IOError("Game reported an exception: {}".format(repr(e)))
+        if GameEngine.handles(url):
+            return Helpers.execute_embedded_request(method="POST", url=url, data=data)
+
+        r = Helpers._send(method="POST", url=url, data=JsonCodec.dumpb(data), headers=headers)
 
         if r is not None:
             if r.status_code != 200:
-                err_text = "Game reported an error: HTML Status Code = {}".format(r.status_code)
-                if r.status_code == 404:
-                    err_text = "The game engine reported a 404 (not found) error. The service may " \
-                               "be temporarily unavailable"
-                if r.status_code == 400:
-                    json_output = r.json()
-                    err_text = "{} -- {}".format(json_output["message"], json_output["exception"])
-                raise IOError(err_text)
+                json_output = JsonCodec.loads(r.content) if r.status_code == 400 else None
+                raise IOError(Helpers.game_error_text(r.status_code, json_output=json_output))
             else:
-                return r.json()
+                return JsonCodec.loads(r.content)
         else:
             err_text = "Game reported an error: HTML Status Code = {}".format(r.status_code)
             raise IOError(err_text)
 
-
     @staticmethod
     def execute_get_request(url=None):
-        r = None
-        try:
-            logging.debug("Helper: Connecting to {}".format(url))
-            r = requests.get(url=url)
-            #        except exceptions.ConnectionError as re:
-            #            raise IOError("Game reported an error: {}".format(str(re)))
-        except Exception as e:
-            raise IOError("Game reported an exception: {}".format(repr(e)))
+        if GameEngine.handles(url):
+            return Helpers.execute_embedded_request(method="GET", url=url)
 
-        logging.debug("_fetch_game: Game response --> {}".format(r.text))
+        r = Helpers._send(method="GET", url=url)
+
+        if LogPipeline.sample(logger):
+            logger.debug("_fetch_game: Game response --> %s", r.text)
         if r is not None:
             if r.status_code != 200:
-                err_text = "Game reported an error: HTML Status Code = {}".format(r.status_code)
-                if r.status_code == 404:
-                    err_text = "The game engine reported a 404 (not found) error. The service may " \
-                               "be temporarily unavailable"
-                raise IOError(err_text)
+                raise IOError(Helpers.game_error_text(r.status_code))
             else:
-                return r.json()
+                return JsonCodec.loads(r.content)
         else:
             err_text = "Game reported an error: HTML Status Code = {}".format(r.status_code)
             raise IOError(err_text)
 
-    def validate_json(self, request_data=None):
-        return_object = {}
+    @staticmethod
+    def _send(method=None, url=None, **kwargs):
+        """
+        Send a request to the game server through the pooled session. The call is given no
+        more than the time left before the current request's deadline (Utilities.Deadline),
+        is refused straight away while the endpoint's circuit breaker is open
+        (Utilities.CircuitBreaker), and is recorded in the upstream metrics and, when games are
+        routed across several game servers, in the backend's latency (Utilities.BackendRouter).
+        """
+        backend = BackendRouter.for_url(url)
+        endpoint = Helpers.breaker_name(method=method, url=url, backend=backend)
+        attempts = HttpClient.get_retries() + 1 if method == "GET" else 1
+        timeout = Deadline.timeout(*HttpClient.timeout(), attempts=attempts)
+        breaker = CircuitBreaker.for_endpoint(endpoint)
+        breaker.before()
+
+        if backend is not None:
+            backend.begin()
+        started = time.time()
+        try:
+            logger.debug("Helper: Connecting to %s", url)
+            r = HttpClient.session().request(method, url=url, timeout=timeout, **kwargs)
+        except Exception as e:
+            breaker.record(success=False)
+            if backend is not None:
+                backend.end(success=False)
+            Metrics.upstream(url=url, method=method, status="error", started=started)
+            raise IOError("Game reported an exception: {}".format(repr(e)))
+
+        duration = time.time() - started
+        success = not CircuitBreaker.is_failure_status(r.status_code)
+        breaker.record(success=success, duration=duration)
+        if backend is not None:
+            backend.end(duration=duration, success=success)
+        Metrics.upstream(url=url, method=method, status=r.status_code, started=started)
+        return r
+
+    @staticmethod
+    def breaker_name(method=None, url=None, backend=None):
+        """
+        Return the name of the circuit breaker for a game server call: the method and endpoint
+        (e.g. GET modes) and, when games are routed across several game servers, the backend's
+        id, so that one failing backend does not open the breaker for the others.
+        """
+        endpoint = "{} {}".format(method, Metrics.endpoint(url))
+        return endpoint if backend is None else "{} {}".format(endpoint, backend.id)
+
+    @staticmethod
+    def execute_embedded_request(method="GET", url=None, data=None):
+        """
+        Hand a game server call to the embedded engine (Utilities.GameEngine) and return its
+        response, raising IOError with the same text as a game server error response would.
+        """
+        started = time.time()
+        endpoint = Metrics.endpoint(url)
+        engine = GameEngine.default()
+        try:
+            if method == "GET" and endpoint == "modes":
+                response = engine.modes()
+            elif method == "GET" and endpoint == "game":
+                response = engine.new_game(mode=parse_qs(urlparse(url).query).get("mode", [None])[0])
+            elif method == "POST" and endpoint == "game":
+                response = engine.guess(key=data.get("key"), digits=data.get("digits"))
+            else:
+                Metrics.upstream(url=url, method=method, status=404, started=started)
+                raise IOError(Helpers.game_error_text(404))
+        except ValueError as ve:
+            Metrics.upstream(url=url, method=method, status=400, started=started)
+            raise IOError(Helpers.game_error_text(
+                400, json_output={"message": str(ve), "exception": type(ve).__name__}
+            ))
+
+        Metrics.upstream(url=url, method=method, status=200, started=started)
+        return response
+
+    @staticmethod
+    def game_error_text(status_code=None, json_output=None):
+        """
+        Return the text reported to the user when the game server responds with a status
+        other than 200. json_output is the decoded body of a 400 (bad request) response, which
+        carries the game server's own message and exception.
+        """
+        if status_code == 404:
+            return "The game engine reported a 404 (not found) error. The service may " \
+                   "be temporarily unavailable"
+        if status_code == 400 and json_output is not None:
+            return "{} -- {}".format(json_output["message"], json_output["exception"])
+        return "Game reported an error: HTML Status Code = {}".format(status_code)
 
+    def validate_json(self, request_data=None):
         if not request_data:
             raise TypeError("Request data must be a Flask request object")
 
@@ -101,18 +199,27 @@ class Helpers(object):
 #        if not issubclass(request_data, request) or not isinstance(request_data, request):
 #            raise TypeError("Request data is not a Flask request object")
 
-        json_dictionary = request_data.get_json(force=True, silent=True, cache=False)
-        if not json_dictionary:
-            raise ValueError("There is no JSON data in the request")
-
-        if not isinstance(json_dictionary["result"], dict):
-            raise TypeError("The JSON is badly formed and is not a dictionary!")
+        return self.parse_webhook_body(body=request_data.get_data(cache=False))
 
-        return_object = {
-            "parameters": json_dictionary["result"]["parameters"],
-            "contexts": json_dictionary["result"]["contexts"],
-            "actionIncomplete": json_dictionary["result"]["actionIncomplete"],
-            "action": json_dictionary["result"]["action"]
-        }
+    @classmethod
+    def parse_webhook_body(cls, body=None):
+        """
+        Decode and validate the body of a webhook request and return its model (see
+        Utilities.WebhookRequest). A body which is not JSON is treated as an empty payload.
+        :param body: bytes - the request body
+        :return: WebhookRequest
+        """
+        try:
+            json_dictionary = JsonCodec.loads(body)
+        except ValueError:
+            json_dictionary = None
+        return cls.parse_webhook_json(json_dictionary=json_dictionary)
 
-        return return_object
+    @staticmethod
+    def parse_webhook_json(json_dictionary=None):
+        """
+        Validate a decoded API.ai webhook payload and return its model (see
+        Utilities.WebhookRequest).
+        :return: WebhookRequest
+        """
+        return WebhookRequest.parse(payload=json_dictionary)
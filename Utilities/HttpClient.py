@@ -0,0 +1,160 @@
+############################################################################
+# Module: HttpClient.py                                                    #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Provides a single, process-wide pooled HTTP session for calls   #
+#          to the game server (COWBULL_URL). Connections are kept alive    #
+#          and re-used between webhook calls, so the TCP (and TLS)         #
+#          handshake is paid once per pooled connection rather than once   #
+#          per request.                                                    #
+############################################################################
+
+import logging
+import os
+import threading
+
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient(object):
+    """
+    Process-wide holder of a pooled requests.Session. The session is created lazily on first
+    use (i.e. after gunicorn has forked its workers) and is re-created if the process id
+    changes, so pooled sockets are never shared between a parent and a forked child.
+
+    requests.Session and the underlying urllib3 connection pools are safe to share between
+    threads, so a single session serves gunicorn's sync and threaded workers alike.
+    """
+    _session = None
+    _session_pid = None
+    _lock = threading.Lock()
+
+    DEFAULT_RETRY_BACKOFF = 0.1
+
+    @classmethod
+    def session(cls):
+        """
+        Return the process-wide session, creating it if it has not been created (or if the
+        process has been forked since it was created).
+        :return: requests.Session
+        """
+        pid = os.getpid()
+        if cls._session is not None and cls._session_pid == pid:
+            return cls._session
+
+        with cls._lock:
+            if cls._session is None or cls._session_pid != pid:
+                cls._session = cls._build_session()
+                cls._session_pid = pid
+        return cls._session
+
+    @classmethod
+    def timeout(cls):
+        """
+        Return the (connect, read) timeout tuple to pass to requests.
+        :return: tuple
+        """
+        return Settings.current().timeout
+
+    @classmethod
+    def get_retries(cls):
+        """
+        Return the number of times a GET is retried (COWBULL_GET_RETRIES).
+        :return: int
+        """
+        return Settings.current().get_retries
+
+    @classmethod
+    def reset(cls):
+        """
+        Close and discard the current session; the next call to session() builds a new one.
+        """
+        with cls._lock:
+            if cls._session is not None:
+                cls._session.close()
+            cls._session = None
+            cls._session_pid = None
+
+    @classmethod
+    def _build_session(cls):
+        # requests (and urllib3) take a large share of the agent's import time, so they are
+        # imported when the first session is built - on the first game server call, or by
+        # the warmup (see Utilities.Warmup) - rather than when the app is imported.
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.packages.urllib3.util.retry import Retry
+
+        settings = Settings.current()
+
+        pool_connections = settings.pool_connections
+        pool_maxsize = settings.pool_maxsize
+        get_retries = settings.get_retries
+
+        # Only GETs are retried on read errors and 5xx responses; a POST to /game makes a
+        # guess, so replaying it could burn one of the user's guesses. Connection errors are
+        # retried for every method as the request never reached the server.
+        retry_methods = frozenset(["GET"])
+        retry_kwargs = {"allowed_methods": retry_methods} if hasattr(Retry, "DEFAULT_ALLOWED_METHODS") \
+            else {"method_whitelist": retry_methods}
+        retry = Retry(
+            total=get_retries,
+            read=get_retries,
+            connect=get_retries,
+            backoff_factor=cls.DEFAULT_RETRY_BACKOFF,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+            **retry_kwargs
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry
+        )
+
+        logger.debug(
+            "HttpClient: Creating pooled session (pool connections %s, pool size %s, GET retries %s)",
+            pool_connections, pool_maxsize, get_retries
+        )
+
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @classmethod
+    def collect_metrics(cls):
+        """
+        Metrics collector (see Utilities.Metrics) reporting, per game server host, the pooled
+        connections in use, idle (open and available for re-use) and the maximum pool size.
+        """
+        session = cls._session
+        if session is None or cls._session_pid != os.getpid():
+            return []
+
+        samples = []
+        adapters = dict((id(a), a) for a in session.adapters.values()).values()
+        for adapter in adapters:
+            pools = getattr(adapter, "poolmanager", None)
+            if pools is None:
+                continue
+            for key in list(pools.pools.keys()):
+                pool = pools.pools.get(key)
+                if pool is None or pool.pool is None:
+                    continue
+                # urllib3 fills the queue with None placeholders for connections not yet opened.
+                queued = list(pool.pool.queue)
+                host = "{}:{}".format(pool.host, pool.port)
+                idle = len([c for c in queued if c is not None])
+                samples.append(("cowbull_upstream_pool_connections", {"host": host, "state": "in_use"},
+                                pool.pool.maxsize - len(queued)))
+                samples.append(("cowbull_upstream_pool_connections", {"host": host, "state": "idle"}, idle))
+                samples.append(("cowbull_upstream_pool_connections", {"host": host, "state": "max"},
+                                pool.pool.maxsize))
+        return samples
+
+
+Metrics.add_collector(HttpClient.collect_metrics)
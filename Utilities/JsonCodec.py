@@ -0,0 +1,113 @@
+############################################################################
+# Module: JsonCodec.py                                                     #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: The JSON encoder/decoder used for webhook payloads, game        #
+#          server requests and replies, and webhook responses. It uses     #
+#          the fastest backend installed (orjson, then ujson) and falls    #
+#          back to the standard library's json. JSON_CODEC selects a       #
+#          backend explicitly (auto, orjson, ujson or json).               #
+############################################################################
+
+import json
+import logging
+import sys
+
+
+logger = logging.getLogger(__name__)
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonCodec(object):
+    """
+    Process-wide JSON codec. loads() accepts bytes or text; dumps() returns text and dumpb()
+    returns UTF-8 bytes, ready to be written as a response body. Anything a fast backend
+    cannot encode (e.g. integers wider than 64 bits) is encoded by the standard library.
+    """
+    BACKENDS = ("orjson", "ujson", "json")
+    """The supported backends, fastest first"""
+
+    backend = None
+    """The name of the backend in use"""
+
+    _loads = None
+    _dumpb = None
+
+    @classmethod
+    def configure(cls, name="auto"):
+        """
+        Select the backend.
+        :param name: str - auto (the fastest installed), orjson, ujson or json
+        :raises ValueError: if the backend is not supported
+        :raises ImportError: if the backend is not installed
+        """
+        name = (name or "auto").lower()
+        if name == "auto":
+            name = "orjson" if orjson is not None else "ujson" if ujson is not None else "json"
+        if name not in cls.BACKENDS:
+            raise ValueError("The JSON codec '{}' is not supported; use auto or one of {}"
+                             .format(name, ", ".join(cls.BACKENDS)))
+
+        if name == "orjson":
+            if orjson is None:
+                raise ImportError("The JSON codec orjson is not installed")
+            cls._loads = staticmethod(orjson.loads)
+            cls._dumpb = staticmethod(orjson.dumps)
+        elif name == "ujson":
+            if ujson is None:
+                raise ImportError("The JSON codec ujson is not installed")
+            cls._loads = staticmethod(ujson.loads)
+            cls._dumpb = staticmethod(lambda obj: ujson.dumps(obj, ensure_ascii=False).encode("utf-8"))
+        else:
+            cls._loads = staticmethod(_stdlib_loads)
+            cls._dumpb = staticmethod(_stdlib_dumpb)
+
+        cls.backend = name
+        logger.debug("JsonCodec: Using %s", name)
+
+    @classmethod
+    def loads(cls, data=None):
+        """
+        Decode a JSON document.
+        :param data: bytes or str
+        :raises ValueError: if data is not valid JSON
+        """
+        return cls._loads(data)
+
+    @classmethod
+    def dumpb(cls, obj=None):
+        """Encode obj as JSON in UTF-8 bytes."""
+        try:
+            return cls._dumpb(obj)
+        except (TypeError, OverflowError):
+            return _stdlib_dumpb(obj)
+
+    @classmethod
+    def dumps(cls, obj=None):
+        """Encode obj as JSON text."""
+        return cls.dumpb(obj).decode("utf-8")
+
+
+def _stdlib_loads(data):
+    # json.loads accepts bytes from Python 3.6.
+    if isinstance(data, bytes) and (3, 0) <= sys.version_info < (3, 6):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def _stdlib_dumpb(obj):
+    data = json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+    return data.encode("utf-8") if not isinstance(data, bytes) else data
+
+
+JsonCodec.configure()
@@ -0,0 +1,166 @@
+############################################################################
+# Module: LogPipeline.py                                                   #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Configures logging for the agent so that it costs (almost)      #
+#          nothing on the request path:                                    #
+#          1. Messages use logging's deferred %-style arguments, so they   #
+#             are only formatted if a handler will actually emit them.     #
+#          2. Records are put on an in-memory queue and formatted and      #
+#             written to stderr by a listener thread, off the request      #
+#             thread (Python 3.2+; Python 2 writes synchronously). Only    #
+#             the message itself is built on the request thread, so the    #
+#             arguments logged may be changed afterwards. Each process     #
+#             (e.g. each forked worker) has a queue of its own.            #
+#          3. Levels may be set per logger (LOGGING_LEVELS).               #
+#          4. Verbose payload dumps are sampled (LOGGING_PAYLOAD_SAMPLE_   #
+#             RATE) so diagnostics can stay on in production.              #
+############################################################################
+
+import atexit
+import logging
+import os
+import random
+import sys
+import threading
+
+if sys.version_info[0] == 2:
+    from Queue import Queue
+else:
+    from queue import Queue
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    QueueHandler = QueueListener = None
+
+
+class LogPipeline(object):
+    """
+    Process-wide logging configuration. Call configure() once at startup (Config does this);
+    modules then log through logging.getLogger(__name__) with %-style arguments, and guard
+    payload dumps with LogPipeline.sample(logger).
+    """
+    payload_sample_rate = 1.0
+    """Fraction (0.0 - 1.0) of payload dumps which are logged when DEBUG is enabled"""
+
+    _handler = None
+    _listener = None
+    _listener_pid = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, level=logging.INFO, log_format=None, levels=None, async_handlers=True,
+                  payload_sample_rate=1.0):
+        """
+        Configure the root logger.
+        :param level: int - the root logging level.
+        :param log_format: str - the logging.Formatter format string.
+        :param levels: str - per logger levels, e.g. "Utilities.Helpers=DEBUG,Controller=INFO".
+        :param async_handlers: bool - write records from a listener thread rather than the caller.
+        :param payload_sample_rate: float - fraction of payload dumps to log (see sample).
+        """
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(log_format))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        cls.stop()
+        if async_handlers and QueueHandler is not None:
+            cls._handler = stream_handler
+            root.addHandler(_DeferredQueueHandler(Queue(-1)))
+        else:
+            cls._handler = None
+            root.addHandler(stream_handler)
+        root.setLevel(level)
+
+        for name, logger_level in cls.parse_levels(levels).items():
+            logging.getLogger(name).setLevel(logger_level)
+
+        cls.payload_sample_rate = min(max(float(payload_sample_rate), 0.0), 1.0)
+
+    @staticmethod
+    def parse_levels(levels=None):
+        """
+        Parse a LOGGING_LEVELS string (name=level pairs separated by commas) into a dict. Levels
+        may be names (DEBUG) or numbers (10).
+        """
+        parsed = {}
+        for item in (levels or "").split(","):
+            if not item.strip():
+                continue
+            name, _, level = item.partition("=")
+            level = level.strip().upper()
+            parsed[name.strip()] = int(level) if level.isdigit() else logging.getLevelName(level)
+        return parsed
+
+    @classmethod
+    def sample(cls, logger=None):
+        """
+        Return True if a verbose payload dump should be logged to logger: DEBUG must be enabled
+        for the logger and the dump must be selected by payload_sample_rate. Call sites guard the
+        dump with this so that nothing (not even the arguments) is built when it returns False.
+        """
+        rate = cls.payload_sample_rate
+        if rate <= 0.0 or not logger.isEnabledFor(logging.DEBUG):
+            return False
+        return rate >= 1.0 or random.random() < rate
+
+    @classmethod
+    def start(cls, handler=None):
+        """
+        Start the listener thread for the current process. Called by the queue handler on the
+        first record in each process, so workers forked by gunicorn get a listener of their own.
+        A forked process is also given a queue of its own: the one it inherited may hold records
+        which its parent writes too, and its lock may have been held at the fork.
+        """
+        pid = os.getpid()
+        with cls._lock:
+            if cls._listener is not None and cls._listener_pid == pid:
+                return
+            if handler.queue_pid != pid:
+                handler.queue = Queue(-1)
+                handler.queue_pid = pid
+            cls._listener = QueueListener(handler.queue, cls._handler, respect_handler_level=True)
+            cls._listener.start()
+            cls._listener_pid = pid
+
+    @classmethod
+    def stop(cls):
+        """
+        Stop the listener thread (for this process), writing any records still queued.
+        """
+        with cls._lock:
+            if cls._listener is not None and cls._listener_pid == os.getpid():
+                cls._listener.stop()
+            cls._listener = None
+            cls._listener_pid = None
+
+
+if QueueHandler is not None:
+    class _DeferredQueueHandler(QueueHandler):
+        """
+        A QueueHandler which leaves formatting to the listener thread. The standard handler
+        formats the whole record on the calling thread (prepare); here only the message is
+        built, once the record has passed the level checks, so that the listener does not
+        read arguments (contexts, parameters, games) the caller may since have changed.
+        """
+
+        def __init__(self, queue=None):
+            super(_DeferredQueueHandler, self).__init__(queue)
+            self.queue_pid = os.getpid()
+
+        def prepare(self, record):
+            record.msg = record.getMessage()
+            record.args = None
+            return record
+
+        def emit(self, record):
+            if LogPipeline._listener_pid != os.getpid():
+                LogPipeline.start(handler=self)
+            super(_DeferredQueueHandler, self).emit(record)
+
+
+atexit.register(LogPipeline.stop)
@@ -0,0 +1,352 @@
+############################################################################
+# Module: Metrics.py                                                       #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: A small, in-process metrics registry (counters, gauges and      #
+#          histograms) rendered in the Prometheus text format by the       #
+#          /metrics route. Recording a sample is a dictionary update       #
+#          under a lock. When METRICS_DIR is set, every process (e.g.      #
+#          each gunicorn worker) writes a snapshot of its metrics to that  #
+#          directory every METRICS_FLUSH_INTERVAL seconds, and a scrape    #
+#          of any worker merges the snapshots of the live ones: counters   #
+#          and histograms are added up, and each gauge is combined as it   #
+#          was declared (e.g. the most, for a health, or the sum, for the  #
+#          calls in flight). The snapshot of a worker which has exited is  #
+#          deleted (by gunicorn's child_exit hook in server.py, or by the  #
+#          next scrape), so its counts drop out of the totals as a counter #
+#          reset.                                                          #
+############################################################################
+
+import atexit
+import bisect
+import errno
+import json
+import logging
+import os
+import threading
+import time
+
+from Utilities.RequestTimer import RequestTimer
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+"""Default histogram buckets (seconds)"""
+
+AGGREGATES = {
+    "sum": sum,
+    "max": max,
+    "min": min,
+    "mean": lambda values: float(sum(values)) / len(values),
+}
+"""The ways a gauge's values from several processes may be combined"""
+
+
+class Metrics(object):
+    """
+    Process-wide metrics registry. Metrics are declared once with describe(), then recorded
+    with inc(), set() or observe() and label keyword arguments, e.g.
+
+        Metrics.observe("cowbull_upstream_request_duration_seconds", 0.012, endpoint="modes")
+
+    Values which live elsewhere (connection pools, caches) are read at snapshot time by the
+    collectors registered with add_collector().
+    """
+    _types = {}
+    _help = {}
+    _buckets = {}
+    _aggregates = {}
+    _values = {}
+    _histograms = {}
+    _collectors = []
+    _lock = threading.Lock()
+
+    directory = None
+    flush_interval = 5.0
+    _flusher_pid = None
+
+    @classmethod
+    def configure(cls, directory=None, flush_interval=5.0):
+        """
+        :param directory: str - directory shared by all workers for snapshots; None to report
+        only the metrics of the process which is scraped.
+        :param flush_interval: float - seconds between snapshots written to directory.
+        """
+        cls.directory = directory or None
+        cls.flush_interval = float(flush_interval)
+        if cls.directory and not os.path.isdir(cls.directory):
+            os.makedirs(cls.directory)
+
+    @classmethod
+    def describe(cls, name, metric_type="counter", help_text="", buckets=None, aggregate="max"):
+        """
+        Declare a metric: metric_type is counter, gauge or histogram. aggregate (one of
+        AGGREGATES) combines a gauge's values from the processes sharing METRICS_DIR: e.g. sum
+        for calls in flight, max for a state or health; counters and histograms are added up.
+        """
+        cls._types[name] = metric_type
+        cls._help[name] = help_text
+        if metric_type == "histogram":
+            cls._buckets[name] = tuple(buckets or DEFAULT_BUCKETS)
+        if metric_type == "gauge":
+            cls._aggregates[name] = AGGREGATES[aggregate]
+
+    @classmethod
+    def add_collector(cls, collector):
+        """
+        Register a callable returning an iterable of (name, labels dict, value) samples for
+        metrics whose values are read at snapshot time rather than recorded.
+        """
+        if collector not in cls._collectors:
+            cls._collectors.append(collector)
+
+    @classmethod
+    def inc(cls, name, value=1, **labels):
+        key = cls._key(name, labels)
+        with cls._lock:
+            cls._values[key] = cls._values.get(key, 0) + value
+        cls._ensure_flusher()
+
+    @classmethod
+    def set(cls, name, value, **labels):
+        with cls._lock:
+            cls._values[cls._key(name, labels)] = value
+
+    @classmethod
+    def observe(cls, name, value, **labels):
+        key = cls._key(name, labels)
+        buckets = cls._buckets[name]
+        index = bisect.bisect_left(buckets, value)
+        with cls._lock:
+            histogram = cls._histograms.get(key)
+            if histogram is None:
+                histogram = cls._histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        cls._ensure_flusher()
+
+    @classmethod
+    def snapshot(cls):
+        """Return this process's metrics as a JSON-serializable dict."""
+        with cls._lock:
+            values = [[name, list(labels), value] for (name, labels), value in cls._values.items()]
+            histograms = [[name, list(labels), list(h[0]), h[1], h[2]]
+                          for (name, labels), h in cls._histograms.items()]
+
+        for collector in list(cls._collectors):
+            try:
+                for name, labels, value in collector():
+                    values.append([name, list(cls._key(name, labels)[1]), value])
+            except Exception as e:
+                logger.warning("Metrics: collector %r failed: %r", collector, e)
+
+        return {"pid": os.getpid(), "time": time.time(), "values": values, "histograms": histograms}
+
+    @classmethod
+    def render(cls):
+        """
+        Return the metrics in the Prometheus text exposition format, merged across every
+        process which has written a snapshot to METRICS_DIR (if set).
+        """
+        snapshots = [cls.snapshot()]
+        if cls.directory:
+            cls._write_snapshot(snapshots[0])
+            snapshots = cls._read_snapshots()
+
+        samples = {}
+        histograms = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot["values"]:
+                key = (name, tuple(tuple(l) for l in labels))
+                samples.setdefault(key, []).append(value)
+            for name, labels, counts, total, count in snapshot["histograms"]:
+                key = (name, tuple(tuple(l) for l in labels))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        values = dict((key, cls._aggregates.get(key[0], sum)(merged)) for key, merged in samples.items())
+
+        lines = []
+        for name in sorted(set([k[0] for k in values] + [k[0] for k in histograms])):
+            lines.append("# HELP {} {}".format(name, cls._help.get(name, name)))
+            lines.append("# TYPE {} {}".format(name, cls._types.get(name, "untyped")))
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append("{}{} {}".format(name, cls._labels(labels), cls._number(value)))
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                bounds = [cls._number(b) for b in cls._buckets.get(name, DEFAULT_BUCKETS)] + ["+Inf"]
+                for bound, bucket_count in zip(bounds, counts):
+                    cumulative += bucket_count
+                    lines.append("{}_bucket{} {}".format(
+                        name, cls._labels(labels + (("le", bound),)), cumulative))
+                lines.append("{}_sum{} {}".format(name, cls._labels(labels), cls._number(total)))
+                lines.append("{}_count{} {}".format(name, cls._labels(labels), count))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def upstream(url=None, method="GET", status=None, started=None):
+        """
+        Record a game server call: the endpoint is the last segment of the URL's path (e.g.
+        modes or game), status the HTTP status or 'error' if no response was received, and
+        started the time.time() at which the call was made. The call's duration is also added
+        to the upstream time of the request being handled (see Utilities.RequestTimer).
+        """
+        duration = time.time() - started
+        endpoint = Metrics.endpoint(url)
+        Metrics.inc("cowbull_upstream_requests_total", endpoint=endpoint, method=method, status=status)
+        Metrics.observe(
+            "cowbull_upstream_request_duration_seconds", duration,
+            endpoint=endpoint, method=method
+        )
+        RequestTimer.add_upstream(duration)
+
+    @staticmethod
+    def endpoint(url=None):
+        """Return the name of a game server endpoint: the last segment of the URL's path."""
+        path = url.split("?", 1)[0].rstrip("/")
+        return path.rsplit("/", 1)[-1] or "/"
+
+    @classmethod
+    def reset(cls):
+        """Discard every recorded value (declarations and collectors are kept)."""
+        with cls._lock:
+            cls._values.clear()
+            cls._histograms.clear()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(
+            '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for k, v in labels
+        ) + "}"
+
+    @staticmethod
+    def _number(value):
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    @classmethod
+    def discard(cls, pid=None):
+        """
+        Delete the snapshot of a process which has exited (e.g. a recycled gunicorn worker),
+        so its metrics are no longer merged into the totals.
+        :param pid: int - the process id
+        """
+        if not cls.directory:
+            return
+        path = os.path.join(cls.directory, "metrics-{}.json".format(pid))
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("Metrics: unable to remove %s: %r", path, e)
+
+    @staticmethod
+    def _pid_alive(pid):
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError as e:
+            # EPERM: the process exists but belongs to another user.
+            return e.errno == errno.EPERM
+
+    @classmethod
+    def _ensure_flusher(cls):
+        if not cls.directory or cls._flusher_pid == os.getpid():
+            return
+        with cls._lock:
+            if cls._flusher_pid == os.getpid():
+                return
+            cls._flusher_pid = os.getpid()
+
+        def flush():
+            while True:
+                time.sleep(cls.flush_interval)
+                cls._write_snapshot(cls.snapshot())
+
+        t = threading.Thread(target=flush, name="metrics-flusher")
+        t.daemon = True
+        t.start()
+
+    @classmethod
+    def _write_snapshot(cls, snapshot):
+        if not cls.directory:
+            return
+        path = os.path.join(cls.directory, "metrics-{}.json".format(snapshot["pid"]))
+        # The flusher, a scrape and the exit flush may write at once; each writes a file of
+        # its own and renames it into place whole.
+        temporary = "{}.{}.{}.tmp".format(path, os.getpid(), threading.current_thread().ident)
+        try:
+            with open(temporary, "w") as f:
+                json.dump(snapshot, f)
+            os.rename(temporary, path)
+        except (IOError, OSError) as e:
+            logger.warning("Metrics: unable to write %s: %r", path, e)
+
+    @classmethod
+    def _read_snapshots(cls):
+        snapshots = []
+        for filename in os.listdir(cls.directory):
+            if not (filename.startswith("metrics-") and filename.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(cls.directory, filename)) as f:
+                    snapshot = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+            # A worker which exited without the child_exit hook (e.g. under another server).
+            if not cls._pid_alive(snapshot["pid"]):
+                cls.discard(snapshot["pid"])
+                continue
+            snapshots.append(snapshot)
+        return snapshots
+
+    @classmethod
+    def _flush_at_exit(cls):
+        if cls.directory and cls._flusher_pid == os.getpid():
+            cls._write_snapshot(cls.snapshot())
+
+
+atexit.register(Metrics._flush_at_exit)
+
+
+# The metrics recorded by the agent.
+Metrics.describe(
+    "cowbull_webhook_requests_total", "counter",
+    "Webhook requests by action and outcome"
+)
+Metrics.describe(
+    "cowbull_webhook_request_duration_seconds", "histogram",
+    "Webhook processing time by action and outcome"
+)
+Metrics.describe(
+    "cowbull_upstream_requests_total", "counter",
+    "Game server requests by endpoint and status"
+)
+Metrics.describe(
+    "cowbull_upstream_request_duration_seconds", "histogram",
+    "Game server response time by endpoint"
+)
+Metrics.describe(
+    "cowbull_upstream_pool_connections", "gauge",
+    "Pooled game server connections by host and state (in_use, idle or max)",
+    aggregate="sum"
+)
+Metrics.describe(
+    "cowbull_cache_requests_total", "counter",
+    "Cache lookups by cache and result (hit or miss)"
+)
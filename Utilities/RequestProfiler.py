@@ -0,0 +1,158 @@
+############################################################################
+# Module: RequestProfiler.py                                               #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Reports where the time of each webhook call went. The stage     #
+#          timings of every request (Utilities.RequestTimer) are recorded  #
+#          in the cowbull_webhook_stage_duration_seconds histogram. A      #
+#          sample of requests (PROFILE_SAMPLE_RATE), and any request sent  #
+#          with an X-Cowbull-Profile header matching PROFILE_TOKEN, is     #
+#          also profiled in full with cProfile; the profile and a summary  #
+#          are written to PROFILE_DIR, named by time, action and request   #
+#          id. As the settings are reloaded with CONFIG_FILE, profiling    #
+#          can be switched on in production without a restart.            #
+############################################################################
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+
+try:
+    from StringIO import StringIO  # Python 2: pstats writes str
+except ImportError:
+    from io import StringIO
+
+from Utilities.JsonCodec import JsonCodec
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfiler(object):
+    """
+    A full profile of one request. Use start() to create (and enable) a profiler for a request
+    if it is to be profiled, and finish() once the response is built.
+    """
+    HEADER = "X-Cowbull-Profile"
+    """The request header which asks for a profile; its value must match PROFILE_TOKEN"""
+
+    SUMMARY_LINES = 40
+    """The functions (by cumulative time) listed in the summary written with each profile"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    @classmethod
+    def wanted(cls, header=None):
+        """
+        Return True if the request is to be profiled: PROFILE_DIR must be set, and either the
+        request's X-Cowbull-Profile header matches PROFILE_TOKEN or the request is sampled.
+        """
+        settings = Settings.current()
+        if not settings.profile_dir:
+            return False
+        if header and settings.profile_token and header == settings.profile_token:
+            return True
+        return settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate
+
+    @classmethod
+    def start(cls, header=None):
+        """
+        Return an enabled profiler if the request is to be profiled, otherwise None.
+        :param header: str - the value of the request's X-Cowbull-Profile header, if any
+        """
+        if not cls.wanted(header):
+            return None
+        profiler = cls()
+        try:
+            profiler.profile.enable()
+        except ValueError:
+            # Another profiler is already active (e.g. a request profiled on another thread
+            # on Python 3.12+, which allows one at a time).
+            return None
+        return profiler
+
+    @classmethod
+    def finish(cls, profiler=None, timer=None, action="unknown", request_id=None):
+        """
+        Record the request's stage timings and, if it was profiled, write its profile.
+        :param profiler: RequestProfiler or None - see start()
+        :param timer: RequestTimer - the request's stage timings
+        :param action: str - the name of the action class (or unknown)
+        :param request_id: str - the request's id (the webhook payload's id), if known
+        """
+        if profiler is not None:
+            profiler.profile.disable()
+
+        for stage, seconds in timer.durations():
+            Metrics.observe("cowbull_webhook_stage_duration_seconds", seconds, stage=stage)
+
+        if profiler is not None:
+            try:
+                profiler.write(timer=timer, action=action, request_id=request_id)
+            except (IOError, OSError) as e:
+                logger.warning("RequestProfiler: Unable to write the profile: %s", e)
+
+    def write(self, timer=None, action="unknown", request_id=None, directory=None):
+        """
+        Write the profile (a .prof file, for pstats or snakeviz) and a summary (.txt: the stage
+        timings and the functions taking the most cumulative time) to the profile directory,
+        unless it already holds PROFILE_MAX_FILES profiles.
+        :return: str - the path of the profile written, or None
+        """
+        settings = Settings.current()
+        directory = directory or settings.profile_dir
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        profiles = [f for f in os.listdir(directory) if f.endswith(".prof")]
+        if len(profiles) >= settings.profile_max_files:
+            logger.warning("RequestProfiler: %s already holds %s profiles; not writing another",
+                           directory, len(profiles))
+            return None
+
+        name = "{}-{}-{}".format(
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime(timer.started)),
+            self._safe(action),
+            self._safe(request_id or uuid.uuid4().hex)
+        )
+        path = os.path.join(directory, name)
+        self.profile.dump_stats(path + ".prof")
+
+        stream = StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.SUMMARY_LINES)
+        with io.open(path + ".txt", "w", encoding="utf-8") as f:
+            f.write(u"{}\n\n{}".format(
+                JsonCodec.dumps({
+                    "action": action,
+                    "request_id": request_id,
+                    "elapsed_ms": timer.elapsed() * 1000.0,
+                    "stages_ms": dict((stage, seconds * 1000.0) for stage, seconds in timer.durations()),
+                }),
+                stream.getvalue()
+            ))
+
+        logger.info("RequestProfiler: Wrote the profile of %s request %s to %s.prof",
+                    action, request_id, path)
+        return path + ".prof"
+
+    @staticmethod
+    def _safe(text=None):
+        # Request ids come from the payload, so only safe characters are used in file names.
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", str(text))[:64]
+
+
+Metrics.describe(
+    "cowbull_webhook_stage_duration_seconds", "histogram",
+    "Time spent in each stage of a webhook call (parse, resolve, action or error, upstream, respond)",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+             1.0, 2.5, 5.0)
+)
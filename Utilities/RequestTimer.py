@@ -0,0 +1,113 @@
+############################################################################
+# Module: RequestTimer.py                                                  #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Times the stages of one webhook call (parsing the JSON,         #
+#          resolving the action, running it and building the response).   #
+#          The webhook marks the end of each stage with lap(), and every   #
+#          game server call made meanwhile adds its duration to the        #
+#          request's upstream time (see Metrics.upstream), which is        #
+#          reported separately from the action's own time. Timing is on    #
+#          for every request; see Utilities.RequestProfiler for what is    #
+#          done with the timings.                                          #
+############################################################################
+
+import threading
+import time
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+
+class RequestTimer(object):
+    """
+    The stage timings of the request being handled. As with Utilities.Deadline, the current
+    timer is held in a context variable (Python 3.7+) or a thread local.
+
+        with RequestTimer() as timer:
+            ... timer.lap("parse") ...
+    """
+    __slots__ = ("started", "last", "stages", "upstream", "_token", "_previous")
+
+    UPSTREAM_STAGES = ("action", "error")
+    """The stages in which game server calls are made (the action, or its failure); their time
+    is reported as upstream"""
+
+    if contextvars is not None:
+        _current = contextvars.ContextVar("cowbull_request_timer", default=None)
+    else:
+        _current = None
+    _local = threading.local()
+
+    def __init__(self):
+        self.started = self.last = time.time()
+        self.stages = []
+        self.upstream = 0.0
+        self._token = None
+        self._previous = None
+
+    def __enter__(self):
+        if RequestTimer._current is not None:
+            self._token = RequestTimer._current.set(self)
+        else:
+            self._previous = getattr(RequestTimer._local, "timer", None)
+            RequestTimer._local.timer = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if RequestTimer._current is not None:
+            RequestTimer._current.reset(self._token)
+        else:
+            RequestTimer._local.timer = self._previous
+        return False
+
+    @classmethod
+    def current(cls):
+        """Return the timer of the request being handled, or None."""
+        if cls._current is not None:
+            return cls._current.get()
+        return getattr(cls._local, "timer", None)
+
+    @classmethod
+    def detach(cls):
+        """
+        Stop game server calls made from here on in this asyncio task adding to the request's
+        upstream time. Used for calls made concurrently (see Utilities.AsyncFanOut), where the
+        time the request waited for them is added instead. Does nothing without context
+        variables, as the timer is then shared by every task in the thread.
+        """
+        if cls._current is not None:
+            cls._current.set(None)
+
+    @classmethod
+    def add_upstream(cls, seconds=0.0):
+        """Add the duration of a game server call to the current request's upstream time."""
+        timer = cls.current()
+        if timer is not None:
+            timer.upstream += seconds
+
+    def lap(self, stage=None):
+        """Mark the end of a stage, which began at the end of the previous one."""
+        now = time.time()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def durations(self):
+        """
+        Return (stage, seconds) for each stage, with the game server calls' time taken out of
+        the stage in which they were made and reported as the upstream stage.
+        :return: list
+        """
+        durations = []
+        for stage, seconds in self.stages:
+            if stage in self.UPSTREAM_STAGES:
+                durations.append((stage, max(seconds - self.upstream, 0.0)))
+                durations.append(("upstream", self.upstream))
+            else:
+                durations.append((stage, seconds))
+        return durations
+
+    def elapsed(self):
+        return self.last - self.started
@@ -0,0 +1,182 @@
+############################################################################
+# Module: ResponseCache.py                                                 #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Makes webhook retries idempotent. API.ai retries a webhook call #
+#          which timed out with the same request id and session id; a      #
+#          retried guess would otherwise be posted to the game server      #
+#          again, using up one of the user's guesses and adding load just  #
+#          when the game server is slow. The response to each request is   #
+#          kept (RESPONSE_CACHE_SIZE requests, for RESPONSE_CACHE_TTL      #
+#          seconds) and returned to a retry; a retry which arrives while   #
+#          the first call is still being handled waits for its response.   #
+#          The cache is per process, so a retry handled by another worker  #
+#          is not recognised. Responses are kept as they are, in a         #
+#          least-recently-used map of their own, rather than encoded in a  #
+#          game store.                                                     #
+############################################################################
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from Utilities.Deadline import Deadline
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache(object):
+    """
+    The responses to webhook requests, by session and request id. A webhook calls lookup()
+    (or claim()) before dispatching the action; if it returns no response the webhook handles
+    the request and must then call finish() with the response, whatever the outcome.
+    """
+    DEFAULT_SIZE = 10000
+    DEFAULT_TTL = 300.0
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, size=DEFAULT_SIZE, ttl=DEFAULT_TTL, name="responses"):
+        self.name = name
+        self.enabled = int(size) > 0
+        self.size = max(int(size), 1)
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        # key -> (expiry time, action name, response), least recently used first.
+        self._responses = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        Metrics.add_collector(self.collect_metrics)
+
+    @classmethod
+    def default(cls):
+        """
+        Return the process-wide cache, created from the RESPONSE_CACHE_* settings on first use.
+        :return: ResponseCache
+        """
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    settings = Settings.current()
+                    cls._default = cls(
+                        size=settings.response_cache_size,
+                        ttl=settings.response_cache_ttl
+                    )
+        return cls._default
+
+    @staticmethod
+    def key(request_object=None):
+        """
+        Return the cache key of a webhook request (see Utilities.WebhookRequest): its session
+        id and request id, or None if it has no request id (it is then never cached).
+        """
+        if not request_object.request_id:
+            return None
+        return "{}:{}".format(request_object.payload.get("sessionId"), request_object.request_id)
+
+    def lookup(self, key=None):
+        """
+        Return (action name, response) from the earlier request with this key, if there was one.
+        If that request is still being handled, wait for it - for no longer than the current
+        request's deadline. Otherwise return None: the caller is the first with this key, and
+        must call finish() once it has a response.
+        :raises IOError: if the earlier request is not handled before the deadline
+        """
+        result, flight = self.claim(key)
+        if flight is not None:
+            result = flight.wait(timeout=self.wait_timeout())
+        return result
+
+    def claim(self, key=None):
+        """
+        The non-blocking part of lookup(), for the asyncio webhook: return (result, None) with
+        the earlier request's (action name, response) or, if the caller is the first with this
+        key, (None, None); if the earlier request is still being handled, return (None, flight)
+        where flight.wait(timeout) returns its result.
+        """
+        if key is None or not self.enabled:
+            return None, None
+
+        with self._lock:
+            # Checked and claimed under one lock, so a request finishing in between cannot be
+            # missed and handled again.
+            cached = self._responses.get(key)
+            if cached is not None:
+                if cached[0] > time.time():
+                    self._responses[key] = self._responses.pop(key)
+                    self.hits += 1
+                    return cached[1:], None
+                del self._responses[key]
+
+            flight = self._in_flight.get(key)
+            if flight is None:
+                self._in_flight[key] = _InFlight()
+                self.misses += 1
+                return None, None
+            self.waits += 1
+
+        logger.debug("ResponseCache: Request %s is already being handled", key)
+        return None, flight
+
+    @staticmethod
+    def wait_timeout():
+        """Return the seconds a retry may wait for the earlier request: until its deadline."""
+        deadline = Deadline.current()
+        return deadline.remaining() if deadline is not None else None
+
+    def finish(self, key=None, action="unknown", response=None, keep=True):
+        """
+        Record the response to the request with this key, hand it to any retry waiting for it
+        and, if keep is set (the request succeeded), return it to later retries too. A failed
+        request is not kept, so a later retry is handled afresh.
+        """
+        if key is None or not self.enabled:
+            return
+
+        with self._lock:
+            # Kept and no longer in flight at once, so a retry finds one or the other.
+            if keep:
+                self._responses.pop(key, None)
+                self._responses[key] = (time.time() + self.ttl, action, response)
+                while len(self._responses) > self.size:
+                    self._responses.popitem(last=False)
+            flight = self._in_flight.pop(key, None)
+        if flight is not None:
+            flight.done(action, response)
+
+    def collect_metrics(self):
+        """Metrics collector (see Utilities.Metrics) reporting hits, misses and waits."""
+        return [
+            ("cowbull_cache_requests_total", {"cache": self.name, "result": "hit"}, self.hits),
+            ("cowbull_cache_requests_total", {"cache": self.name, "result": "miss"}, self.misses),
+            ("cowbull_cache_requests_total", {"cache": self.name, "result": "wait"}, self.waits),
+        ]
+
+
+class _InFlight(object):
+    """A request being handled, and the retries waiting for its response."""
+    __slots__ = ("event", "result")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+    def done(self, action=None, response=None):
+        self.result = (action, response)
+        self.event.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the response.
+        :raises IOError: if there is none within timeout seconds
+        """
+        if not self.event.wait(None if timeout is None else max(timeout, 0.0)):
+            raise IOError("The game server could not be reached within {:.1f}s".format(timeout))
+        return self.result
@@ -0,0 +1,181 @@
+############################################################################
+# Module: ResponseRenderer.py                                              #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Renders the text spoken (and displayed) to the user. Phrases    #
+#          are kept per language in PHRASES and compiled once per          #
+#          language: the per-digit bull/cow/miss phrases are expanded for  #
+#          every digit, so the analysis of a guess is rendered by joining  #
+#          cached fragments. The webhook selects the language from the     #
+#          payload's lang field (e.g. en or en-US) for the duration of     #
+#          the request; unknown languages are rendered in English.         #
+############################################################################
+
+import threading
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+
+PHRASES = {
+    "en": {
+        "bull": "{digit} is a bull",
+        "cow": "{digit} is a cow",
+        "miss": "{digit} is a miss",
+        "multiple": " and occurs more than once. ",
+        "single": ". ",
+        "guess": "You have {cows} cows and {bulls} bulls. {analysis}You have {remaining} goes remaining!",
+        "new_game": "Okay, I've started a new game. You have {guesses} guesses to guess {digits} numbers.",
+        "choose_mode": "Choose one of the following modes: {modes}",
+        "unsupported_mode": "The mode you entered ({mode}) isn't supported",
+        "game_over": "That game has already been {status}. Say new game to play again!",
+        "no_guesses_left": "You have used all {guesses} of your guesses. Say new game to play again!",
+        "wrong_digits": "This game needs {digits} digits, but you gave me {given}. Please try again.",
+    },
+}
+"""Phrase templates by language; a language may omit phrases, which are then taken from English"""
+
+
+class ResponseRenderer(object):
+    """
+    The phrases of one language, compiled for rendering. Use for_language() (or current(),
+    within a request) rather than creating renderers directly, as they are cached.
+
+        with ResponseRenderer.language("en-US"):
+            text = ResponseRenderer.current().guess(analysis, cows=1, bulls=2, remaining=7)
+    """
+    DEFAULT_LANGUAGE = "en"
+
+    if contextvars is not None:
+        _current = contextvars.ContextVar("cowbull_language", default=None)
+    else:
+        _current = None
+    _local = threading.local()
+
+    task_safe = contextvars is not None
+    """True if the language is private to each asyncio task (not just to each thread)"""
+
+    _renderers = {}
+    _renderers_lock = threading.Lock()
+    _max_aliases = 64
+    """The number of language names (as sent in payloads) whose renderer is remembered"""
+
+    def __init__(self, lang=DEFAULT_LANGUAGE):
+        self.lang = lang
+        self.phrases = dict(PHRASES[self.DEFAULT_LANGUAGE])
+        self.phrases.update(PHRASES.get(lang, {}))
+
+        # Every fragment of a guess analysis, keyed by (digit, match, in_word, multiple).
+        self._fragments = {}
+        for digit in range(10):
+            for match in (True, False):
+                for in_word in (True, False):
+                    for multiple in (True, False):
+                        self._fragments[(digit, match, in_word, multiple)] = \
+                            self._fragment(digit, match, in_word, multiple)
+
+        # The guess phrase with positional fields, which format faster than named ones.
+        self._guess = self.phrases["guess"].replace("{{", "{{{{").replace("}}", "}}}}").format(
+            cows="{0}", bulls="{1}", analysis="{2}", remaining="{3}"
+        )
+
+    @classmethod
+    def register(cls, lang=None, phrases=None):
+        """
+        Add (or replace) the phrases of a language.
+        :param lang: str - the language, e.g. de
+        :param phrases: dict - phrase name to template; see PHRASES["en"] for the names
+        """
+        with cls._renderers_lock:
+            PHRASES[lang.lower()] = dict(phrases)
+            cls._renderers.clear()
+
+    @classmethod
+    def for_language(cls, lang=None):
+        """
+        Return the compiled renderer for lang (e.g. en, en-US or en_GB), falling back to the
+        language without its region, then to English.
+        :return: ResponseRenderer
+        """
+        if not isinstance(lang, (str, type(u""))):
+            lang = None
+        renderer = cls._renderers.get(lang)
+        if renderer is not None:
+            return renderer
+
+        name = str(lang or cls.DEFAULT_LANGUAGE).lower().replace("_", "-")
+        if name not in PHRASES:
+            name = name.split("-", 1)[0]
+        if name not in PHRASES:
+            name = cls.DEFAULT_LANGUAGE
+
+        with cls._renderers_lock:
+            renderer = cls._renderers.get(name)
+            if renderer is None:
+                renderer = cls._renderers[name] = cls(lang=name)
+            if len(cls._renderers) < cls._max_aliases:
+                cls._renderers[lang] = renderer
+        return renderer
+
+    @classmethod
+    def language(cls, lang=None):
+        """Return a context manager rendering responses in lang until it exits."""
+        return _Language(lang)
+
+    @classmethod
+    def current(cls):
+        """Return the renderer for the language of the request being handled."""
+        if cls._current is not None:
+            return cls.for_language(cls._current.get())
+        return cls.for_language(getattr(cls._local, "lang", None))
+
+    def render(self, phrase=None, **values):
+        """Render the named phrase with values, e.g. render("choose_mode", modes="Easy")."""
+        return self.phrases[phrase].format(**values)
+
+    def guess(self, analysis=None, cows=0, bulls=0, remaining=0):
+        """
+        Render the outcome of a guess which has not won or lost the game.
+        :param analysis: list - the game server's analysis of each digit guessed
+        """
+        try:
+            fragments = self._fragments
+            text = "".join([
+                fragments[(a["digit"], a["match"], a["in_word"], a["multiple"])] for a in analysis
+            ])
+        except (KeyError, TypeError):
+            # e.g. digits sent as strings; render them the slow way.
+            text = "".join([
+                self._fragment(a["digit"], a["match"], a["in_word"], a["multiple"]) for a in analysis
+            ])
+
+        return self._guess.format(cows, bulls, text, remaining)
+
+    def _fragment(self, digit, match, in_word, multiple):
+        state = "bull" if match else "cow" if in_word else "miss"
+        return self.phrases[state].format(digit=digit) + \
+            self.phrases["multiple" if multiple else "single"]
+
+
+class _Language(object):
+    def __init__(self, lang=None):
+        self.lang = lang
+        self._token = None
+        self._previous = None
+
+    def __enter__(self):
+        if ResponseRenderer._current is not None:
+            self._token = ResponseRenderer._current.set(self.lang)
+        else:
+            self._previous = getattr(ResponseRenderer._local, "lang", None)
+            ResponseRenderer._local.lang = self.lang
+        return ResponseRenderer.for_language(self.lang)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if ResponseRenderer._current is not None:
+            ResponseRenderer._current.reset(self._token)
+        else:
+            ResponseRenderer._local.lang = self._previous
+        return False
@@ -0,0 +1,193 @@
+############################################################################
+# Module: Settings.py                                                      #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: An immutable, typed snapshot of the agent's configuration,      #
+#          built by Utilities.Config from the validated settings. Values   #
+#          are converted once (e.g. AGENT_PORT to an int, AGENT_DEBUG to a #
+#          bool) and the game server URLs are rendered once per endpoint,  #
+#          so a request reads attributes rather than formatting strings.   #
+#          When the configuration is reloaded a new snapshot is swapped in #
+#          whole; a request holding the old one is unaffected.             #
+############################################################################
+
+import logging
+import threading
+from collections import namedtuple
+
+
+logger = logging.getLogger(__name__)
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() not in ("", "0", "false", "no", "off")
+
+
+FIELDS = [
+    # (attribute, setting, type, default)
+    ("agent_host", "AGENT_HOST", str, "0.0.0.0"),
+    ("agent_port", "AGENT_PORT", int, 5000),
+    ("agent_debug", "AGENT_DEBUG", _boolean, False),
+    ("cowbull_url", "COWBULL_URL", str, None),
+    ("cowbull_engine", "COWBULL_ENGINE", str, "remote"),
+    ("cowbull_backends", "COWBULL_BACKENDS", str, ""),
+    ("cowbull_routing", "COWBULL_ROUTING", str, "ewma"),
+    ("cowbull_health_interval", "COWBULL_HEALTH_INTERVAL", float, 5.0),
+    ("cowbull_store", "COWBULL_STORE", str, "memory"),
+    ("cowbull_store_path", "COWBULL_STORE_PATH", str, None),
+    ("cowbull_store_max_games", "COWBULL_STORE_MAX_GAMES", int, 10000),
+    ("cowbull_store_ttl", "COWBULL_STORE_TTL", float, 3600.0),
+    ("json_codec", "JSON_CODEC", str, "auto"),
+    ("pool_connections", "COWBULL_POOL_CONNECTIONS", int, 4),
+    ("pool_maxsize", "COWBULL_POOL_MAXSIZE", int, 10),
+    ("connect_timeout", "COWBULL_CONNECT_TIMEOUT", float, 3.05),
+    ("read_timeout", "COWBULL_READ_TIMEOUT", float, 10.0),
+    ("get_retries", "COWBULL_GET_RETRIES", int, 2),
+    ("async_pool_maxsize", "COWBULL_ASYNC_POOL_MAXSIZE", int, 100),
+    ("webhook_deadline", "WEBHOOK_DEADLINE", float, 4.5),
+    ("circuit_failure_threshold", "CIRCUIT_FAILURE_THRESHOLD", int, 5),
+    ("circuit_reset_timeout", "CIRCUIT_RESET_TIMEOUT", float, 10.0),
+    ("circuit_slow_call", "CIRCUIT_SLOW_CALL", float, 2.0),
+    ("metrics_dir", "METRICS_DIR", str, None),
+    ("metrics_flush_interval", "METRICS_FLUSH_INTERVAL", float, 5.0),
+    ("game_pool_sizes", "GAME_POOL_SIZES", str, ""),
+    ("game_pool_max_age", "GAME_POOL_MAX_AGE", float, 300.0),
+    ("game_pool_refill_interval", "GAME_POOL_REFILL_INTERVAL", float, 1.0),
+    ("game_state_cache_size", "GAME_STATE_CACHE_SIZE", int, 10000),
+    ("game_state_cache_ttl", "GAME_STATE_CACHE_TTL", float, 3600.0),
+    ("modes_cache_ttl", "MODES_CACHE_TTL", float, 300.0),
+    ("modes_cache_stale_ttl", "MODES_CACHE_STALE_TTL", float, 60.0),
+    ("response_cache_size", "RESPONSE_CACHE_SIZE", int, 10000),
+    ("response_cache_ttl", "RESPONSE_CACHE_TTL", float, 300.0),
+    ("batch_workers", "BATCH_WORKERS", int, 8),
+    ("batch_max_items", "BATCH_MAX_ITEMS", int, 100),
+    ("fanout_workers", "FANOUT_WORKERS", int, 8),
+    ("admission_max_concurrency", "ADMISSION_MAX_CONCURRENCY", int, 32),
+    ("admission_min_concurrency", "ADMISSION_MIN_CONCURRENCY", int, 2),
+    ("admission_target_latency", "ADMISSION_TARGET_LATENCY", float, 1.0),
+    ("warmup", "WARMUP", _boolean, False),
+    ("config_file", "CONFIG_FILE", str, None),
+    ("config_reload_interval", "CONFIG_RELOAD_INTERVAL", float, 5.0),
+    ("server_worker_class", "SERVER_WORKER_CLASS", str, "gthread"),
+    ("server_workers", "SERVER_WORKERS", int, 0),
+    ("server_threads", "SERVER_THREADS", int, 0),
+    ("server_upstream_wait", "SERVER_UPSTREAM_WAIT", float, 0.05),
+    ("server_request_cpu", "SERVER_REQUEST_CPU", float, 0.005),
+    ("profile_dir", "PROFILE_DIR", str, None),
+    ("profile_sample_rate", "PROFILE_SAMPLE_RATE", float, 0.0),
+    ("profile_token", "PROFILE_TOKEN", str, None),
+    ("profile_max_files", "PROFILE_MAX_FILES", int, 100),
+    ("capture_dir", "CAPTURE_DIR", str, None),
+    ("capture_sample_rate", "CAPTURE_SAMPLE_RATE", float, 1.0),
+    ("capture_redact", "CAPTURE_REDACT", str, "resolvedQuery,originalRequest,userId"),
+    ("capture_file_bytes", "CAPTURE_FILE_BYTES", int, 10485760),
+    ("capture_max_bytes", "CAPTURE_MAX_BYTES", int, 104857600),
+]
+"""The typed settings. A setting which is not set (or is empty) takes the default."""
+
+RENDERED = [
+    "modes_url",     # GET the game modes
+    "game_url",      # POST a guess
+    "new_game_url",  # GET a new game: new_game_url + mode name
+    "timeout",       # (connect, read) timeout tuple for requests
+]
+"""The values derived from the settings when the snapshot is built"""
+
+
+class Settings(namedtuple("Settings", [f[0] for f in FIELDS] + RENDERED)):
+    """
+    A configuration snapshot. current() returns the snapshot in force; a request which needs
+    several values should call it once and read them from the same snapshot.
+    """
+    __slots__ = ()
+
+    _current = None
+    _defaults = None
+    _listeners = []
+    _lock = threading.Lock()
+
+    @staticmethod
+    def typed(config=None):
+        """
+        Return the settings in a dictionary of settings (e.g. app.config), by setting name,
+        each converted to its type or, if it is not set (or is empty), defaulted.
+        :raises ValueError: if a setting cannot be converted to its type
+        :return: dict
+        """
+        config = config or {}
+        values = {}
+        for _, setting, kind, default in FIELDS:
+            value = config.get(setting)
+            if value is None or value == "":
+                values[setting] = default
+                continue
+            try:
+                values[setting] = kind(value)
+            except (TypeError, ValueError):
+                raise ValueError("The setting {} must be {}, not '{}'".format(
+                    setting, {int: "a whole number", float: "a number", _boolean: "true or false"}
+                    .get(kind, "a string"), value))
+        return values
+
+    @classmethod
+    def from_config(cls, config=None):
+        """
+        Build a snapshot from a dictionary of settings (e.g. app.config).
+        :raises ValueError: if a setting cannot be converted to its type
+        :return: Settings
+        """
+        typed = cls.typed(config)
+        values = dict((name, typed[setting]) for name, setting, _, _ in FIELDS)
+
+        url = values["cowbull_url"]
+        values["modes_url"] = url.format("modes") if url else None
+        values["game_url"] = url.format("game") if url else None
+        values["new_game_url"] = url.format("game") + "?mode=" if url else None
+        values["timeout"] = (values["connect_timeout"], values["read_timeout"])
+        return cls(**values)
+
+    @classmethod
+    def current(cls):
+        """
+        Return the snapshot in force. Until Config installs one (e.g. when a tool or benchmark
+        uses a module without the app), the defaults are returned.
+        :return: Settings
+        """
+        settings = cls._current
+        if settings is None:
+            if cls._defaults is None:
+                cls._defaults = cls.from_config()
+            settings = cls._defaults
+        return settings
+
+    @classmethod
+    def install(cls, settings=None):
+        """
+        Make settings the snapshot in force and, if it replaces another, tell the listeners.
+        """
+        with cls._lock:
+            previous, cls._current = cls._current, settings
+            listeners = list(cls._listeners)
+
+        if previous is None or previous == settings:
+            return
+        for listener in listeners:
+            try:
+                listener(previous, settings)
+            except Exception as e:
+                logger.error("Settings: A listener failed to apply the new settings: %s", e)
+
+    @classmethod
+    def add_listener(cls, listener=None):
+        """
+        Register listener(previous, settings), called when a reloaded snapshot replaces the
+        one in force, e.g. to discard what was cached from the previous game server.
+        """
+        with cls._lock:
+            cls._listeners.append(listener)
+
+    def changed(self, other=None):
+        """Return the names of the settings which differ between this snapshot and other."""
+        return [name for name, _, _, _ in FIELDS if getattr(self, name) != getattr(other, name, None)]
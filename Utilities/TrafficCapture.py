@@ -0,0 +1,290 @@
+############################################################################
+# Module: TrafficCapture.py                                                #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Records webhook traffic for capacity testing. When CAPTURE_DIR  #
+#          is set, each webhook request and the response returned to it    #
+#          are written as a line of JSON to gzip-compressed files in that  #
+#          directory, which Benchmarks.TrafficReplay plays back. The       #
+#          request thread only queues the raw body and response; a writer  #
+#          thread parses, redacts, compresses and writes them. Fields      #
+#          named in CAPTURE_REDACT are replaced wherever they appear and   #
+#          the session id is replaced by a digest, so sessions can be      #
+#          replayed in order but not traced back to a user. Files are      #
+#          rotated at CAPTURE_FILE_BYTES and the oldest are deleted to     #
+#          keep the directory under CAPTURE_MAX_BYTES.                     #
+############################################################################
+
+import atexit
+import gzip
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+
+if sys.version_info[0] == 2:
+    from Queue import Queue, Empty, Full
+else:
+    from queue import Queue, Empty, Full
+
+from Utilities.JsonCodec import JsonCodec
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficCapture(object):
+    """
+    The process's capture writer. The webhook calls record() for every request; nothing is
+    done unless CAPTURE_DIR is set. Each line written is:
+
+        {"time": <epoch seconds the request arrived>, "session": <session digest>,
+         "status": <HTTP status>, "duration_ms": <time to respond>,
+         "request": <payload, or the body as text if it was not JSON>, "response": <response>}
+    """
+    PREFIX = "capture-"
+    SUFFIX = ".jsonl.gz"
+
+    REDACTED = "[redacted]"
+    """The value which replaces a redacted field"""
+
+    QUEUE_SIZE = 10000
+    """Records waiting for the writer; further records are dropped (and counted) until it catches up"""
+
+    _queue = None
+    _thread = None
+    _pid = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def record(cls, body=None, response=None, status=200, started=None, duration=0.0):
+        """
+        Queue a request and its response to be written, if capture is on.
+        :param body: bytes - the request body as received
+        :param response: WebhookResponse - the response returned (not modified afterwards)
+        :param status: int - the HTTP status returned
+        :param started: float - the time.time() at which the request arrived
+        :param duration: float - the seconds taken to respond
+        """
+        if not Settings.current().capture_dir:
+            return
+
+        if cls._pid != os.getpid():
+            cls._start()
+        try:
+            cls._queue.put_nowait((started or time.time(), duration, status, body, response))
+        except Full:
+            Metrics.inc("cowbull_capture_dropped_total")
+
+    @classmethod
+    def _start(cls):
+        # One writer per process, so gunicorn's workers each write files of their own.
+        with cls._lock:
+            if cls._pid == os.getpid():
+                return
+            cls._queue = Queue(cls.QUEUE_SIZE)
+            cls._thread = threading.Thread(target=_CaptureWriter(cls._queue).run, name="traffic-capture")
+            cls._thread.daemon = True
+            cls._thread.start()
+            cls._pid = os.getpid()
+
+    @classmethod
+    def stop(cls, timeout=2.0):
+        """
+        Stop the writer (for this process), writing any records still queued and closing the
+        current file so that it is complete.
+        """
+        with cls._lock:
+            if cls._thread is None or cls._pid != os.getpid():
+                return
+            cls._queue.put(None)
+            cls._thread.join(timeout)
+            cls._thread = None
+            cls._pid = None
+
+    @staticmethod
+    def session_digest(session_id=None):
+        """Return the digest which replaces a session id in the capture (None if there is none)."""
+        if session_id is None:
+            return None
+        return hashlib.sha256(str(session_id).encode("utf-8")).hexdigest()[:32]
+
+    @classmethod
+    def sampled(cls, digest=None, rate=1.0):
+        """
+        Return True if a session is captured. Whole sessions are sampled (by their digest), so
+        that a sampled session can be replayed in full.
+        """
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        return int(digest[:8], 16) / float(0xffffffff) < rate
+
+    @classmethod
+    def redact(cls, value=None, fields=frozenset()):
+        """
+        Return a copy of value (a decoded JSON document) with each field named in fields
+        replaced, at any depth, and the session id replaced by its digest.
+        """
+        if isinstance(value, dict):
+            redacted = {}
+            for name, item in value.items():
+                if name in fields:
+                    redacted[name] = cls.REDACTED
+                elif name == "sessionId":
+                    redacted[name] = cls.session_digest(item)
+                else:
+                    redacted[name] = cls.redact(item, fields)
+            return redacted
+        if isinstance(value, list):
+            return [cls.redact(item, fields) for item in value]
+        return value
+
+
+class _CaptureWriter(object):
+    """Writes the queued records; runs on the capture thread."""
+
+    def __init__(self, queue=None):
+        self.queue = queue
+        self.file = None
+        self.path = None
+        self.directory = None
+        self.sequence = 0
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while batch[-1] is not None:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                pass
+
+            try:
+                self._write(batch)
+            except (IOError, OSError) as e:
+                logger.warning("TrafficCapture: Unable to write the capture: %s", e)
+                self._close()
+
+            if batch[-1] is None:
+                self._close()
+                return
+
+    def _write(self, batch=None):
+        # The settings are read per batch, so capture follows CONFIG_FILE reloads.
+        settings = Settings.current()
+        if not settings.capture_dir:
+            self._close()
+            return
+
+        fields = frozenset(f.strip() for f in (settings.capture_redact or "").split(",") if f.strip())
+        lines = []
+        for item in batch:
+            if item is None:
+                continue
+            line = self._line(item, fields, settings.capture_sample_rate)
+            if line is not None:
+                lines.append(line)
+        if not lines:
+            return
+
+        if self.file is None or self.directory != settings.capture_dir:
+            self._open(settings.capture_dir)
+            self._prune(settings.capture_dir, settings.capture_max_bytes)
+        for line in lines:
+            self.file.write(line)
+        # A sync flush makes everything written so far readable even if the process dies.
+        self.file.flush()
+        Metrics.inc("cowbull_capture_records_total", len(lines))
+
+        if os.path.getsize(self.path) >= settings.capture_file_bytes:
+            self._close()
+
+    @staticmethod
+    def _line(item=None, fields=frozenset(), rate=1.0):
+        started, duration, status, body, response = item
+        try:
+            request = JsonCodec.loads(body)
+        except (TypeError, ValueError):
+            request = None
+        if isinstance(request, dict):
+            digest = TrafficCapture.session_digest(request.get("sessionId"))
+            request = TrafficCapture.redact(request, fields)
+        else:
+            # Not a webhook payload: captured as text, as its own session.
+            digest = None
+            request = body.decode("utf-8", "replace") if isinstance(body, bytes) else body
+
+        if digest is not None and not TrafficCapture.sampled(digest, rate):
+            return None
+        return JsonCodec.dumpb({
+            "time": started,
+            "session": digest,
+            "status": status,
+            "duration_ms": duration * 1000.0,
+            "request": request,
+            "response": TrafficCapture.redact(response.as_dict(), fields),
+        }) + b"\n"
+
+    def _open(self, directory=None):
+        self._close()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Named by time, process and sequence, so sorting the names orders the files for replay.
+        self.sequence += 1
+        self.path = os.path.join(directory, "{}{}-{}-{:04d}{}".format(
+            TrafficCapture.PREFIX, time.strftime("%Y%m%dT%H%M%S", time.gmtime()), os.getpid(),
+            self.sequence, TrafficCapture.SUFFIX))
+        self.file = gzip.GzipFile(filename=self.path, mode="wb")
+        self.directory = directory
+        logger.info("TrafficCapture: Writing to %s", self.path)
+
+    def _close(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except (IOError, OSError) as e:
+                logger.warning("TrafficCapture: Unable to close %s: %s", self.path, e)
+        self.file = None
+        self.path = None
+        self.directory = None
+
+    def _prune(self, directory=None, max_bytes=0):
+        """
+        Delete the oldest capture files (never the one being written) beyond max_bytes. Run as
+        each file is opened; as files are rotated at CAPTURE_FILE_BYTES, the directory exceeds
+        max_bytes by at most a file per worker.
+        """
+        files = []
+        for name in os.listdir(directory):
+            if name.startswith(TrafficCapture.PREFIX) and name.endswith(TrafficCapture.SUFFIX):
+                path = os.path.join(directory, name)
+                try:
+                    files.append((os.path.getmtime(path), path, os.path.getsize(path)))
+                except OSError:
+                    continue  # deleted by another worker
+        total = sum(size for _, _, size in files)
+        for _, path, size in sorted(files):
+            if total <= max_bytes:
+                break
+            if path == self.path:
+                continue
+            try:
+                os.remove(path)
+                logger.info("TrafficCapture: Deleted %s to keep the capture under %s bytes", path, max_bytes)
+            except OSError:
+                pass
+            total -= size
+
+
+Metrics.describe("cowbull_capture_records_total", "counter",
+                 "Webhook requests written to the traffic capture")
+Metrics.describe("cowbull_capture_dropped_total", "counter",
+                 "Webhook requests not captured because the capture writer was behind")
+
+atexit.register(TrafficCapture.stop)
@@ -0,0 +1,119 @@
+############################################################################
+# Module: Warmup.py                                                        #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Primes the agent's process-wide pools and caches before the     #
+#          first webhook arrives, so a new instance does not make its      #
+#          first user wait for them: the action registry, the response     #
+#          phrases, the game state cache, the game engine or the pooled    #
+#          game server session (importing requests and opening a pooled    #
+#          connection), the game modes cache and the pool of pre-created   #
+#          games. It runs at startup if WARMUP is set, and on App Engine's #
+#          warmup request (GET /_ah/warmup).                               #
+############################################################################
+
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup(object):
+    """
+    Runs the warmup steps once per process. A step which fails (e.g. because the game server is
+    unavailable) is logged and skipped; the process then warms up on first use as before.
+    """
+    _pid = None
+    _results = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def run(cls):
+        """
+        Run every warmup step (once per process; later calls return the first call's results).
+        :return: list - (step name, seconds taken, error text or None) per step
+        """
+        pid = os.getpid()
+        if cls._pid == pid:
+            return cls._results
+
+        with cls._lock:
+            if cls._pid != pid:
+                cls._results = [cls._run_step(name, step) for name, step in cls.steps()]
+                cls._pid = pid
+                logger.info("Warmup: Completed in %.3fs (%s)",
+                            sum(seconds for _, seconds, _ in cls._results),
+                            ", ".join("{} {}".format(name, "failed" if error else "{:.3f}s".format(seconds))
+                                      for name, seconds, error in cls._results))
+        return cls._results
+
+    @classmethod
+    def steps(cls):
+        """
+        Return the warmup steps as (name, callable) pairs, in the order they are run.
+        :return: list
+        """
+        return [
+            ("actions", cls._actions),
+            ("phrases", cls._phrases),
+            ("game_state_cache", cls._game_state_cache),
+            ("game_server", cls._game_server),
+            ("modes", cls._modes),
+            ("game_pool", cls._game_pool),
+        ]
+
+    @staticmethod
+    def _run_step(name=None, step=None):
+        start = time.time()
+        try:
+            step()
+            error = None
+        except Exception as e:
+            error = str(e)
+            logger.warning("Warmup: The %s step failed: %s", name, error)
+        return name, time.time() - start, error
+
+    # The steps import what they prime when they run, so that importing this module (e.g. in
+    # app.py) costs nothing until a warmup is requested.
+
+    @staticmethod
+    def _actions():
+        from Utilities.ActionRegistry import ActionRegistry
+        ActionRegistry.default()
+
+    @staticmethod
+    def _phrases():
+        from Utilities.ResponseRenderer import ResponseRenderer
+        ResponseRenderer.for_language()
+
+    @staticmethod
+    def _game_state_cache():
+        from Utilities.GameStateCache import GameStateCache
+        GameStateCache.default()
+
+    @staticmethod
+    def _game_server():
+        from Utilities.GameEngine import GameEngine
+        from Utilities.HttpClient import HttpClient
+        from Utilities.Settings import Settings
+
+        if GameEngine.handles(Settings.current().cowbull_url):
+            GameEngine.default()
+        else:
+            HttpClient.session()
+
+    @staticmethod
+    def _modes():
+        # Loading the modes also opens the first pooled connection to the game server.
+        from Controller.NewGame import NewGame
+        NewGame._fetch_modes()
+
+    @staticmethod
+    def _game_pool():
+        from Controller.NewGame import NewGame
+        pool = NewGame.game_pool()
+        if pool is not None:
+            pool.refill()
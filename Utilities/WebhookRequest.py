@@ -0,0 +1,150 @@
+############################################################################
+# Module: WebhookRequest.py                                                #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: The model of an API.ai webhook request. A payload is checked    #
+#          against SCHEMA by a validator compiled once (at import), which  #
+#          walks the payload once and reports the first field missing or   #
+#          of the wrong type by its path, e.g. result.contexts. The model  #
+#          refers to the decoded payload rather than copying it, and the   #
+#          contexts are indexed by name the first time one is looked up.   #
+############################################################################
+
+import sys
+
+
+if sys.version_info[0] == 2:
+    string_types = (str, unicode)  # noqa: F821 (Python 2 only)
+else:
+    string_types = (str,)
+
+
+SCHEMA = [
+    # (path, type(s), required)
+    ("result", dict, True),
+    ("result.action", string_types, True),
+    ("result.actionIncomplete", bool, True),
+    ("result.parameters", dict, True),
+    ("result.contexts", list, True),
+    ("lang", string_types, False),
+]
+"""The fields of a webhook payload used by the agent"""
+
+
+class RequestValidator(object):
+    """
+    Checks decoded payloads against a schema of (dotted path, type(s), required) entries. The
+    schema is compiled into a tree of fields so each payload is walked once.
+    """
+
+    def __init__(self, schema=None):
+        self.tree = []
+        for path, types, required in schema or SCHEMA:
+            self._add(self.tree, path.split("."), types, required)
+
+    @classmethod
+    def _add(cls, tree, names, types, required, prefix=""):
+        # A node is [name, type(s), required, path, child nodes].
+        path = prefix + names[0]
+        node = [n for n in tree if n[0] == names[0]]
+        if node:
+            node = node[0]
+        else:
+            node = [names[0], dict, required, path, []]
+            tree.append(node)
+
+        if len(names) == 1:
+            node[1], node[2] = types, required
+        else:
+            cls._add(node[4], names[1:], types, required, prefix=path + ".")
+
+    def validate(self, payload=None):
+        """
+        :raises ValueError: if there is no payload
+        :raises KeyError: naming the path of the first required field which is missing
+        :raises TypeError: if a field is of the wrong type
+        """
+        if not payload:
+            raise ValueError("There is no JSON data in the request")
+        if not isinstance(payload, dict):
+            raise TypeError("The JSON is badly formed and is not a dictionary!")
+        self._validate(payload, self.tree)
+        return payload
+
+    @classmethod
+    def _validate(cls, obj, tree):
+        for name, types, required, path, children in tree:
+            if name not in obj or obj[name] is None:
+                if required:
+                    raise KeyError(path)
+                continue
+            value = obj[name]
+            if not isinstance(value, types):
+                raise TypeError("The JSON is badly formed: {} must be {}".format(
+                    path, " or ".join(cls._type_name(t) for t in (
+                        types if isinstance(types, tuple) else (types,)))))
+            if children:
+                cls._validate(value, children)
+
+    @staticmethod
+    def _type_name(t):
+        return {dict: "an object", list: "a list", bool: "true or false"}.get(t, "a string")
+
+
+class Contexts(list):
+    """
+    The contexts of a request: a list (as sent by API.ai and returned in contextOut) which is
+    indexed by context name the first time named() is called.
+    """
+
+    def __init__(self, contexts=None):
+        super(Contexts, self).__init__(contexts or [])
+        self._index = None
+
+    def named(self, name=None):
+        """Return the context called name, or None."""
+        if self._index is None:
+            index = {}
+            for context in self:
+                if isinstance(context, dict) and context.get("name") not in index:
+                    index[context.get("name")] = context
+            self._index = index
+        return self._index.get(name)
+
+    @staticmethod
+    def find(contexts=None, name=None):
+        """Return the context called name in contexts (a Contexts or a plain list), or None."""
+        if isinstance(contexts, Contexts):
+            return contexts.named(name)
+        for context in contexts or []:
+            if isinstance(context, dict) and context.get("name") == name:
+                return context
+        return None
+
+
+class WebhookRequest(object):
+    """
+    A validated webhook request. Create with parse(), passing the decoded payload.
+    """
+    __slots__ = ("payload", "request_id", "action", "action_incomplete", "parameters", "contexts", "lang")
+
+    _validator = RequestValidator(SCHEMA)
+
+    def __init__(self, payload=None):
+        result = payload["result"]
+        self.payload = payload
+        self.request_id = payload.get("id")
+        self.action = result["action"]
+        self.action_incomplete = result["actionIncomplete"]
+        self.parameters = result["parameters"]
+        self.contexts = Contexts(result["contexts"])
+        self.lang = payload.get("lang")
+
+    @classmethod
+    def parse(cls, payload=None):
+        """
+        Validate a decoded payload and return its model.
+        :raises ValueError, KeyError or TypeError: see RequestValidator.validate
+        :return: WebhookRequest
+        """
+        return cls(cls._validator.validate(payload))
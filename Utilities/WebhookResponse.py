@@ -0,0 +1,95 @@
+############################################################################
+# Module: WebhookResponse.py                                               #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: The response envelope returned to API.ai for each webhook       #
+#          request. A slotted object holding the fields which vary (the    #
+#          status, speech, display text and contexts) rather than an       #
+#          eight-key dictionary per request. It encodes itself: the        #
+#          constant parts of the envelope are encoded once, and only the   #
+#          varying fields are encoded per response. It can still be read   #
+#          as the dictionary the webhook used to build, e.g.               #
+#          response["status"].                                             #
+############################################################################
+
+from Utilities.JsonCodec import JsonCodec
+
+
+class WebhookResponse(object):
+    """
+    A webhook response.
+
+        response = WebhookResponse.from_result(action_result)
+        body = response.dumpb()
+    """
+    __slots__ = ("status", "speech", "display_text", "context_out")
+
+    FIELDS = {"status": "status", "speech": "speech", "displayText": "display_text",
+              "contextOut": "context_out"}
+    """The envelope field names of each attribute"""
+
+    CONSTANTS = {"message": "success", "data": {}, "source": "cowbull-agent", "followupEvent": {}}
+    """The envelope fields which are the same in every response"""
+
+    _STATUS = b'{"status":'
+    _SPEECH = b',"message":"success","speech":'
+    _DISPLAY_TEXT = b',"displayText":'
+    _CONTEXT_OUT = b',"data":{},"source":"cowbull-agent","followupEvent":{},"contextOut":'
+
+    def __init__(self, speech=None, context_out=None, display_text=None, status=200):
+        """
+        :param speech: str - the text to speak
+        :param context_out: list - the contexts to set
+        :param display_text: str - the text to display, if not the speech
+        :param status: int - the status, in the envelope and of the HTTP response
+        """
+        self.status = status
+        self.speech = speech
+        self.display_text = speech if display_text is None else display_text
+        self.context_out = context_out
+
+    @classmethod
+    def from_result(cls, result=None):
+        """Return the response to an action's result (an ActionResult, or the dictionary
+        actions used to return)."""
+        return cls(speech=result["speech"], display_text=result["displayText"],
+                   context_out=result["contextOut"])
+
+    def __getitem__(self, name):
+        if name in self.FIELDS:
+            return getattr(self, self.FIELDS[name])
+        return self.CONSTANTS[name]
+
+    def __repr__(self):
+        return "WebhookResponse({!r})".format(self.as_dict())
+
+    def as_dict(self):
+        """Return the envelope as a dictionary."""
+        return {
+            "status": self.status,
+            "message": "success",
+            "speech": self.speech,
+            "displayText": self.display_text,
+            "data": {},
+            "source": "cowbull-agent",
+            "followupEvent": {},
+            "contextOut": self.context_out
+        }
+
+    def dumpb(self):
+        """Encode the envelope as JSON in UTF-8 bytes (as JsonCodec.dumpb would encode
+        as_dict())."""
+        speech = JsonCodec.dumpb(self.speech)
+        display_text = speech if self.display_text is self.speech else JsonCodec.dumpb(self.display_text)
+        return b"".join((
+            self._STATUS, str(int(self.status)).encode("ascii"),
+            self._SPEECH, speech,
+            self._DISPLAY_TEXT, display_text,
+            self._CONTEXT_OUT, JsonCodec.dumpb(self.context_out),
+            b"}"
+        ))
+
+    @staticmethod
+    def dumpb_all(responses=None):
+        """Encode a list of responses (e.g. a batch's) as a JSON array in UTF-8 bytes."""
+        return b"[" + b",".join(response.dumpb() for response in responses) + b"]"
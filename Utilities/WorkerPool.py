@@ -0,0 +1,172 @@
+############################################################################
+# Module: WorkerPool.py                                                    #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: A bounded pool of threads, shared by the requests a process     #
+#          handles, on which the batch webhook (Controller.BatchWebhook)   #
+#          runs its sessions. However many batches arrive at once, no more #
+#          than BATCH_WORKERS of their sessions run at a time in each      #
+#          worker process; the rest wait in the pool's queue. Upstream     #
+#          fan-out (Utilities.FanOut) has a pool of its own. The threads   #
+#          are started on first use in each process (not in the process    #
+#          which forks the workers; see server.py).                        #
+############################################################################
+
+import logging
+import os
+import sys
+import threading
+
+if sys.version_info[0] == 2:
+    from Queue import Queue
+else:
+    from queue import Queue
+
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool(object):
+    """
+    A fixed number of threads running the calls given to submit(), in the order submitted.
+
+        task = WorkerPool.default().submit(call, argument)
+        ... task.result() ...
+    """
+    DEFAULT_SIZE = 8
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, size=DEFAULT_SIZE, name="batch"):
+        """
+        :param size: int - the number of threads
+        :param name: str - the pool's name, for its threads and metrics
+        """
+        if int(size) < 1:
+            raise ValueError("A worker pool must have at least one thread, not {}".format(size))
+        self.size = int(size)
+        self.name = name
+        self.busy = 0
+        self._queue = Queue()
+        self._pid = None
+        self._lock = threading.Lock()
+        Metrics.add_collector(self.collect_metrics)
+
+    @classmethod
+    def default(cls):
+        """
+        Return the process-wide pool, created from the BATCH_WORKERS setting on first use.
+        :return: WorkerPool
+        """
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    cls._default = cls(size=Settings.current().batch_workers)
+        return cls._default
+
+    def submit(self, call=None, *args):
+        """
+        Queue call(*args) to run on one of the pool's threads.
+        :return: _Task - whose result() waits for, and returns, what the call returned
+        """
+        self.start()
+        task = _Task(call, args)
+        self._queue.put(task)
+        return task
+
+    def try_submit(self, call=None, *args):
+        """
+        Queue call(*args) as submit() does if one of the pool's threads is free, so it starts
+        at once; otherwise return None and leave the call to the caller.
+        :return: _Task or None
+        """
+        self.start()
+        with self._lock:
+            if self.busy + self._queue.qsize() >= self.size:
+                return None
+            # Counted as busy from now, so that concurrent callers see the thread as taken.
+            self.busy += 1
+        task = _Task(call, args)
+        task.reserved = True
+        self._queue.put(task)
+        return task
+
+    def start(self):
+        """Start the pool's threads in this process."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # A forked worker inherits the queue but not the threads; start afresh.
+            self._queue = Queue()
+            self.busy = 0
+            for number in range(self.size):
+                t = threading.Thread(target=self._work, name="{}-{}".format(self.name, number))
+                t.daemon = True
+                t.start()
+            self._pid = pid
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if not task.reserved:
+                with self._lock:
+                    self.busy += 1
+            try:
+                task.run()
+            finally:
+                with self._lock:
+                    self.busy -= 1
+
+    def collect_metrics(self):
+        """Metrics collector (see Utilities.Metrics) reporting the busy threads and queued calls."""
+        return [
+            ("cowbull_pool_threads", {"pool": self.name}, self.size),
+            ("cowbull_pool_busy_threads", {"pool": self.name}, self.busy),
+            ("cowbull_pool_queued", {"pool": self.name}, self._queue.qsize()),
+        ]
+
+
+class _Task(object):
+    """A call queued on a WorkerPool, and its outcome."""
+    __slots__ = ("call", "args", "reserved", "value", "error", "done")
+
+    def __init__(self, call=None, args=()):
+        self.call = call
+        self.args = args
+        self.reserved = False
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.value = self.call(*self.args)
+        except BaseException as e:
+            logger.warning("WorkerPool: %s raised %s", getattr(self.call, "__name__", self.call), e)
+            self.error = e
+        finally:
+            self.done.set()
+
+    def result(self):
+        """
+        Wait for the call to finish and return its value.
+        :raises: whatever the call raised
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+Metrics.describe("cowbull_pool_threads", "gauge", "Threads in each worker pool", aggregate="sum")
+Metrics.describe("cowbull_pool_busy_threads", "gauge", "Threads of each worker pool running a call",
+                 aggregate="sum")
+Metrics.describe("cowbull_pool_queued", "gauge", "Calls waiting for a thread of each worker pool",
+                 aggregate="sum")
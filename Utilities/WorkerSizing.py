@@ -0,0 +1,128 @@
+############################################################################
+# Module: WorkerSizing.py                                                  #
+# Author: D Sanders                                                        #
+############################################################################
+# Purpose: Sizes the server's worker processes and threads (see server.py) #
+#          from the cores available to the process - honouring CPU         #
+#          affinity and a container's CPU quota - and the expected ratio   #
+#          of time spent waiting for the game server to CPU time per       #
+#          request. A worker (or thread) waiting on the game server holds  #
+#          no core, so to keep every core busy each one needs              #
+#          1 + wait / cpu requests in flight.                              #
+############################################################################
+
+import math
+import os
+
+
+class WorkerSizing(object):
+    """
+    The worker class, number of workers and threads per worker for a server.
+
+    sync: one request per worker, so workers = cores x (1 + wait / cpu), up to
+    MAX_SYNC_WORKERS_PER_CORE per core (each worker is a process, so memory bounds them).
+    gthread: one worker per core (the GIL lets one thread run at a time) with
+    1 + wait / cpu threads each, up to MAX_THREADS.
+    gevent and aiohttp: one worker per core; each handles many requests cooperatively.
+    """
+    WORKER_CLASSES = {
+        "sync": "sync",
+        "gthread": "gthread",
+        "gevent": "gevent",
+        "aiohttp": "aiohttp.GunicornWebWorker",
+    }
+    """Worker class name -> gunicorn worker class"""
+
+    MAX_SYNC_WORKERS_PER_CORE = 4
+    MAX_THREADS = 32
+
+    def __init__(self, worker_class="gthread", workers=0, threads=0, cores=None,
+                 upstream_wait=0.05, request_cpu=0.005):
+        """
+        :param worker_class: str - sync, gthread, gevent or aiohttp
+        :param workers: int - the number of workers, or 0 to size them
+        :param threads: int - the threads per gthread worker, or 0 to size them
+        :param cores: int - the cores available (see available_cores) if not given
+        :param upstream_wait: float - expected seconds per request spent waiting for the game server
+        :param request_cpu: float - expected CPU seconds per request
+        :raises ValueError: if the worker class is not supported
+        """
+        if worker_class not in self.WORKER_CLASSES:
+            raise ValueError("The worker class must be one of {}, not {}".format(
+                ", ".join(sorted(self.WORKER_CLASSES)), worker_class))
+
+        self.worker_class = worker_class
+        self.cores = cores or self.available_cores()
+        self.concurrency = 1 + max(float(upstream_wait), 0.0) / max(float(request_cpu), 0.0001)
+
+        if worker_class == "sync":
+            sized_workers = min(int(math.ceil(self.cores * self.concurrency)),
+                                self.MAX_SYNC_WORKERS_PER_CORE * self.cores)
+        else:
+            sized_workers = self.cores
+        self.workers = int(workers) or sized_workers
+
+        if worker_class == "gthread":
+            self.threads = int(threads) or min(int(math.ceil(self.concurrency)), self.MAX_THREADS)
+        else:
+            self.threads = 1
+
+    @property
+    def gunicorn_worker_class(self):
+        return self.WORKER_CLASSES[self.worker_class]
+
+    @property
+    def preload(self):
+        """
+        Whether the app can be imported once, before the workers are forked, so they share its
+        memory copy-on-write. Not for gevent, which must patch the standard library before the
+        app's modules are imported (in each worker).
+        """
+        return self.worker_class != "gevent"
+
+    @property
+    def app_module(self):
+        """The gunicorn application for the worker class: the WSGI app or the asyncio app."""
+        return "async_app:app" if self.worker_class == "aiohttp" else "app:app"
+
+    @classmethod
+    def available_cores(cls):
+        """
+        Return the number of cores this process may use: those it is allowed to run on (CPU
+        affinity), further limited by a container's CPU quota (cgroup v2 or v1), if any.
+        :return: int
+        """
+        try:
+            cores = len(os.sched_getaffinity(0))
+        except AttributeError:
+            import multiprocessing
+            cores = multiprocessing.cpu_count()
+
+        quota = cls._cgroup_quota()
+        if quota:
+            cores = min(cores, max(int(math.ceil(quota)), 1))
+        return max(cores, 1)
+
+    @staticmethod
+    def _cgroup_quota():
+        # cgroup v2: "<quota> <period>" (or "max <period>"); v1: separate quota and period files.
+        try:
+            with open("/sys/fs/cgroup/cpu.max") as f:
+                quota, period = f.read().split()[:2]
+            return None if quota == "max" else float(quota) / float(period)
+        except (IOError, OSError, ValueError):
+            pass
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = float(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = float(f.read())
+            return quota / period if quota > 0 and period > 0 else None
+        except (IOError, OSError, ValueError):
+            return None
+
+    def describe(self):
+        return "{} worker(s) of class {}{} on {} core(s){}".format(
+            self.workers, self.worker_class,
+            " with {} thread(s) each".format(self.threads) if self.worker_class == "gthread" else "",
+            self.cores, ", app preloaded" if self.preload else "")
@@ -1,7 +1,20 @@
 from __future__ import print_function
 
-from InitializationPackage import app
+from InitializationPackage import create_app, start
+from Controller.BatchWebhook import BatchWebhook
 from Controller.Webhook import Webhook
+from Controller.MetricsView import MetricsView
+from Controller.WarmupView import WarmupView
+from Utilities.ActionRegistry import ActionRegistry
+from Utilities.Settings import Settings
+
+
+# Configure the Flask app (once per process; see InitializationPackage).
+app = create_app()
+
+# Discover the action classes in the Controller package once, at startup,
+# so each webhook resolves its action with a dictionary lookup.
+ActionRegistry.default()
 
 
 # Create a view based on Controller.Webhook that
@@ -14,13 +27,45 @@ app.add_url_rule(
     methods=["POST"]
 )
 
+# Bots and offline evaluation jobs can POST an array of webhook requests to
+# /batch and get the array of their responses back (see
+# Controller.BatchWebhook).
+app.add_url_rule(
+    rule='/batch',
+    view_func=BatchWebhook.as_view('batch'),
+    methods=["POST"]
+)
+
+# Metrics (in the Prometheus text format) are served on a separate route,
+# /metrics, which supports GET only.
+app.add_url_rule(
+    rule='/metrics',
+    view_func=MetricsView.as_view('metrics'),
+    methods=["GET"]
+)
+
+# App Engine sends GET /_ah/warmup to a new instance before routing traffic
+# to it; elsewhere, set WARMUP to prime the pools and caches as the process
+# starts.
+app.add_url_rule(
+    rule='/_ah/warmup',
+    view_func=WarmupView.as_view('warmup'),
+    methods=["GET"]
+)
+
+# Start this process's background work: the CONFIG_FILE watch, the game pool
+# (if GAME_POOL_SIZES is set) and the warmup (if WARMUP is set). When server.py
+# preloads the app, this is done in each worker after fork instead.
+start()
+
 
 # If the application is being run standalone, i.e.
 # python app.py, then this section of code runs
-# Flask's built-in server.
+# Flask's built-in server, for development. In
+# production, run python server.py.
 if __name__ == "__main__":
     app.run(
-        host=app.config["AGENT_HOST"],
-        port=int(app.config["AGENT_PORT"]),
-        debug=app.config["AGENT_DEBUG"]
+        host=Settings.current().agent_host,
+        port=Settings.current().agent_port,
+        debug=Settings.current().agent_debug
     )
@@ -0,0 +1,52 @@
+from aiohttp import web
+
+from InitializationPackage import create_app as create_flask_app, start
+from Controller.Async.BatchWebhook import BatchWebhook
+from Controller.Async.Webhook import Webhook
+from Utilities.AsyncHttpClient import AsyncHttpClient
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+
+
+# The asyncio entry point. It serves the same webhook (POST /, and batches at
+# POST /batch) and returns the same JSON as app.py, but awaits the game
+# server rather than blocking a worker, so one process can hold many
+# in-flight webhook calls. Configuration
+# is read by create_app (see InitializationPackage), exactly as for app.py. Run it with
+#
+#   gunicorn async_app:app --worker-class aiohttp.GunicornWebWorker
+#
+# or standalone with python async_app.py (Python 3.5+ and aiohttp required).
+async def metrics(request):
+    return web.Response(body=Metrics.render().encode("utf-8"), headers={
+        "Content-Type": "text/plain; version=0.0.4"
+    })
+
+
+def create_app():
+    # Configure the Flask app (once per process; see InitializationPackage).
+    create_flask_app()
+    webhook = Webhook()
+
+    # Start this process's background work, as app.py does. The warmup (if
+    # WARMUP is set) runs before the event loop starts serving, so its
+    # blocking calls hold no one up.
+    start()
+
+    application = web.Application()
+    application.router.add_post("/", webhook.post)
+    application.router.add_post("/batch", BatchWebhook(webhook=webhook).post)
+    application.router.add_get("/metrics", metrics)
+    application.on_cleanup.append(AsyncHttpClient.close)
+    return application
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    web.run_app(
+        app,
+        host=Settings.current().agent_host,
+        port=Settings.current().agent_port
+    )
@@ -0,0 +1,105 @@
+from __future__ import print_function
+
+import os
+import sys
+import threading
+
+import InitializationPackage
+from Utilities.LogPipeline import LogPipeline
+from Utilities.Metrics import Metrics
+from Utilities.Settings import Settings
+from Utilities.WorkerSizing import WorkerSizing
+
+
+# The production entry point. It runs the agent under gunicorn, sized from
+# the cores available and the expected wait for the game server (see
+# Utilities.WorkerSizing and the SERVER_* settings):
+#
+#   python server.py
+#
+# This module is also a gunicorn configuration file, so the same settings
+# apply when gunicorn is run directly:
+#
+#   gunicorn -c server.py app:app
+#
+# Worker classes (SERVER_WORKER_CLASS):
+#
+#   gthread (default) - threads in each worker. Helpers and the actions keep
+#       no per-request state outside the request (one instance of each
+#       action serves every request); the pooled session, caches, pools,
+#       stores, breakers and metrics are shared under locks; the deadline
+#       and response language are per thread (or task). So the agent is
+#       safe to run threaded.
+#   sync - one request per worker process.
+#   gevent - cooperative (gevent must be installed). The app is not
+#       preloaded, as gevent must patch the standard library before the
+#       app's modules (and their locks) are created.
+#   aiohttp - runs async_app:app (see async_app.py).
+#
+# Otherwise the app is preloaded: imported once, before the workers are
+# forked, so they share its memory copy-on-write. No background threads run
+# in the process which forks: the log listener, started when the
+# configuration is logged, is stopped before each fork (pre_fork), and each
+# worker starts its own background threads (post_fork).
+# The Flask debugger is never used; AGENT_DEBUG applies to python app.py only.
+
+InitializationPackage.create_app()
+# The embedded game engine's memory store is private to a process, so a game
+# is only found by the worker which started it: serve it from one worker.
+single_process = Settings.current().cowbull_engine == "embedded" and \
+    Settings.current().cowbull_store == "memory"
+sizing = WorkerSizing(
+    worker_class=Settings.current().server_worker_class,
+    workers=1 if single_process else Settings.current().server_workers,
+    threads=Settings.current().server_threads,
+    upstream_wait=Settings.current().server_upstream_wait,
+    request_cpu=Settings.current().server_request_cpu
+)
+
+bind = "{}:{}".format(Settings.current().agent_host, Settings.current().agent_port)
+worker_class = sizing.gunicorn_worker_class
+workers = sizing.workers
+threads = sizing.threads
+preload_app = sizing.preload
+
+if preload_app:
+    InitializationPackage.defer_start()
+
+    # The game server client is otherwise imported on first use (see
+    # Utilities.HttpClient); importing it here lets the workers share it.
+    import requests  # noqa: F401
+
+    # A thread running at a fork may hold a lock (e.g. the logging queue's)
+    # which the worker then inherits held.
+    LogPipeline.stop()
+    if threading.active_count() != 1:
+        raise RuntimeError("Threads are running in the process which forks the workers: {}".format(
+            ", ".join(t.name for t in threading.enumerate())))
+
+
+def pre_fork(server, worker):
+    # Anything the arbiter logged since the app was loaded restarted the log
+    # listener; it is stopped again (writing what is queued) before the fork.
+    if preload_app:
+        LogPipeline.stop()
+
+
+def post_fork(server, worker):
+    InitializationPackage.start()
+
+
+def child_exit(server, worker):
+    # The worker's metrics snapshot (see Utilities.Metrics) would otherwise be merged into
+    # every scrape after the worker has gone.
+    Metrics.discard(worker.pid)
+
+
+def when_ready(server):
+    server.log.info("Cowbull agent: %s", sizing.describe())
+
+
+if __name__ == "__main__":
+    from gunicorn.app.wsgiapp import run
+
+    sys.argv = [sys.argv[0], "-c", os.path.abspath(__file__)] + sys.argv[1:] + [sizing.app_module]
+    run()